@@ -0,0 +1,71 @@
+"""
+Per-token cost of ASCII folding (utils.text_utils._getLnrm) with the original NFD implementation, the translation
+table alone, and the table behind the memo cache. Checks that all three agree on the tokens and on random strings
+mixing letters, combining marks and other scripts.
+
+Usage:
+    python -m benchmarks.bench_ascii_fold --links trwiki/surface_links
+    python -m benchmarks.bench_ascii_fold --synthetic 500000
+"""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from utils.text_utils import _FOLD_TABLE, _getLnrm, _getLnrm_nfd
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+_ALPHABET = "abcçdefgğhıijklmnoöprsştuüvyzABCÇDEFGĞHIİJKLMNOÖPRSŞTUÜVYZ0123456789-'.()" \
+            "áéíóúñàèâêîôûäëïÿåæøœßþðÁÉÍÓÚÑ" "αβγδεζΣσςΩ" "абвгдеёжзий" "中文漢字" "ǅǈǋﬁﬂ①Ⅻ" \
+            "̸̣́̇̈"
+
+
+def read_tokens(links, limit):
+    tokens = []
+    for line in open(links):
+        parts = line.rstrip("\n").split("\t")
+        tokens += parts[0].lower().split(" ")
+        if len(tokens) >= limit:
+            break
+    return tokens[:limit]
+
+
+def make_synthetic_tokens(num_tokens):
+    # zipfian, so the memo cache sees repeats as in real surfaces
+    rng = random.Random(0)
+    vocab = ["".join(rng.choice(_ALPHABET) for _ in range(rng.randint(1, 12))) for _ in range(num_tokens // 10 + 1)]
+    return [vocab[int(rng.paretovariate(1.0)) % len(vocab)] for _ in range(num_tokens)]
+
+
+def bench(name, fold, tokens):
+    start = time.time()
+    ans = [fold(token) for token in tokens]
+    secs = time.time() - start
+    logging.info("%-10s %8.3f usec/token", name, secs / len(tokens) * 1e6)
+    return ans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark ASCII folding of surface tokens.')
+    parser.add_argument('--links', type=str, help='surface --> link file (eg. trwiki/surface_links)')
+    parser.add_argument('--synthetic', type=int, default=500000, help='number of generated tokens')
+    args = parser.parse_args()
+    args = vars(args)
+    tokens = read_tokens(args["links"], args["synthetic"]) if args["links"] else make_synthetic_tokens(
+        args["synthetic"])
+    logging.info("%d tokens, %d distinct", len(tokens), len(set(tokens)))
+
+    nfd = bench("nfd", _getLnrm_nfd, tokens)
+    table = bench("table", lambda token: token.translate(_FOLD_TABLE), tokens)
+    cached = bench("cached", _getLnrm, tokens)
+    logging.info("cache %s", _getLnrm.cache_info())
+
+    rng = random.Random(1)
+    random_strings = ["".join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 20))) for _ in range(100000)]
+    mismatches = sum(1 for a, b, c in zip(nfd, table, cached) if not a == b == c)
+    mismatches += sum(1 for s in random_strings if _getLnrm(s) != _getLnrm_nfd(s))
+    logging.info("mismatches: %d", mismatches)
+    if mismatches:
+        sys.exit(1)
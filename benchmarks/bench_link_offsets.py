@@ -0,0 +1,91 @@
+"""
+Checks the link spans of dp.extract_link_from_pages.extract_page on a set of tricky docs (tags whose strings
+doc.get_text() leaves out, such as <style> and <script>, nested tags, comments), then reports pages/sec and offset
+mismatches of extract_page on a wikiextractor file or on generated docs. Exits 1 if any span is off.
+
+Usage:
+    python -m benchmarks.bench_link_offsets --wikifile trwiki_with_links/AA/wiki_00
+    python -m benchmarks.bench_link_offsets --synthetic 2000
+"""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from dp.extract_link_from_pages import extract_page, iter_doc_blocks
+from dp.title_normalizer import TitleNormalizer
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+# bodies of docs, and the text of each link extract_page should locate
+_CASES = [('before <style>.a{color:red}</style> mid <a href="Linux">Linux</a> end', ["Linux"]),
+          ('<script>var x = 1;</script> <a href="Linux">Linux</a> and <a href="MHP">MHP</a>', ["Linux", "MHP"]),
+          ('<a href="Linux">Linux</a> <template>hidden</template> <a href="MHP">MHP</a>', ["Linux", "MHP"]),
+          ('<div>d<style>q</style></div> <!-- note --> <a href="Linux">Linux</a>', ["Linux"]),
+          ('<b>bold</b> <a href="Linux">Linux</a> <a href="MHP"><b>nested</b></a> <a href="MHP">MHP</a>',
+           ["Linux", "MHP"])]
+
+
+def make_doc(page_id, body):
+    return '<doc id="%d" url="https://tr.wikipedia.org/wiki?curid=%d" title="Sayfa %d">\nSayfa %d\n\n%s\n</doc>\n' % (
+        page_id, page_id, page_id, page_id, body)
+
+
+def docs_of(text):
+    for block in iter_doc_blocks(text.splitlines(keepends=True)):
+        for doc in BeautifulSoup(block, "html.parser").find_all("doc"):
+            yield doc
+
+
+def check_cases(normalizer):
+    """
+    Returns the number of cases with a missing or misplaced link, logging them.
+    """
+    failed = 0
+    for idx, (body, expected) in enumerate(_CASES):
+        for doc in docs_of(make_doc(idx, body)):
+            stats = {}
+            page = extract_page(doc, "case %d" % idx, normalizer, False, stats)
+            found = [page["text"][span["start"]:span["end"]] for span in page["linked_spans"]]
+            if found != expected or stats.get("mismatches", 0):
+                failed += 1
+                logging.info("case %d: found %s, expected %s (%d mismatches)", idx, found, expected,
+                             stats.get("mismatches", 0))
+    logging.info("%d of %d cases located every link", len(_CASES) - failed, len(_CASES))
+    return failed
+
+
+def make_synthetic_text(num_pages):
+    rng = random.Random(0)
+    pieces = [body for body, _ in _CASES] + ["kelime"] * 20
+    return "".join(make_doc(page, " ".join(rng.choice(pieces) for _ in range(rng.randint(5, 50))))
+                   for page in range(num_pages))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check and time the link spans of extract_page.')
+    parser.add_argument('--wikifile', type=str, help='one file of the wikiextractor output')
+    parser.add_argument('--synthetic', type=int, default=2000, help='number of generated docs')
+    args = parser.parse_args()
+    args = vars(args)
+    normalizer = TitleNormalizer(redirect_map={"MHP": "Milliyetçi_Hareket_Partisi"},
+                                 t2id={"Linux": "24", "Milliyetçi_Hareket_Partisi": "26"})
+    failed = check_cases(normalizer)
+    if args["wikifile"] is not None:
+        with open(args["wikifile"], encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = make_synthetic_text(args["synthetic"])
+    start = time.time()
+    stats, pages = {}, 0
+    for doc in docs_of(text):
+        extract_page(doc, args["wikifile"], normalizer, False, stats)
+        pages += 1
+    secs = time.time() - start
+    logging.info("%d pages, %d links, %d offset mismatches in %.2f secs: %.0f pages/sec", pages,
+                 stats.get("links", 0), stats.get("mismatches", 0), secs, pages / max(secs, 1e-9))
+    if failed or stats.get("mismatches", 0):
+        sys.exit(1)
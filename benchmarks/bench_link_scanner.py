@@ -0,0 +1,97 @@
+"""
+Runs EntityCounter over a WikiExtractor corpus with the bs4 and the scanner parsers, reports pages/sec for both and
+whether surface_links and .counts are identical (tests/test_link_scanner.py checks this on the fixture corpus).
+
+Usage:
+    python -m benchmarks.bench_link_scanner --wikitext trwiki_with_links --id2t trwiki-20190501.id2t \
+        --redirects trwiki-20190501.r2t
+    python -m benchmarks.bench_link_scanner --synthetic 2000
+"""
+import argparse
+import filecmp
+import logging
+import os
+import random
+import tempfile
+import time
+
+from dp.count_popular_entities_v2 import EntityCounter
+from processors.basic_page_processor import PARSERS
+from utils.misc_utils import load_id2title, load_redirects
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+# anchors exercising quoting, entities, fragments, nested tags and missing hrefs
+_ANCHORS = ['<a href="Cengiz%20Han">Cengiz Han</a>',
+            '<a href="linux">Linux</a>',
+            '<a href="MHP#Tarihçe">Milliyetçi &amp; Hareket</a>',
+            '<a href="Film%20(anlam%20ayr%C4%B1m%C4%B1)">film</a>',
+            '<a href="Mustafa Suphi">Mustafa <b>Suphi</b></a>',
+            '<a href="O&#39;Brien">O\'Brien</a>',
+            '<a href="Yok">missing</a>',
+            '<a>no href</a>',
+            '<a href="Linux">never closed']
+
+def make_synthetic_corpus(outdir, num_pages, pages_per_file=100):
+    rng = random.Random(0)
+    wikitext = os.path.join(outdir, "wiki_with_links")
+    for page in range(num_pages):
+        file_idx = page // pages_per_file
+        subdir = os.path.join(wikitext, "A%s" % chr(ord("A") + file_idx // 100))
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, "wiki_%02d" % (file_idx % 100)), "a") as out:
+            out.write('<doc id="%d" url="https://tr.wikipedia.org/wiki?curid=%d" title="Sayfa %d &amp; co">\n'
+                      % (page, page, page))
+            out.write("Sayfa %d &amp; co\n\n" % page)
+            for _ in range(rng.randint(1, 20)):
+                words = ["kelime"] * rng.randint(3, 30)
+                words[rng.randrange(len(words))] = rng.choice(_ANCHORS)
+                out.write(" ".join(words) + ".\n")
+            out.write("</doc>\n")
+    id2t = os.path.join(outdir, "synthetic.id2t")
+    with open(id2t, "w") as out:
+        out.write("10\tCengiz_Han\t0\n16\tFilm_(anlam_ayrımı)\t0\n22\tMustafa_Suphi\t0\n24\tLinux\t0\n25\tMHP\t1\n"
+                  "26\tMilliyetçi_Hareket_Partisi\t0\n27\tO'Brien\t0\n")
+    redirects = os.path.join(outdir, "synthetic.r2t")
+    with open(redirects, "w") as out:
+        out.write("MHP\tMilliyetçi_Hareket_Partisi\n")
+    return wikitext, id2t, redirects
+
+
+def run(parser, wikitext, redirect_map, t2id, outdir):
+    linksout = os.path.join(outdir, "surface_links." + parser)
+    contsout = os.path.join(outdir, "counts." + parser)
+    counter = EntityCounter(wikipath=wikitext, linksout=linksout, contsout=contsout, redirect_map=redirect_map,
+                            t2id=t2id, limit=0, parser=parser)
+    pages = [0]
+    process_wikicontent = counter.process_wikicontent
+
+    def counting(page_content, page_id, page_title):
+        pages[0] += 1
+        process_wikicontent(page_content, page_id, page_title)
+
+    counter.process_wikicontent = counting
+    start = time.time()
+    counter.run()
+    secs = time.time() - start
+    logging.info("%-8s %d pages in %.2f secs: %.0f pages/sec", parser, pages[0], secs, pages[0] / max(secs, 1e-9))
+    return linksout, contsout
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the bs4 and scanner link parsers.')
+    parser.add_argument('--wikitext', type=str, help='folder generated by wikiextractor')
+    parser.add_argument('--id2t', type=str, help='id --> title')
+    parser.add_argument('--redirects', type=str, help='redirect --> title')
+    parser.add_argument('--synthetic', type=int, default=2000, help='number of pages of a generated corpus')
+    args = parser.parse_args()
+    args = vars(args)
+    outdir = tempfile.mkdtemp()
+    wikitext, id2t, redirects = args["wikitext"], args["id2t"], args["redirects"]
+    if wikitext is None:
+        wikitext, id2t, redirects = make_synthetic_corpus(outdir, args["synthetic"])
+    redirect_map = load_redirects(redirects)
+    _, t2id, _ = load_id2title(id2t)
+    outputs = [run(p, wikitext, redirect_map, t2id, outdir) for p in PARSERS]
+    same = all(filecmp.cmp(a, b, shallow=False) for a, b in zip(outputs[0], outputs[1]))
+    logging.info("surface_links and counts identical: %s", same)
@@ -0,0 +1,93 @@
+"""
+Links/sec of the token alignment of dp.create_mid: the old scan of every token with check_if_tok_match_link against
+token_offsets + align_link, and checks that both pick the same token range for every link.
+
+Pages come from a page file of dp.extract_link_from_pages, or are generated long articles. They are tokenized with
+spaCy when it is installed (--lang), with a regex standing in for it otherwise.
+
+Usage:
+    python -m benchmarks.bench_mid_alignment --pages trwiki/link_in_pages/AA/wiki_00.jsonl.gz --lang tr
+    python -m benchmarks.bench_mid_alignment --synthetic 200 --words 20000
+"""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from dp.create_mid import RegexTokenizer, align_link, check_if_tok_match_link, get_tokenizer, token_offsets
+from utils.page_json import iter_page_file
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def make_synthetic_pages(num_pages, num_words):
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(1, 10))) for _ in range(5000)]
+    pages = []
+    for _ in range(num_pages):
+        text, links, pos = [], [], 0
+        for k in range(num_words):
+            word = rng.choice(words) + rng.choice(["", "", "", ",", "."])
+            if k % 25 == 0:
+                # links every 25 words, some of them starting or ending inside a token
+                start = pos + rng.choice([0, 0, 0, 1])
+                links.append({'start': start, 'end': pos + len(word), 'label': word})
+            text.append(word)
+            pos += len(word) + 1
+        pages.append({'text': " ".join(text), 'linked_spans': links})
+    return pages
+
+
+def scan(doc, links):
+    ans = []
+    for link in links:
+        matched_toks = [tok for tok in doc if check_if_tok_match_link(link, tok)]
+        ans.append((matched_toks[0].i, matched_toks[-1].i) if matched_toks else None)
+    return ans
+
+
+def bisect_align(doc, links):
+    ans = []
+    starts, ends = token_offsets(doc)
+    for link in links:
+        span = align_link(starts, ends, link)
+        ans.append((doc[span[0]].i, doc[span[1]].i) if span is not None else None)
+    return ans
+
+
+def bench(name, align, docs, pages, num_links):
+    start = time.time()
+    ans = [align(doc, page['linked_spans']) for doc, page in zip(docs, pages)]
+    secs = time.time() - start
+    logging.info("%-6s %10.0f links/sec %8.1f articles/sec", name, num_links / secs, len(pages) / secs)
+    return ans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the token alignment of create_mid.')
+    parser.add_argument('--pages', type=str, help='page file from extract_link_from_pages')
+    parser.add_argument('--lang', type=str, default="en", help='spacy tokenizer language')
+    parser.add_argument('--synthetic', type=int, default=100, help='number of generated articles')
+    parser.add_argument('--words', type=int, default=10000, help='words per generated article')
+    args = parser.parse_args()
+    args = vars(args)
+    if args["pages"]:
+        pages = [page for page in iter_page_file(args["pages"]) if 'linked_spans' in page]
+    else:
+        pages = make_synthetic_pages(args["synthetic"], args["words"])
+    try:
+        tokenizer = get_tokenizer(args["lang"])
+    except ImportError:
+        logging.info("spacy is not installed, tokenizing with a regex")
+        tokenizer = RegexTokenizer()
+    docs = [tokenizer(page['text']) for page in pages]
+    num_links = sum(len(page['linked_spans']) for page in pages)
+    logging.info("%d articles, %d tokens, %d links", len(pages), sum(len(doc) for doc in docs), num_links)
+
+    old = bench("scan", scan, docs, pages, num_links)
+    new = bench("bisect", bisect_align, docs, pages, num_links)
+    mismatches = sum(1 for a, b in zip(old, new) for x, y in zip(a, b) if x != y)
+    logging.info("mismatches: %d", mismatches)
+    if mismatches:
+        sys.exit(1)
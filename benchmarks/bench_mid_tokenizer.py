@@ -0,0 +1,55 @@
+"""
+Articles/sec of the create_mid tokenizer backends: spacy called once per article (the old way), spacy through
+Tokenizer.pipe at each --batch_sizes, and the regex tokenizer. spacy runs are skipped when it is not installed.
+
+Usage:
+    python -m benchmarks.bench_mid_tokenizer --pages trwiki/link_in_pages/AA/wiki_00.jsonl.gz --lang tr
+    python -m benchmarks.bench_mid_tokenizer --synthetic 2000 --words 1000
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.bench_mid_alignment import make_synthetic_pages
+from dp.create_mid import get_tokenizer, iter_tokenized
+from utils.page_json import iter_page_file
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def bench(name, tokenize, pages):
+    start = time.time()
+    num_tokens = sum(len(doc) for doc in tokenize(pages))
+    secs = time.time() - start
+    logging.info("%-16s %10.1f articles/sec %12.0f tokens/sec", name, len(pages) / secs, num_tokens / secs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the tokenizer backends of create_mid.')
+    parser.add_argument('--pages', type=str, help='page file from extract_link_from_pages')
+    parser.add_argument('--lang', type=str, default="en", help='spacy tokenizer language')
+    parser.add_argument('--synthetic', type=int, default=2000, help='number of generated articles')
+    parser.add_argument('--words', type=int, default=1000, help='words per generated article')
+    parser.add_argument('--batch_sizes', type=str, default="1,100,1000", help='comma separated pipe batch sizes')
+    args = parser.parse_args()
+    args = vars(args)
+    if args["pages"]:
+        pages = [page for page in iter_page_file(args["pages"]) if 'linked_spans' in page]
+    else:
+        pages = make_synthetic_pages(args["synthetic"], args["words"])
+    logging.info("%d articles", len(pages))
+    batch_sizes = [int(b) for b in args["batch_sizes"].split(",")]
+
+    backends = ["regex"]
+    try:
+        get_tokenizer(args["lang"])
+        backends.insert(0, "spacy")
+    except ImportError:
+        logging.info("spacy is not installed, only the regex tokenizer is measured")
+    for backend in backends:
+        tokenizer = get_tokenizer(args["lang"], backend)
+        if backend == "spacy":
+            bench("spacy per text", lambda ps: (tokenizer(page['text']) for page in ps), pages)
+        for batch_size in batch_sizes:
+            bench("%s pipe %d" % (backend, batch_size),
+                  lambda ps: (doc for _, doc in iter_tokenized(ps, tokenizer, batch_size)), pages)
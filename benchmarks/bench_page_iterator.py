@@ -0,0 +1,87 @@
+"""
+Benchmarks pages/sec of processors.page_iterator.iter_pages against the old line by line page assembly
+(page_content += line, one BeautifulSoup per <doc> header), and checks that both yield the same pages.
+
+Usage:
+    python -m benchmarks.bench_page_iterator --shard trwiki_with_links/AA/wiki_00
+    python -m benchmarks.bench_page_iterator --synthetic 200
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+from processors.page_iterator import iter_pages
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def legacy_pages(f_handle):
+    """
+    The page assembly BasicPageProcessor.process_file used before iter_pages.
+    """
+    pages = []
+    page_content = ""
+    new_page = False
+    page_id, page_title = None, None
+    for line in f_handle:
+        if line.startswith("<doc id="):
+            new_page = True
+            if page_content:
+                pages.append((page_id, page_title, page_content))
+            page_content = ""
+            soup = BeautifulSoup(line, "html.parser")
+            doc = soup.find("doc")
+            page_id = doc["id"]
+            page_title = doc["title"].replace(" ", "_")
+        else:
+            if new_page:
+                new_page = False
+                continue  # do not add this line as it contains title
+            page_content += line
+    if page_content:
+        pages.append((page_id, page_title, page_content))
+    return pages
+
+
+def make_synthetic_shard(path, num_pages, max_lines=2000):
+    """
+    A wikiextractor file whose pages range from stubs to very long articles.
+    """
+    rng = random.Random(0)
+    with open(path, "w") as out:
+        for page in range(num_pages):
+            out.write('<doc id="%d" url="https://tr.wikipedia.org/wiki?curid=%d" title="Sayfa %d">\n'
+                      % (page, page, page))
+            out.write("Sayfa %d\n\n" % page)
+            for _ in range(rng.randint(1, max_lines)):
+                out.write("bir iki <a href=\"Linux\">Linux</a> üç dört beş altı yedi sekiz dokuz on.\n")
+            out.write("</doc>\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark wikiextractor page assembly.')
+    parser.add_argument('--shard', type=str, help='one wikiextractor output file, eg. AA/wiki_00')
+    parser.add_argument('--synthetic', type=int, default=200, help='number of pages of a generated shard')
+    args = parser.parse_args()
+    args = vars(args)
+    path = args["shard"]
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "wiki_00")
+        make_synthetic_shard(path, args["synthetic"])
+    results = []
+    for name, fn in [("legacy", legacy_pages), ("iter_pages", lambda f: list(iter_pages(f)))]:
+        start = time.time()
+        with open(path) as f:
+            pages = fn(f)
+        secs = time.time() - start
+        results.append(pages)
+        logging.info("%-10s %6d pages in %6.2f secs: %8.0f pages/sec", name, len(pages), secs,
+                     len(pages) / max(secs, 1e-9))
+    logging.info("identical pages: %s", results[0] == results[1])
+    if results[0] != results[1]:
+        sys.exit(1)
@@ -0,0 +1,94 @@
+"""
+Counts the (surface, title) pairs of a surface_links file with each compute_probs2 backend and reports wall time and
+peak RSS. Every backend runs in a fresh process so peak RSS is its own, and the written files are compared to the
+list backend.
+
+Usage:
+    python -m benchmarks.bench_pair_counts --links trwiki/surface_links
+    python -m benchmarks.bench_pair_counts --synthetic 2000000
+"""
+import argparse
+import filecmp
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from dp.pair_counts import PAIR_COUNTS, InternedPairCounts, ListPairCounts, SpillPairCounts, parse_size
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def make_synthetic_links(path, num_links):
+    # zipfian surfaces and titles, as in real anchor text
+    rng = random.Random(0)
+    surfaces = ["yüzey %d" % i for i in range(num_links // 20 + 1)]
+    titles = ["Başlık_%d" % i for i in range(num_links // 10 + 1)]
+    with open(path, "w") as out:
+        for _ in range(num_links):
+            s = surfaces[int(rng.paretovariate(1.0)) % len(surfaces)]
+            t = titles[int(rng.paretovariate(0.8)) % len(titles)]
+            out.write("%s\t%s\n" % (s, t))
+
+
+def count(backend, links, out_prefix, max_memory, queue):
+    start = time.time()
+    if backend == "list":
+        pairs = ListPairCounts()
+    elif backend == "interned":
+        pairs = InternedPairCounts()
+    else:
+        pairs = SpillPairCounts(max_memory=max_memory, spill_dir=os.path.dirname(out_prefix))
+    for line in open(links):
+        parts = line.strip().split("\t")
+        if len(parts) < 2:
+            continue
+        pairs.add(parts[0].lower(), parts[1])
+    paths = [out_prefix + ".p2t2prob", out_prefix + ".t2p2prob"]
+    pairs.write(*paths)
+    pairs.close()
+    # ru_maxrss is in KB on linux
+    queue.put((time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, paths))
+
+
+def same_lines(a, b):
+    return subprocess.call("cmp -s <(sort '%s') <(sort '%s')" % (a, b), shell=True, executable="/bin/bash") == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the pair counting backends of compute_probs2.')
+    parser.add_argument('--links', type=str, help='surface --> link file (eg. trwiki/surface_links)')
+    parser.add_argument('--synthetic', type=int, default=2000000, help='number of links of a generated file')
+    parser.add_argument('--max_memory', type=str, default="256M", help='budget of the spill backend')
+    args = parser.parse_args()
+    args = vars(args)
+    outdir = tempfile.mkdtemp()
+    links = args["links"]
+    if links is None:
+        links = os.path.join(outdir, "surface_links")
+        make_synthetic_links(links, args["synthetic"])
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for backend in PAIR_COUNTS:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=count, args=(backend, links, os.path.join(outdir, backend),
+                                               parse_size(args["max_memory"]), queue))
+        proc.start()
+        results[backend] = queue.get()
+        proc.join()
+        secs, peak_mb, _ = results[backend]
+        logging.info("%-8s %8.1f secs %8.1f MB peak rss", backend, secs, peak_mb)
+    ok = True
+    for backend in PAIR_COUNTS[1:]:
+        for a, b in zip(results["list"][2], results[backend][2]):
+            # spill groups the lines by partition, the others keep first-seen order
+            same = filecmp.cmp(a, b, shallow=False) if backend == "interned" else same_lines(a, b)
+            ok = ok and same
+            logging.info("%s %s same as list: %s", backend, os.path.basename(b), same)
+    if not ok:
+        sys.exit(1)
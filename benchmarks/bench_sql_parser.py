@@ -0,0 +1,88 @@
+"""
+Benchmarks the tuples/sec of the SqlInsertReader against the old split("),(") + split_str path.
+
+Usage:
+    python -m benchmarks.bench_sql_parser --sql trwiki-20190501-page.sql.gz
+    python -m benchmarks.bench_sql_parser --synthetic 200000
+"""
+import argparse
+import gzip
+import logging
+import os
+import tempfile
+import time
+
+from dp.dp_common import open_dump, parse_schema, split_str, SqlInsertReader
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def make_synthetic_dump(path, num_tuples, per_line=1000):
+    """
+    Writes a page.sql.gz look-alike with `num_tuples` rows, including quotes, escapes and "),(" in titles.
+    """
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        out.write("CREATE TABLE `page` (\n")
+        for field in ["page_id", "page_namespace", "page_title", "page_restrictions", "page_is_redirect",
+                      "page_is_new", "page_random", "page_touched", "page_links_updated", "page_latest", "page_len",
+                      "page_content_model", "page_lang"]:
+            out.write("  `%s` varbinary(255) NOT NULL,\n" % field)
+        out.write("  PRIMARY KEY (`page_id`),\n);\n")
+        titles = ["Cengiz_Han", "Film_(anlam_ayrımı)", "O\\'Brien", "A),(B", "Mustafa_Suphi", "Linux"]
+        for start in range(0, num_tuples, per_line):
+            rows = ["(%d,%d,'%s','',%d,0,0.%d,'20190501123456','20190430010203',%d,%d,'wikitext',NULL)"
+                    % (i, i % 3, titles[i % len(titles)], i % 2, i * 7919, 20000000 + i, i % 50000)
+                    for i in range(start, min(start + per_line, num_tuples))]
+            out.write("INSERT INTO `page` VALUES " + ",".join(rows) + ";\n")
+
+
+def bench_split_str(filename):
+    n = 0
+    with open_dump(filename, "rt", encoding="utf-8") as f:
+        for line in f:
+            if "INSERT INTO" not in line:
+                continue
+            line = line[line.index("(") + 1:]
+            for part in line.split("),("):
+                try:
+                    split_str(',', part)
+                except IndexError:
+                    # a split inside a quoted "),(" leaves an unterminated quote
+                    pass
+                n += 1
+    return n
+
+
+def bench_reader(filename):
+    n = 0
+    for _ in SqlInsertReader(filename):
+        n += 1
+    return n
+
+
+def bench_reader_schema(filename):
+    schema = parse_schema(filename, "utf-8")
+    columns = [schema['page_id'], schema['page_namespace'], schema['page_title'], schema['page_is_redirect']]
+    n = 0
+    for _ in SqlInsertReader(filename, columns=columns, width=len(schema)):
+        n += 1
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark mysql dump tuple parsing.')
+    parser.add_argument('--sql', type=str, help='path to a *.sql.gz dump')
+    parser.add_argument('--synthetic', type=int, default=200000, help='number of rows of a generated dump')
+    args = parser.parse_args()
+    args = vars(args)
+    path = args["sql"]
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "synthetic-page.sql.gz")
+        make_synthetic_dump(path, args["synthetic"])
+    for name, fn in [("split_str", bench_split_str),
+                     ("SqlInsertReader", bench_reader),
+                     ("SqlInsertReader(schema)", bench_reader_schema)]:
+        start = time.time()
+        n = fn(path)
+        secs = time.time() - start
+        logging.info("%-25s %10d tuples in %6.2f secs: %10.0f tuples/sec", name, n, secs, n / max(secs, 1e-9))
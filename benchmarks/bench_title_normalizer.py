@@ -0,0 +1,121 @@
+"""
+Benchmarks TitleNormalizer.normalize() calls/sec and resident memory with the dict and the sorted array backends.
+
+Usage:
+    python -m benchmarks.bench_title_normalizer --id2t trwiki-20190501.id2t --redirects trwiki-20190501.r2t
+    python -m benchmarks.bench_title_normalizer --synthetic 500000
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from dp.title_normalizer import TitleNormalizer
+from utils.title_lookup import DictLookup, SortedArrayLookup, lookup_path, write_sorted_lookup
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def rss_mb():
+    """
+    Private (unshared) resident memory, mmapped file pages shared with other processes are not counted.
+    """
+    import psutil
+    return psutil.Process(os.getpid()).memory_full_info().uss / 2 ** 20
+
+
+def read_maps(id2t_path, redirects_path):
+    t2id, redirect_map = {}, {}
+    for line in open(id2t_path):
+        parts = line.strip().split("\t")
+        if len(parts) == 3:
+            t2id[parts[1]] = parts[0]
+    for line in open(redirects_path):
+        parts = line.strip().split("\t")
+        if len(parts) == 2:
+            redirect_map[parts[0]] = parts[1]
+    return t2id, redirect_map
+
+
+def make_synthetic_maps(outdir, num_titles):
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyzçğıöşü") for _ in range(rng.randint(3, 10)))
+             for _ in range(20000)]
+    titles = set()
+    while len(titles) < num_titles:
+        titles.add("_".join(w.capitalize() for w in rng.sample(words, rng.randint(1, 3))))
+    titles = sorted(titles)
+    id2t_path, redirects_path = os.path.join(outdir, "synthetic.id2t"), os.path.join(outdir, "synthetic.r2t")
+    with open(id2t_path, "w") as out:
+        for idx, title in enumerate(titles):
+            out.write("%d\t%s\t0\n" % (idx, title))
+    with open(redirects_path, "w") as out:
+        for title in rng.sample(titles, num_titles // 2):
+            out.write("%s_(redirect)\t%s\n" % (title, title))
+    return id2t_path, redirects_path
+
+
+def make_queries(t2id, redirect_map, num_queries):
+    """
+    A mix of exact titles, redirects, titles that need the capitalization fallback, and misses.
+    """
+    rng = random.Random(1)
+    titles, redirects = list(t2id), list(redirect_map)
+    queries = []
+    for i in range(num_queries):
+        kind = i % 4
+        if kind == 0:
+            queries.append(rng.choice(titles))
+        elif kind == 1:
+            queries.append(rng.choice(redirects))
+        elif kind == 2:
+            queries.append(rng.choice(titles).lower())
+        else:
+            queries.append(rng.choice(titles) + "_missing")
+    return queries
+
+
+def bench(normalizer, queries):
+    start = time.time()
+    ans = [normalizer.normalize(q) for q in queries]
+    secs = time.time() - start
+    return ans, len(queries) / max(secs, 1e-9)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark TitleNormalizer backends.')
+    parser.add_argument('--id2t', type=str, help='id --> title')
+    parser.add_argument('--redirects', type=str, help='redirect --> title')
+    parser.add_argument('--synthetic', type=int, default=500000, help='number of titles of generated maps')
+    parser.add_argument('--queries', type=int, default=200000, help='number of normalize() calls')
+    args = parser.parse_args()
+    args = vars(args)
+    id2t_path, redirects_path = args["id2t"], args["redirects"]
+    if id2t_path is None:
+        id2t_path, redirects_path = make_synthetic_maps(tempfile.mkdtemp(), args["synthetic"])
+    t2id, redirect_map = read_maps(id2t_path, redirects_path)
+    queries = make_queries(t2id, redirect_map, args["queries"])
+    path = lookup_path(redirects_path)
+    if not os.path.exists(path):
+        write_sorted_lookup(path, redirect_map, t2id)
+    del t2id, redirect_map
+
+    base = rss_mb()
+    sorted_nrm = TitleNormalizer(lookup=SortedArrayLookup(path))
+    sorted_ans, sorted_rate = bench(sorted_nrm, queries)
+    sorted_rss = rss_mb() - base
+
+    base = rss_mb()
+    t2id, redirect_map = read_maps(id2t_path, redirects_path)
+    dict_nrm = TitleNormalizer(redirect_map=redirect_map, t2id=t2id, lookup=DictLookup(redirect_map, t2id))
+    dict_ans, dict_rate = bench(dict_nrm, queries)
+    dict_rss = rss_mb() - base
+
+    if sorted_ans != dict_ans:
+        logging.info("WARNING: backends disagree on %d queries",
+                     sum(1 for a, b in zip(sorted_ans, dict_ans) if a != b))
+    logging.info("dict   backend: %10.0f normalize/sec, +%7.1f MB private rss", dict_rate, dict_rss)
+    logging.info("sorted backend: %10.0f normalize/sec, +%7.1f MB private rss (file %.1f MB, page cache)",
+                 sorted_rate, sorted_rss, os.path.getsize(path) / 2 ** 20)
@@ -0,0 +1,94 @@
+"""
+Aggregate memory of N worker processes normalizing titles with the dict and the sorted (mmapped) lookup backends.
+
+Every worker gets the parent's TitleNormalizer (inherited on fork, pickled on spawn), runs the same normalize() calls
+and waits. Proportional set size (PSS) of the parent and of all workers is then summed, shared pages being divided
+among the processes that map them, so the total is the memory actually used. With the sorted backend the total
+should barely grow with the number of workers.
+
+Usage:
+    python -m benchmarks.bench_worker_memory --id2t trwiki-20190501.id2t --redirects trwiki-20190501.r2t --workers 4
+    python -m benchmarks.bench_worker_memory --synthetic 500000 --start_method spawn
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+
+from benchmarks.bench_title_normalizer import make_queries, make_synthetic_maps, read_maps
+from dp.title_normalizer import TitleNormalizer
+from utils.title_lookup import DictLookup, SortedArrayLookup, lookup_path, write_sorted_lookup
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+
+def prepare(id2t_path, redirects_path, num_queries):
+    t2id, redirect_map = read_maps(id2t_path, redirects_path)
+    path = lookup_path(redirects_path)
+    if not os.path.exists(path):
+        write_sorted_lookup(path, redirect_map, t2id)
+    return make_queries(t2id, redirect_map, num_queries), path
+
+
+def pss_mb(pid):
+    import psutil
+    return psutil.Process(pid).memory_full_info().pss / 2 ** 20
+
+
+def work(normalizer, queries, done, finish):
+    for q in queries:
+        normalizer.normalize(q)
+    done.put(os.getpid())
+    finish.wait()
+
+
+def measure(ctx, normalizer, queries, workers):
+    done, finish = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=work, args=(normalizer, queries, done, finish)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        done.get()
+    parent = pss_mb(os.getpid())
+    children = [pss_mb(proc.pid) for proc in procs]
+    finish.set()
+    for proc in procs:
+        proc.join()
+    return parent, children
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the memory of normalizer workers.')
+    parser.add_argument('--id2t', type=str, help='id --> title')
+    parser.add_argument('--redirects', type=str, help='redirect --> title')
+    parser.add_argument('--synthetic', type=int, default=500000, help='number of titles of generated maps')
+    parser.add_argument('--queries', type=int, default=200000, help='number of normalize() calls per worker')
+    parser.add_argument('--workers', type=int, default=4, help='number of workers to compare with 1')
+    parser.add_argument('--start_method', type=str, default="fork", choices=["fork", "spawn", "forkserver"])
+    args = parser.parse_args()
+    args = vars(args)
+    id2t_path, redirects_path = args["id2t"], args["redirects"]
+    if id2t_path is None:
+        id2t_path, redirects_path = make_synthetic_maps(tempfile.mkdtemp(), args["synthetic"])
+    # built in a throwaway process, so that the parent measured with the sorted lookup never held the dicts
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        queries, path = pool.apply(prepare, (id2t_path, redirects_path, args["queries"]))
+    ctx = multiprocessing.get_context(args["start_method"])
+
+    results = []
+    for backend in ["sorted", "dict"]:
+        if backend == "sorted":
+            normalizer = TitleNormalizer(lookup=SortedArrayLookup(path))
+        else:
+            t2id, redirect_map = read_maps(id2t_path, redirects_path)
+            normalizer = TitleNormalizer(redirect_map=redirect_map, t2id=t2id, lookup=DictLookup(redirect_map, t2id))
+        for workers in sorted(set([1, args["workers"]])):
+            parent, children = measure(ctx, normalizer, queries, workers)
+            results.append((backend, workers, parent, children))
+            logging.info("%-6s %2d workers: parent %8.1f MB + workers %8.1f MB (%.1f MB each) = %8.1f MB pss",
+                         backend, workers, parent, sum(children), sum(children) / workers, parent + sum(children))
+    for backend in ["sorted", "dict"]:
+        totals = [parent + sum(children) for b, _, parent, children in results if b == backend]
+        logging.info("%-6s %d workers use %.2fx the memory of 1 worker", backend, args["workers"],
+                     totals[-1] / totals[0])
@@ -0,0 +1,118 @@
+# coding=utf-8
+"""
+Runs the pipeline (dp.pipeline) of many languages of one dump date as a single dependency graph. One scheduler shares
+the cpu and memory budget between the stages of all languages, so a small wiki's stages fill the gaps left by a large
+one's instead of waiting for it, and every stage keeps its own manifest as in single language runs.
+
+dp.langlinks takes the english titles from each language's langlinks dump, no english table is read per language; when
+en is part of the batch its stages are scheduled once like any other language's.
+
+A JSON report is written with, for each language, its wall time (first stage start to last stage end), the busy time
+summed over its stages, the peak RSS of its heaviest stage (dp.pipeline.run_command), the status of every stage and the size of every output.
+
+Usage:
+    python -m dp.batch_pipeline --langs tr es hi --date 20190501 --dumpdir dumpdir --outdir outdir --cpus 16
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from dp.pair_counts import parse_size
+from dp.pipeline import Pipeline, build_stages, critical_path
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+__author__ = 'Shyam'
+
+
+def path_size(path):
+    """
+    Bytes of a file, or of all the files under a directory, 0 if it does not exist.
+    """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def language_report(stages, runs, outdir):
+    """
+    Summary of the runs of one language's stages.
+    """
+    ran = [runs[stage.key] for stage in stages if stage.key in runs]
+    if not ran:
+        return {}
+    return {"wall_secs": max(run.end for run in ran) - min(run.start for run in ran),
+            "busy_secs": sum(run.secs for run in ran),
+            "peak_rss_mb": max(run.peak_rss_mb or 0.0 for run in ran),
+            "failed": [run.stage.name for run in ran if run.status == "failed"],
+            "skipped": [run.stage.name for run in ran if run.status == "skipped"],
+            "stages": {run.stage.name: {"status": run.status, "start": run.start, "secs": run.secs,
+                                        "peak_rss_mb": run.peak_rss_mb} for run in ran},
+            "outputs": {os.path.relpath(path, outdir): path_size(path) for stage in stages for path in stage.outputs}}
+
+
+def write_report(path, report):
+    with open(path + ".tmp", "w") as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the preprocessing pipeline of many languages together.')
+    parser.add_argument('--langs', type=str, nargs='+', required=True, help='language codes, eg. tr es hi')
+    parser.add_argument('--date', type=str, required=True, help='dump date, eg. 20190501')
+    parser.add_argument('--dumpdir', type=str, required=True, help='where <lang>wiki/<lang>wiki-<date>-* dumps are')
+    parser.add_argument('--outdir', type=str, required=True, help='where outputs (and manifests) are written')
+    parser.add_argument('--report', type=str, default=None, help='JSON report, default <outdir>/batch-<date>.json')
+    parser.add_argument('--wikiextractor', type=str, default=None,
+                        help='WikiExtractor.py, without it <outdir>/<lang>wiki_with_links must already exist')
+    parser.add_argument('--stages', type=str, nargs='*', default=None,
+                        help='stages to bring up to date (with their upstream stages) in every language, default all')
+    parser.add_argument('--force', type=str, nargs='*', default=[],
+                        help='stages to rerun anyway, by name (eg. probmap) or key (eg. trwiki-20190501.probmap)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes of the stages that support it, defaults to what each stage uses alone')
+    parser.add_argument('--cpus', type=int, default=None, help='cpus shared by all stages, defaults to all of them')
+    parser.add_argument('--memory', type=str, default=None,
+                        help='memory shared by all stages (eg. 128G), defaults to all of it')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted shares one mmapped table between many workers')
+    parser.add_argument('--page_format', type=str, default="json", help='format of the hyperlinks page files')
+    parser.add_argument('--tokenizer', type=str, default="spacy", help='tokenizer of the mid stage')
+    parser.add_argument('--window', type=int, default=20, help='context window of the mid stage')
+    parser.add_argument('--max_memory', type=str, default=None, help='memory budget of compute_probs2 (eg. 16G)')
+    args = parser.parse_args()
+    args = vars(args)
+    lang2stages = {}
+    for lang in args["langs"]:
+        lang2stages[lang] = build_stages(lang, args["date"], args["dumpdir"], args["outdir"],
+                                         wikiextractor=args["wikiextractor"], workers=args["workers"],
+                                         lookup=args["lookup"], page_format=args["page_format"],
+                                         tokenizer=args["tokenizer"], window=args["window"],
+                                         max_memory=args["max_memory"])
+    stages = [stage for lang in args["langs"] for stage in lang2stages[lang]]
+    pipeline = Pipeline(stages, args["outdir"])
+    start = time.time()
+    runs = pipeline.run(names=args["stages"], force=args["force"], cpus=args["cpus"],
+                        memory=parse_size(args["memory"]) if args["memory"] else None)
+    path, path_secs = critical_path(stages, runs)
+    report = {"date": args["date"],
+              "wall_secs": time.time() - start,
+              "critical_path": path,
+              "critical_path_secs": path_secs,
+              "languages": {lang: language_report(lang2stages[lang], runs, os.path.abspath(args["outdir"]))
+                            for lang in args["langs"]}}
+    report_path = args["report"] or os.path.join(args["outdir"], "batch-%s.json" % args["date"])
+    write_report(report_path, report)
+    for lang in args["langs"]:
+        summary = report["languages"][lang]
+        logging.info("%s: %.1f secs wall, %.1f secs busy, peak rss %.0f MB, %.1f MB of outputs%s", lang,
+                     summary.get("wall_secs", 0.0), summary.get("busy_secs", 0.0), summary.get("peak_rss_mb", 0.0),
+                     sum(summary.get("outputs", {}).values()) / 2 ** 20,
+                     ", failed: %s" % (summary["failed"] + summary["skipped"]) if summary.get("failed") else "")
+    logging.info("wrote %s", report_path)
+    if any(run.status == "failed" for run in runs.values()):
+        sys.exit(1)
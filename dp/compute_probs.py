@@ -12,7 +12,7 @@ from dp.title_normalizer import TitleNormalizer
 import utils.constants as K
 from utils.text_utils import tokenizer, _getLnrm
 from utils.misc_utils import load_id2title, load_redirects
-from hanziconv import HanziConv
+from utils import hanzi_utils
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 
@@ -48,7 +48,7 @@ def read_surface_title_maps(s2t, t2s, cand_file, normalizer, add_ascii=False, to
                 t2s[t].append(ascii_s)
             if lang == "zh":
                 # TODO this conversion improves recall, but hurts acc@1 slightly
-                sm_s = HanziConv.toSimplified(s)
+                sm_s = hanzi_utils.to_simplified(s)
                 if sm_s not in s2t: s2t[sm_s] = []
                 s2t[sm_s].append(t)
                 if t not in t2s: t2s[t] = []
@@ -69,8 +69,7 @@ def read_surface_title_maps(s2t, t2s, cand_file, normalizer, add_ascii=False, to
                     t2s[t].append(ascii_s)
 
             if lang == "zh":
-                for surf_token in surf_tokens:
-                    sm_surf_token = HanziConv.toSimplified(surf_token)
+                for sm_surf_token in hanzi_utils.to_simplified_batch(surf_tokens):
                     if sm_surf_token not in s2t: s2t[sm_surf_token] = []
                     s2t[sm_surf_token].append(t)
                     if t not in t2s: t2s[t] = []
@@ -132,8 +131,8 @@ def compute_word_prob(w2t, t2w, out_prefix):
 def add_titles_and_redirects_tokens(t2w, w2t, t2id, redirects, lang, add_ascii=False):
     # need tokenizer
     for title in t2id:  # title should match itself as a surface
-        sm_title = HanziConv.toSimplified(title)
         if lang == "zh":
+            sm_title = hanzi_utils.to_simplified(title)
             if "·" in title:
                 title_tokens = title.split("·")
                 sm_title_tokens = sm_title.split("·")
@@ -162,8 +161,8 @@ def add_titles_and_redirects_tokens(t2w, w2t, t2id, redirects, lang, add_ascii=F
 
     for redirect in redirects:
         title = redirects[redirect]
-        sm_redirect = HanziConv.toSimplified(redirect)
         if lang == "zh":
+            sm_redirect = hanzi_utils.to_simplified(redirect)
             if "·" in redirect:
                 redirect_tokens = redirect.split("·")
                 sm_redirect_tokens = sm_redirect.split("·")
@@ -228,7 +227,7 @@ def add_titles_and_redirects(p2t, t2p, t2id, redirects, lang, add_ascii=False):
 
         if lang == "zh":
             # Add simplified chinese version
-            sm_title_phrase = HanziConv.toSimplified(title_phrase)
+            sm_title_phrase = hanzi_utils.to_simplified(title_phrase)
             to_add = [sm_title_phrase]
             # if sm_title_phrase not in p2t:p2t[sm_title_phrase] = []
             # p2t[sm_title_phrase].append(title)
@@ -237,7 +236,7 @@ def add_titles_and_redirects(p2t, t2p, t2id, redirects, lang, add_ascii=False):
 
             if "·" in title:
                 joined_title = title.replace("·", "")
-                sm_joined_title = HanziConv.toSimplified(joined_title)
+                sm_joined_title = hanzi_utils.to_simplified(joined_title)
                 to_add.append(sm_joined_title)
                 # if joined_title not in p2t:p2t[joined_title] = []
                 # p2t[joined_title].append(title)
@@ -246,7 +245,7 @@ def add_titles_and_redirects(p2t, t2p, t2id, redirects, lang, add_ascii=False):
 
             if "_" in title:
                 joined_title = title.replace("_", "")
-                sm_joined_title = HanziConv.toSimplified(joined_title)
+                sm_joined_title = hanzi_utils.to_simplified(joined_title)
                 to_add.append(sm_joined_title)
                 # if joined_title not in p2t:p2t[joined_title] = []
                 # p2t[joined_title].append(title)
@@ -275,7 +274,7 @@ def add_titles_and_redirects(p2t, t2p, t2id, redirects, lang, add_ascii=False):
     #     t2p[title].append(redirect_phrase)
     #
     #     if lang == "zh":
-    #         sm_redirect_phrase = HanziConv.toSimplified(redirect_phrase)
+    #         sm_redirect_phrase = hanzi_utils.to_simplified(redirect_phrase)
     #         if sm_redirect_phrase not in p2t:
     #             p2t[sm_redirect_phrase] = []
     #         p2t[sm_redirect_phrase].append(title)
@@ -353,3 +352,4 @@ if __name__ == "__main__":
         compute_word_prob(w2t=wo2t, t2w=t2wo, out_prefix=out_prefix)
         end = time.time()
         logging.info("took %s hours", (end - start) / 3600)
+    hanzi_utils.log_stats()
@@ -4,20 +4,29 @@ from __future__ import division
 
 import argparse
 import logging
-from collections import Counter, defaultdict
 import os
 import sys
 import time
-from dp.title_normalizer import TitleNormalizer
+from dp.pair_counts import PAIR_COUNTS, InternedPairCounts, ListPairCounts, SpillPairCounts, parse_size
+from dp.title_normalizer import TitleNormalizer, CACHE_POLICIES
 import utils.constants as K
 from utils.text_utils import tokenizer, _getLnrm
 from utils.misc_utils import load_id2title, load_redirects
-# from hanziconv import HanziConv
+from utils.title_lookup import SortedArrayLookup
+from utils import hanzi_utils
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 
 
-def read_surface_title_maps(s2t, t2s, cand_file, normalizer, add_ascii=False, tokenize=False, lang="en"):
+def read_surface_title_maps(pairs, cand_file, normalizer, add_ascii=False, tokenize=False, lang="en",
+                            word_pairs=None):
+    """
+    Adds the (surface, title) pairs of the links to pairs, or (surface token, title) pairs if tokenize.
+    With word_pairs, the token pairs also go to word_pairs in the same pass, while pairs gets the phrases.
+    """
+    phrase_pairs = None if tokenize else pairs
+    if tokenize:
+        word_pairs = pairs
     bad = 0
     start = time.time()
     for idx, line in enumerate(cand_file):
@@ -35,104 +44,78 @@ def read_surface_title_maps(s2t, t2s, cand_file, normalizer, add_ascii=False, to
         if t == K.NULL_TITLE:
             continue
         # s = s.lower()
-        if not tokenize:
-            if s not in s2t: s2t[s] = []
-            s2t[s].append(t)
-            if t not in t2s: t2s[t] = []
-            t2s[t].append(s)
+        if phrase_pairs is not None:
+            phrase_pairs.add(s, t)
             if add_ascii:
                 ascii_s = get_ascii_phrase(s)
-                if ascii_s not in s2t: s2t[ascii_s] = []
-                s2t[ascii_s].append(t)
-                if t not in t2s: t2s[t] = []
-                t2s[t].append(ascii_s)
+                phrase_pairs.add(ascii_s, t)
             if lang == "zh":
                 # TODO this conversion improves recall, but hurts acc@1 slightly
-                sm_s = HanziConv.toSimplified(s)
-                if sm_s not in s2t: s2t[sm_s] = []
-                s2t[sm_s].append(t)
-                if t not in t2s: t2s[t] = []
-                t2s[t].append(sm_s)
-        else:
+                sm_s = hanzi_utils.to_simplified(s)
+                phrase_pairs.add(sm_s, t)
+        if word_pairs is not None:
             surf_tokens = tokenizer(s, lang)  # BOTTLENECK!
             for surf_token in surf_tokens:
-                if surf_token not in s2t: s2t[surf_token] = []
-                s2t[surf_token].append(t)
-                if t not in t2s: t2s[t] = []
-                t2s[t].append(surf_token)
+                word_pairs.add(surf_token, t)
             if add_ascii:
                 for surf_token in surf_tokens:
                     ascii_s = get_ascii_phrase(surf_token)
-                    if ascii_s not in s2t: s2t[ascii_s] = []
-                    s2t[ascii_s].append(t)
-                    if t not in t2s: t2s[t] = []
-                    t2s[t].append(ascii_s)
+                    word_pairs.add(ascii_s, t)
 
             if lang == "zh":
-                for surf_token in surf_tokens:
-                    sm_surf_token = HanziConv.toSimplified(surf_token)
-                    if sm_surf_token not in s2t: s2t[sm_surf_token] = []
-                    s2t[sm_surf_token].append(t)
-                    if t not in t2s: t2s[t] = []
-                    t2s[t].append(sm_surf_token)
+                for sm_surf_token in hanzi_utils.to_simplified_batch(surf_tokens):
+                    word_pairs.add(sm_surf_token, t)
 
         if idx > 0 and idx % 1000000 == 0:
             logging.info("read %d lines bad frac:%f", idx, (1.0 * bad / idx))
+            normalizer.log_stats()
     end = time.time()
     logging.info("loaded surface links file in %d secs", (end - start))
     # return s2t, t2s
 
 
-def compute_x_given_y(path, y2x):
-    start = time.time()
-    with open(path, "w") as y2x2prob:
-        for y in y2x:
-            x2cnt = Counter(y2x[y])
-            total = sum(x2cnt.values())
-            for x in x2cnt:
-                prob = x2cnt[x] / total
-                buf = "%s\t%s\t%f\t%d/%d\n" % (y, x, prob, x2cnt[x], total)
-                y2x2prob.write(buf)
-    end = time.time()
-    logging.info("computed in %d secs", (end - start))
+def compute_pair_prob(pairs, out_prefix, s2t_name, t2s_name, snapshot=None):
+    """
+    Writes out_prefix.s2t_name and out_prefix.t2s_name (skipping existing files), from the state at snapshot if
+    given. Returns the paths written.
+    """
+    s2t_path = out_prefix + "." + s2t_name
+    if os.path.exists(s2t_path):
+        logging.info("%s already exists.", s2t_path)
+        s2t_path = None
+    t2s_path = out_prefix + "." + t2s_name
+    if os.path.exists(t2s_path):
+        logging.info("%s already exists.", t2s_path)
+        t2s_path = None
+    if s2t_path is not None or t2s_path is not None:
+        logging.info("Calculating %s and %s...", s2t_name, t2s_name)
+        pairs.write(s2t_path, t2s_path, snapshot=snapshot)
+    return [path for path in [s2t_path, t2s_path] if path is not None]
 
 
-def compute_phrase_prob(p2t, t2p, out_prefix):
-    path = out_prefix + "." + "p2t2prob"
-    if os.path.exists(path):
-        logging.info("%s already exists.", path)
-    else:
-        logging.info("Calculating p(title | phrase)...")
-        compute_x_given_y(path=path, y2x=p2t)
+def compute_phrase_prob(pairs, out_prefix, snapshot=None):
+    return compute_pair_prob(pairs, out_prefix, "p2t2prob", "t2p2prob", snapshot=snapshot)
 
-    path = out_prefix + "." + "t2p2prob"
-    if os.path.exists(path):
-        logging.info("%s already exists.", path)
-    else:
-        logging.info("Calculating p(phrase | title)...")
-        compute_x_given_y(path=path, y2x=t2p)
 
+def compute_word_prob(pairs, out_prefix, snapshot=None):
+    return compute_pair_prob(pairs, out_prefix, "w2t2prob", "t2w2prob", snapshot=snapshot)
 
-def compute_word_prob(w2t, t2w, out_prefix):
-    path = out_prefix + "." + "w2t2prob"
-    if os.path.exists(path):
-        logging.info("%s already exists.", path)
-    else:
-        logging.info("Calculating p(title | word)...")
-        compute_x_given_y(path, y2x=w2t)
 
-    path = out_prefix + "." + "t2w2prob"
-    if os.path.exists(path):
-        logging.info("%s already exists.", path)
-    else:
-        logging.info("Calculating p(word | title)...")
-        compute_x_given_y(path, y2x=t2w)
+def log_stage(stage, start, read=(), written=()):
+    """
+    Logs the time of a stage and the MB it read and wrote, returns the time for the next stage.
+    """
+    end = time.time()
+    logging.info("stage %-8s %7.1f secs, read %8.1f MB, wrote %8.1f MB", stage, end - start,
+                 sum(os.path.getsize(path) for path in read) / 2 ** 20,
+                 sum(os.path.getsize(path) for path in written) / 2 ** 20)
+    return end
 
 
 def get_tokens(lang, raw_title, add_ascii):
     ans = []
     if lang == "zh":
-        sm_title = HanziConv.toSimplified(raw_title)
+        sm_title = hanzi_utils.to_simplified(raw_title)
         if "·" in raw_title:
             title_tokens = raw_title.split("·")
             sm_title_tokens = sm_title.split("·")
@@ -152,7 +135,7 @@ def get_tokens(lang, raw_title, add_ascii):
     return ans
 
 
-def add_titles_and_redirects_tokens(t2w, w2t, t2id, is_redirect, redirects, lang, add_ascii=False):
+def add_titles_and_redirects_tokens(pairs, t2id, is_redirect, redirects, lang, add_ascii=False):
     # need tokenizer
     for raw_title in t2id:  # title should match itself as a surface
         if raw_title in is_redirect and raw_title in redirects:
@@ -163,12 +146,7 @@ def add_titles_and_redirects_tokens(t2w, w2t, t2id, is_redirect, redirects, lang
         all_tokens = get_tokens(lang, raw_title, add_ascii)
 
         for tok in all_tokens:
-            if tok not in w2t:
-                w2t[tok] = []
-            w2t[tok].append(nrm)
-            if nrm not in t2w:
-                t2w[nrm] = []
-            t2w[nrm].append(tok)
+            pairs.add(tok, nrm)
 
 
 def get_ascii_phrase(phrase):
@@ -200,7 +178,7 @@ def get_phrases(lang, raw_title, add_ascii):
 
     if lang == "zh":
         # Add simplified chinese version
-        sm_title_phrase = HanziConv.toSimplified(title_phrase)  # TTT TT --> SSS SS
+        sm_title_phrase = hanzi_utils.to_simplified(title_phrase)  # TTT TT --> SSS SS
         ans.append(sm_title_phrase)
 
     if add_ascii:
@@ -210,7 +188,7 @@ def get_phrases(lang, raw_title, add_ascii):
     return ans
 
 
-def add_titles_and_redirects(p2t, t2p, t2id, is_redirect, redirects, lang, add_ascii=False):
+def add_titles_and_redirects(pairs, t2id, is_redirect, redirects, lang, add_ascii=False):
     # title should match itself as a surface
     for idx, raw_title in enumerate(t2id):
         if raw_title in is_redirect and raw_title in redirects:
@@ -221,11 +199,7 @@ def add_titles_and_redirects(p2t, t2p, t2id, is_redirect, redirects, lang, add_a
         title_phrases = get_phrases(lang, raw_title, add_ascii)
 
         for ph in title_phrases:
-            if ph not in p2t: p2t[ph] = []
-            p2t[ph].append(nrm)
-
-            if nrm not in t2p: t2p[nrm] = []
-            t2p[nrm].append(ph)
+            pairs.add(ph, nrm)
 
     logging.info("added titles as default surfaces")
 
@@ -245,7 +219,7 @@ def add_titles_and_redirects(p2t, t2p, t2id, is_redirect, redirects, lang, add_a
     #     t2p[title].append(redirect_phrase)
     #
     #     if lang == "zh":
-    #         sm_redirect_phrase = HanziConv.toSimplified(redirect_phrase)
+    #         sm_redirect_phrase = hanzi_utils.to_simplified(redirect_phrase)
     #         if sm_redirect_phrase not in p2t:
     #             p2t[sm_redirect_phrase] = []
     #         p2t[sm_redirect_phrase].append(title)
@@ -274,10 +248,25 @@ if __name__ == "__main__":
     parser.add_argument('--out_prefix', type=str, required=True,
                         help='path to write the prob files. eg. enwiki/enwiki-20170520')
     parser.add_argument('--lang', type=str, required=True, help='language code')
-    parser.add_argument('--mode', type=str, required=True, help='phrase,word')
+    parser.add_argument('--mode', type=str, required=True, choices=["phrase", "word", "all"],
+                        help='phrase, word, or all to compute both from one pass over the links')
     parser.add_argument('--debug', action="store_true", help='interactive')
     parser.add_argument('--add_ascii', action="store_true",
                         help='whether to add ascii version. DO NOT do it for Arabic etc.')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted uses the mmapped <redirects>.lookup file')
+    parser.add_argument('--cache_size', type=int, default=0,
+                        help='memoize this many normalized titles (0 disables the cache)')
+    parser.add_argument('--cache_policy', type=str, default="lru", choices=CACHE_POLICIES,
+                        help='eviction policy of the normalization cache')
+    parser.add_argument('--pair_counts', type=str, default=None, choices=PAIR_COUNTS,
+                        help='how to count (surface, title) pairs: python lists, int32 interned ids in numpy arrays, '
+                             'or spilled to disk (default: spill if --max_memory is given, else list)')
+    parser.add_argument('--max_memory', '--max-memory', type=str, default=None,
+                        help='count pairs out of core within this budget (eg. 16G), spilling them to disk. '
+                             'By default everything is counted in memory')
+    parser.add_argument('--spill_dir', type=str, default=None,
+                        help='where to put the spill files of --max_memory (default: next to out_prefix)')
     args = parser.parse_args()
     args = vars(args)
 
@@ -291,38 +280,65 @@ if __name__ == "__main__":
         args["add_ascii"] = True
     redirect2title = load_redirects(args["redirects"])
     id2t, t2id, is_redirect_map = load_id2title(args["id2t"])
+    lookup = None
+    if args["lookup"] == "sorted":
+        lookup = SortedArrayLookup.for_paths(args["id2t"], args["redirects"])
     normalizer = TitleNormalizer(lang=lang,
                                  redirect_map=redirect2title,
-                                 t2id=t2id)
+                                 t2id=t2id,
+                                 lookup=lookup,
+                                 cache_size=args["cache_size"],
+                                 cache_policy=args["cache_policy"])
     # print(len(is_redirect_map))
     # print(len(redirect2title))
     # assert len(is_redirect_map) == len(redirect2title)
-    if args["mode"] == "phrase":
-        # NEEDS ~ 20G of RAM
-        ph2t = defaultdict(lambda: list)  # phrase to titles
-        t2ph = defaultdict(lambda: list)  # titles to phrase
-
-        add_titles_and_redirects(p2t=ph2t, t2p=t2ph, t2id=t2id, redirects=redirect2title, lang=lang,
+    if args["pair_counts"] is None:
+        args["pair_counts"] = "list" if args["max_memory"] is None else "spill"
+    if args["pair_counts"] == "spill" and args["max_memory"] is None:
+        parser.error("--pair_counts spill needs --max_memory")
+
+    def new_pairs():
+        if args["pair_counts"] == "list":
+            # NEEDS ~ 20G (phrase) or ~ 25G (word) of RAM for enwiki
+            return ListPairCounts()
+        if args["pair_counts"] == "interned":
+            return InternedPairCounts()
+        return SpillPairCounts(max_memory=parse_size(args["max_memory"]),
+                               spill_dir=args["spill_dir"] or os.path.dirname(os.path.abspath(out_prefix)))
+
+    stage_start = log_stage("load", start, read=[args["id2t"], args["redirects"]])
+    phrase_pairs = new_pairs() if args["mode"] in ["phrase", "all"] else None
+    word_pairs = new_pairs() if args["mode"] in ["word", "all"] else None
+
+    # titles and redirects are surfaces of themselves, the .tnr files are the counts of these pairs only
+    if phrase_pairs is not None:
+        add_titles_and_redirects(pairs=phrase_pairs, t2id=t2id, redirects=redirect2title, lang=lang,
                                  add_ascii=args["add_ascii"], is_redirect=is_redirect_map)
-        compute_phrase_prob(p2t=ph2t, t2p=t2ph, out_prefix=out_prefix + ".tnr")
-
-        read_surface_title_maps(s2t=ph2t, t2s=t2ph, cand_file=open(links), normalizer=normalizer, lang=lang,
-                                add_ascii=args["add_ascii"])
-        compute_phrase_prob(p2t=ph2t, t2p=t2ph, out_prefix=out_prefix)
-
-    if args["mode"] == "word":
-        # NEEDS ~ 25G of RAM
-        wo2t = defaultdict(lambda: list)  # word to titles
-        t2wo = defaultdict(lambda: list)  # titles to word
-
-        add_titles_and_redirects_tokens(w2t=wo2t, t2w=t2wo, t2id=t2id, redirects=redirect2title, lang=lang,
+        phrase_tnr = phrase_pairs.snapshot()
+    if word_pairs is not None:
+        add_titles_and_redirects_tokens(pairs=word_pairs, t2id=t2id, redirects=redirect2title, lang=lang,
                                         add_ascii=args["add_ascii"], is_redirect=is_redirect_map)
-        # if args["add_ascii"]:
-        #     add_unicode(st2t=wo2t, phrase=False)
-        compute_word_prob(w2t=wo2t, t2w=t2wo, out_prefix=out_prefix + ".tnr")
-
-        read_surface_title_maps(s2t=wo2t, t2s=t2wo, cand_file=open(links), normalizer=normalizer, tokenize=True,
-                                lang=lang, add_ascii=args["add_ascii"])
-        compute_word_prob(w2t=wo2t, t2w=t2wo, out_prefix=out_prefix)
-        end = time.time()
-        logging.info("took %s hours", (end - start) / 3600)
+        word_tnr = word_pairs.snapshot()
+    stage_start = log_stage("titles", stage_start)
+
+    with open(links) as cand_file:
+        if phrase_pairs is not None:
+            read_surface_title_maps(pairs=phrase_pairs, cand_file=cand_file, normalizer=normalizer, lang=lang,
+                                    add_ascii=args["add_ascii"], word_pairs=word_pairs)
+        else:
+            read_surface_title_maps(pairs=word_pairs, cand_file=cand_file, normalizer=normalizer, tokenize=True,
+                                    lang=lang, add_ascii=args["add_ascii"])
+    stage_start = log_stage("links", stage_start, read=[links])
+
+    written = []
+    if phrase_pairs is not None:
+        written += compute_phrase_prob(pairs=phrase_pairs, out_prefix=out_prefix + ".tnr", snapshot=phrase_tnr)
+        written += compute_phrase_prob(pairs=phrase_pairs, out_prefix=out_prefix)
+        phrase_pairs.close()
+    if word_pairs is not None:
+        written += compute_word_prob(pairs=word_pairs, out_prefix=out_prefix + ".tnr", snapshot=word_tnr)
+        written += compute_word_prob(pairs=word_pairs, out_prefix=out_prefix)
+        word_pairs.close()
+    hanzi_utils.log_stats()
+    log_stage("write", stage_start, written=written)
+    log_stage("total", start, read=[args["id2t"], args["redirects"], links], written=written)
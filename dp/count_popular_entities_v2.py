@@ -9,23 +9,32 @@ from __future__ import print_function
 
 import argparse
 import logging
+import os
+import shutil
 from urllib import parse
 from collections import Counter
 
 from bs4 import BeautifulSoup
-from dp.title_normalizer import TitleNormalizer
+from dp.title_normalizer import TitleNormalizer, CACHE_POLICIES
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 from utils.misc_utils import load_redirects, load_id2title
-from processors.basic_page_processor import BasicPageProcessor
+from utils.title_lookup import DictLookup, SortedArrayLookup
+from processors.basic_page_processor import BasicPageProcessor, PARSERS
+from utils.link_scanner import iter_links
+from utils.page_index import page_fingerprint, write_index_entries
 import utils.constants as K
 import sys
 
 
 class EntityCounter(BasicPageProcessor):
-    def __init__(self, wikipath, linksout, contsout, redirect_map, t2id, debug=False, limit=500000):
-        super(EntityCounter, self).__init__(wikipath)
+    supports_shards = True
+
+    def __init__(self, wikipath, linksout, contsout, redirect_map, t2id, debug=False, limit=500000, lookup=None,
+                 cache_size=0, cache_policy="lru", parser="scanner", indexout=None):
+        super(EntityCounter, self).__init__(wikipath, parser=parser)
         self.counts = Counter()
+        self.linksout = linksout
         self.links = open(linksout, "w")
         self.contsout = contsout
         self.t2id = t2id
@@ -33,59 +42,141 @@ class EntityCounter(BasicPageProcessor):
         self.null_counts = 0
         self.total_counts = 0
         self.limit = limit
-        self.normalizer = TitleNormalizer(redirect_map=self.redirect_map, t2id=self.t2id)
+        self.normalizer = TitleNormalizer(redirect_map=self.redirect_map, t2id=self.t2id, lookup=lookup,
+                                          cache_size=cache_size, cache_policy=cache_policy)
         self.debug = debug
         self.bs4_failures = 0
+        # page index for dp.delta_update (see utils.page_index), offsets are bytes of the links file written so far
+        self.indexout = indexout
+        self.index = open(indexout, "w", encoding="utf-8") if indexout is not None else None
+        self.index_entries = []
+        self.links_size = 0
+        self.shard = None
+
+    def __getstate__(self):
+        # pool workers write their own links shards, the parent's handle stays behind
+        state = self.__dict__.copy()
+        del state["links"]
+        state["index"] = None
+        if not isinstance(self.normalizer.lookup, DictLookup):
+            # workers normalize through the shared lookup, only the parent needs t2id (in finish)
+            state["t2id"] = state["redirect_map"] = None
+        return state
+
+    def shard_path(self, shard_idx):
+        return "%s.shard%05d" % (self.linksout, shard_idx)
+
+    def begin_shard(self, shard_idx):
+        self.counts = Counter()
+        self.null_counts, self.total_counts = 0, 0
+        self.normalizer.take_stats()
+        # forked workers inherit the parent's index handle, their entries go back through end_shard instead
+        self.index = None
+        self.index_entries, self.links_size = [], 0
+        self.links = open(self.shard_path(shard_idx), "w")
+
+    def end_shard(self, shard_idx):
+        self.links.close()
+        return (self.shard_path(shard_idx), self.counts, self.null_counts, self.total_counts, self.index_entries,
+                self.normalizer.take_stats())
+
+    def merge_shard(self, partial):
+        shard_path, counts, null_counts, total_counts, index_entries, normalizer_stats = partial
+        self.normalizer.add_stats(normalizer_stats)
+        if self.index is not None:
+            # offsets of the shard's entries are relative to the shard
+            write_index_entries(self.index, [(page_id, fingerprint, shard, self.links_size + offset, length)
+                                             for page_id, fingerprint, shard, offset, length in index_entries])
+            self.links_size += os.path.getsize(shard_path)
+        with open(shard_path) as shard:
+            shutil.copyfileobj(shard, self.links)
+        os.remove(shard_path)
+        self.counts.update(counts)
+        self.null_counts += null_counts
+        self.total_counts += total_counts
+
+    def process_file(self, f_handle):
+        self.shard = os.path.relpath(f_handle.name, self.wikipath)
+        super(EntityCounter, self).process_file(f_handle)
+
+    def after_file_hook(self):
+        if self.index is not None:
+            write_index_entries(self.index, self.index_entries)
+            self.index_entries = []
 
     def after_dir_hook(self):
         logging.info("saw %d nulls %d total", self.null_counts, self.total_counts)
+        self.normalizer.log_stats()
         if self.debug:
             self.finish()
             sys.exit(0)
 
-    def process_wikicontent(self, page_content, page_id, page_title):
+    def bs4_links(self, page_content):
         try:
             soup = BeautifulSoup(page_content, "html.parser")
         except NotImplementedError as e:
             self.bs4_failures += 1
             logging.info("bs4 failed %d times", self.bs4_failures)
-            return
-        for outlink in soup.find_all("a"):
-            try:
-                out_title = parse.unquote(outlink["href"])  # unquote('abc%20def') -> 'abc def'.
-                out_title = out_title.replace(" ", "_")
-                if "#" in out_title:
-                    idx = out_title.rfind("#")
-                    out_title = out_title[:idx]
-                text = outlink.text
-                # logging.info(out_title)
-                out_title = self.normalizer.normalize(title=out_title)
-                # logging.info(out_title)
-                self.total_counts += 1
-                if out_title == K.NULL_TITLE:
-                    self.null_counts += 1
-                    continue
-                self.links.write(text + "\t" + out_title + "\n")
-                self.counts.update([out_title])
-            except KeyError:
-                logging.info("not found! %s", outlink)
+            return []
+        return [(outlink.text, outlink.get("href")) for outlink in soup.find_all("a")]
+
+    def process_wikicontent(self, page_content, page_id, page_title):
+        if self.parser == "bs4":
+            links = self.bs4_links(page_content)
+        else:
+            links = iter_links(page_content)
+        size = 0
+        for text, href in links:
+            if href is None:
+                logging.info("not found! %s", text)
                 continue
+            out_title = parse.unquote(href)  # unquote('abc%20def') -> 'abc def'.
+            out_title = out_title.replace(" ", "_")
+            if "#" in out_title:
+                idx = out_title.rfind("#")
+                out_title = out_title[:idx]
+            # logging.info(out_title)
+            out_title = self.normalizer.normalize(title=out_title)
+            # logging.info(out_title)
+            self.total_counts += 1
+            if out_title == K.NULL_TITLE:
+                self.null_counts += 1
+                continue
+            line = text + "\t" + out_title + "\n"
+            self.links.write(line)
+            if self.indexout is not None:
+                size += len(line.encode(self.links.encoding))
+            self.counts.update([out_title])
+        if self.indexout is not None:
+            self.index_entries.append((page_id, page_fingerprint(page_title, page_content), self.shard,
+                                       self.links_size, size))
+            self.links_size += size
 
     def finish(self):
         self.links.close()
-        for title in self.t2id:
-            if title not in self.counts:
-                self.counts[title] = 0
+        if self.index is not None:
+            self.index.close()
+        if self.contsout is not None:
+            write_counts(self.contsout, self.counts, self.t2id)
+
 
-        with open(self.contsout, "w") as out:
-            for idx, (title, cnt) in enumerate(self.counts.most_common()):
-                if title not in self.t2id:
-                    logging.info("did not find title %s in t2id", title)
-                    continue
-                buf = "%s\t%s\t%d\n" % (self.t2id[title], title, cnt)
-                out.write(buf)
-                # if idx > self.limit:
-                #     break
+def write_counts(contsout, counts, t2id):
+    """
+    Writes id <tab> title <tab> count lines, most common first, for every title of t2id (0 if it is not in counts).
+    """
+    for title in t2id:
+        if title not in counts:
+            counts[title] = 0
+
+    with open(contsout, "w") as out:
+        for idx, (title, cnt) in enumerate(counts.most_common()):
+            if title not in t2id:
+                logging.info("did not find title %s in t2id", title)
+                continue
+            buf = "%s\t%s\t%d\n" % (t2id[title], title, cnt)
+            out.write(buf)
+            # if idx > self.limit:
+            #     break
 
 
 if __name__ == "__main__":
@@ -96,6 +187,17 @@ if __name__ == "__main__":
     parser.add_argument('--linksout', type=str, required=True, help='file to write surface --> title information.')
     parser.add_argument('--contsout', type=str, required=True, help='file to write sorted counts in.')
     parser.add_argument('--debug', action="store_true", help='interactive')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted uses the mmapped <redirects>.lookup file')
+    parser.add_argument('--cache_size', type=int, default=0,
+                        help='memoize this many normalized titles (0 disables the cache)')
+    parser.add_argument('--cache_policy', type=str, default="lru", choices=CACHE_POLICIES,
+                        help='eviction policy of the normalization cache')
+    parser.add_argument('--parser', type=str, default="scanner", choices=PARSERS,
+                        help='how <doc> headers and <a href> links are parsed')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes, each file is one shard')
+    parser.add_argument('--index', type=str, default=None,
+                        help='file to write the page index in (for dp.delta_update), eg. <linksout>.index')
     args = parser.parse_args()
     args = vars(args)
 
@@ -114,9 +216,14 @@ if __name__ == "__main__":
     # """)
     redirect_map = load_redirects(args["redirects"])
     _, t2id, _ = load_id2title(args["id2title"])
+    lookup = None
+    if args["lookup"] == "sorted":
+        lookup = SortedArrayLookup.for_paths(args["id2title"], args["redirects"])
     p = EntityCounter(wikipath=args["wikitext"],
                       linksout=args["linksout"],
                       contsout=args["contsout"],
                       redirect_map=redirect_map, t2id=t2id,
-                      debug=args["debug"], limit=0)
-    p.run()
+                      debug=args["debug"], limit=0, lookup=lookup,
+                      cache_size=args["cache_size"], cache_policy=args["cache_policy"],
+                      parser=args["parser"], indexout=args["index"])
+    p.run(workers=args["workers"])
@@ -12,54 +12,88 @@ Arguments:
 from __future__ import print_function
 
 import argparse
-import gzip
 import logging
+import multiprocessing
+import os
+import time
 from .dp_common import *
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 
-def read_id2title(wikiprefix, encoding, outpath):
+# reader shared by the calls of _format_batch inside one pool worker
+_worker_reader = None
+
+
+def _init_worker(reader):
+    global _worker_reader
+    _worker_reader = reader
+
+
+def format_id2title(reader, lines):
+    """
+    Parses raw INSERT lines and returns the id2t tsv rows (namespace 0 only) as one string.
+    """
+    buf = []
+    for line in lines:
+        for page_id, ns, page_title, is_redirect in reader.parse_line(line):
+            # only ns 0 is genuine page, others are discussions, category pages etc.
+            if ns != 0:
+                continue
+            buf.append("%d\t%s\t%d\n" % (page_id, page_title, is_redirect))
+    return "".join(buf)
+
+
+def _format_batch(lines):
+    total, bad = _worker_reader.total, _worker_reader.bad
+    buf = format_id2title(_worker_reader, lines)
+    return buf, _worker_reader.total - total, _worker_reader.bad - bad
+
+
+def _insert_line_batches(filename, batch_size):
+    batch = []
+    with open_dump(filename) as f:
+        for line in f:
+            if not line.startswith(b"INSERT INTO"):
+                continue
+            batch.append(line)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_id2title(wikiprefix, encoding, outpath, workers=1, batch_size=16):
     """
     page id in fr wikipedia --> target_lang (usually en) wikipedia title
+
+    With workers > 1, the parent streams the gzip and hands batches of `batch_size` raw INSERT lines to a process
+    pool, the results are written back in input order so the output is identical to the single process run.
     """
     filename = wikiprefix + "-page.sql.gz"
     logging.info("Reading id2title sql" + filename)
     schema = parse_schema(filename, encoding)
-    f = gzip.open(filename, "rt", encoding=encoding)
-    bad = 0
+    columns = [schema['page_id'], schema['page_namespace'], schema['page_title'], schema['page_is_redirect']]
+    reader = SqlInsertReader(filename, columns=columns, width=len(schema), encoding=encoding)
+    start = time.time()
+    total, bad = 0, 0
     with open(outpath, "w") as out:
-
-        for line in f:
-            if "INSERT INTO" not in line:
-                continue
-            start = line.index("(")
-            line = line[start + 1:]
-            parts = line.split("),(")
-            for part in parts:
-                all_fields = split_str(',', part)
-                if len(all_fields) != len(schema):
-                    logging.info(
-                        "warning: ignore part as number of fields does not match schema %s, %d but expected %d", part,
-                        len(all_fields), len(schema))
-                    bad += 1
-                    continue
-                page_id = all_fields[schema['page_id']]
-                ns = all_fields[schema['page_namespace']]
-                page_title = all_fields[schema['page_title']]
-                # only ns 0 is genuine page, others are discussions, category pages etc.
-                if ns != "0":
-                    continue
-                is_redirect = all_fields[schema['page_is_redirect']]
-                # strip out the single quotes around 'Title'
-                # page_title.strip("'") might remove genuine extra quotes around some titles, so should not be used
-                page_title = page_title[1:-1]
-                if "\\" in page_title:
-                    page_title = page_title.replace("\\", "")
-                # print(part)
-                buf = "\t".join([page_id, page_title, is_redirect])
-                # buf = "\t".join([page_id, page_title])
-                out.write(buf + "\n")
-        logging.info("warning: total bad formats in file: %d", bad)
+        if workers <= 1:
+            for lines in _insert_line_batches(filename, batch_size):
+                out.write(format_id2title(reader, lines))
+            total, bad = reader.total, reader.bad
+        else:
+            logging.info("parsing with %d workers", workers)
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(reader,)) as pool:
+                for buf, batch_total, batch_bad in pool.imap(_format_batch,
+                                                             _insert_line_batches(filename, batch_size)):
+                    out.write(buf)
+                    total += batch_total
+                    bad += batch_bad
+    secs = time.time() - start
+    logging.info("warning: total bad formats in file: %d (out of %d)", bad, total)
+    logging.info("parsed %d tuples in %.1f secs (%.0f tuples/sec, %.1f MB/sec compressed)", total, secs,
+                 total / max(secs, 1e-9), os.path.getsize(filename) / 2 ** 20 / max(secs, 1e-9))
 
 
 if __name__ == "__main__":
@@ -67,7 +101,8 @@ if __name__ == "__main__":
     parser.add_argument('--wiki', type=str, required=True,
                         help='prefix to the relevant wikipedia dump, e.g., enwiki-20181020')
     parser.add_argument('--out', type=str, required=True, help='tsv file to write the map in. eg. enwiki-20170420.id2t')
+    parser.add_argument('--workers', type=int, default=1, help='number of parsing processes (1 = no pool)')
     args = parser.parse_args()
     args = vars(args)
     logging.info("reading id2title from sql file")
-    read_id2title(wikiprefix=args["wiki"], outpath=args["out"], encoding="utf-8")
+    read_id2title(wikiprefix=args["wiki"], outpath=args["out"], encoding="utf-8", workers=args["workers"])
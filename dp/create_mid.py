@@ -1,33 +1,80 @@
 # coding=utf-8
-from spacy.tokenizer import Tokenizer
-import json
-import spacy.util
 import argparse
+from bisect import bisect_left
+import re
+import resource
 import sys
 import os
+import time
 import multiprocessing
-from multiprocessing import Process
 from dp.title_normalizer import TitleNormalizer
 from utils.misc_utils import load_id2title, load_redirects
+from utils.title_lookup import SortedArrayLookup
+from utils.page_json import BRIEF_SUFFIX, page_format, strip_page_suffix, iter_page_file
 import logging
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 
+TOKENIZERS = ["spacy", "regex"]
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class RegexToken:
+    __slots__ = ("idx", "i", "text")
+
+    def __init__(self, idx, i, text):
+        self.idx, self.i, self.text = idx, i, text
+
+    def __len__(self):
+        return len(self.text)
+
+
+"""
+Cheap tokenizer for languages where spacy is the bottleneck: runs of word characters, and every other non space
+character on its own. Tokens have the idx, i and len() the MID alignment uses.
+"""
+class RegexTokenizer:
+    def __call__(self, text):
+        return [RegexToken(m.start(), i, m.group()) for i, m in enumerate(_TOKEN_RE.finditer(text))]
+
+    def pipe(self, texts, batch_size=1000):
+        for text in texts:
+            yield self(text)
+
+
 """
 Return a tokenizer built from a given langauge code (e.g. 'en' for English)
 
 Returns
 ----------
-A tokenizer object
+A tokenizer object, with a pipe(texts, batch_size) method
 
 Parameters
 ----------
 lang Language code
+backend One of TOKENIZERS, spacy or regex
 """
-def get_tokenizer(lang):
+def get_tokenizer(lang, backend="spacy"):
+    if backend == "regex":
+        return RegexTokenizer()
+    import spacy.util
     lang_cls = spacy.util.get_lang_class(lang)
     return lang_cls().Defaults.create_tokenizer()
 
+
+# tokenizers built by this process, by (lang, backend)
+_tokenizers = {}
+
+
+"""
+get_tokenizer, built once per process
+"""
+def cached_tokenizer(lang, backend="spacy"):
+    if (lang, backend) not in _tokenizers:
+        _tokenizers[(lang, backend)] = get_tokenizer(lang, backend)
+    return _tokenizers[(lang, backend)]
+
 """
 Check if a token has intersection with the link
 
@@ -44,64 +91,138 @@ def check_if_tok_match_link(link, token):
     return True
 
 """
-Produce one MID file given one json file containing info on links
+Start and end character offsets of the tokens of a doc, both increasing since tokens do not overlap
+
+Returns
+----------
+(starts, ends) lists, ends[k] = starts[k] + len(token k)
+"""
+def token_offsets(doc):
+    starts = [tok.idx for tok in doc]
+    ends = [start + len(tok) for start, tok in zip(starts, doc)]
+    return starts, ends
+
+"""
+Range of the tokens intersecting the link, same tokens as check_if_tok_match_link picks: those starting before the
+link end and ending at or after the link start
+
+Returns
+----------
+(first, last) positions of the tokens in the doc, None if no token intersects
+
+Parameters
+----------
+starts, ends Token offsets from token_offsets
+"""
+def align_link(starts, ends, link):
+    first = bisect_left(ends, link['start'])
+    last = bisect_left(starts, link['end']) - 1
+    if first > last:
+        return None
+    return first, last
+
+"""
+Pairs each article with the tokens of its text, None for articles without linked_spans. Texts are sent through
+tokenizer.pipe batch_size articles at a time, so only one batch of docs is held at once.
+"""
+def iter_tokenized(articles, tokenizer, batch_size):
+    batch = []
+    for article in articles:
+        batch.append(article)
+        if len(batch) >= batch_size:
+            yield from _tokenize_batch(batch, tokenizer, batch_size)
+            batch = []
+    yield from _tokenize_batch(batch, tokenizer, batch_size)
+
+
+def _tokenize_batch(batch, tokenizer, batch_size):
+    docs = tokenizer.pipe([article['text'] for article in batch if 'linked_spans' in article], batch_size=batch_size)
+    for article in batch:
+        yield article, next(docs) if 'linked_spans' in article else None
+
+# tabs and newlines inside a field would break the tab separated, one row per line MID format
+_FIELD_TABLE = str.maketrans("\t\n\r", "   ")
+
+
+"""
+Writes MID rows one article at a time, through a buffer of buffer_size bytes. Titles are normalized once per article
+and every row ends with a newline.
+"""
+class MidWriter:
+    def __init__(self, path, encoding, normalizer, buffer_size=1 << 20):
+        self.out = open(path, 'w', encoding=encoding, buffering=buffer_size)
+        self.normalizer = normalizer
+        self.rows = 0
+
+    def write_article(self, article_id, title, mentions, links):
+        if len(links) == 0:
+            return
+        title = self.normalizer.normalize(title)
+        mentions = mentions.translate(_FIELD_TABLE)
+        self.out.write("".join("\t".join(['MID',
+                                          article_id,
+                                          title,
+                                          str(l['start']),
+                                          str(l['end']),
+                                          l['mention'].translate(_FIELD_TABLE),
+                                          l['window'].translate(_FIELD_TABLE),
+                                          mentions]) + "\n" for l in links))
+        self.rows += len(links)
+
+    def close(self):
+        self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+"""
+Produce one MID file given one json file containing info on links. Articles are written as soon as they are
+tokenized, so a worker holds one tokenizer batch at a time whatever the size of the file.
 
 Parameters
 ----------
 window Size of context window
-filename File path of the input json file
-encoding Encoding of the input file
+filename File path of the input page file (json, or jsonl streamed one page at a time)
+encoding Encoding of the output file
 outfile File path of the output csv file. Result will be written into this file
-tokenizer Tokenizer to use, should be a spacy Tokenizer object
+tokenizer Tokenizer to use, a spacy Tokenizer object or a RegexTokenizer
 normalizer Normalizer to use to normalize the titles
+batch_size Number of article texts per tokenizer.pipe batch
+
+Returns
+----------
+(number of articles read, number of rows written)
 """
-def create_mid_for_one_file(window, filename, tokenizer, encoding, outfile, normalizer):
-    f = open(filename, 'r', encoding=encoding)
-    doc = json.load(f)
-    info_to_dump = []
-    for article in doc:
-        article_id = article['curid']
-        article_title = article['title']
-        article_all_mentions = []
-        tok_info = []
-        links = None
-        if 'linked_spans' in article:
-            links = article['linked_spans']
-        article_text = article['text']
-
-        if links is not None:
-            toks_info = []
-            article_toks = tokenizer(article_text)
-            for link in links:
-                # Add to all mentions for the article
-                article_all_mentions.append(link['label'])
-                # Get the tokens that intersects with the link
-                matched_toks = [tok for tok in article_toks if check_if_tok_match_link(link, tok)]
-                if len(matched_toks) > 0:
-                    # Sort the tokens based on its index in the document
-                    link_toks = sorted(matched_toks, key=lambda t : t.i)
-                    tok_start_idx = matched_toks[0].i
-                    tok_end_idx = matched_toks[-1].i
-                    tok = {'start': tok_start_idx, 'end': tok_end_idx, 'mention': link['label'], 'window': article_text[link['start'] - window:link['end'] + window]}
-                    tok_info.append(tok)
-        info_to_dump.append({'id': article_id, 'title': article_title, 'mentions': ' '.join(article_all_mentions), 'links': tok_info})
-    f.close()
-
-    # dump to file
-    with open(outfile, 'w', encoding=encoding) as csvfile:
-        # writer = csv.writer(csvfile, dialect='excel-tab')
-        for article in info_to_dump:
-            if len(article['links']) > 0:
-                for l in article['links']:
-                    buf = "\t".join(['MID',
-                                     article['id'],
-                                     normalizer.normalize(article['title']),
-                                     str(l['start']),
-                                     str(l['end']),
-                                     l['mention'],
-                                     l['window'],
-                                     article['mentions']])
-                    csvfile.write(buf)
+def create_mid_for_one_file(window, filename, tokenizer, encoding, outfile, normalizer, batch_size=1000):
+    num_articles = 0
+    with MidWriter(outfile, encoding, normalizer) as writer:
+        for article, article_toks in iter_tokenized(iter_page_file(filename), tokenizer, batch_size):
+            num_articles += 1
+            article_all_mentions = []
+            tok_info = []
+            links = None
+            if 'linked_spans' in article:
+                links = article['linked_spans']
+            article_text = article['text']
+
+            if links is not None:
+                starts, ends = token_offsets(article_toks)
+                for link in links:
+                    # Add to all mentions for the article
+                    article_all_mentions.append(link['label'])
+                    # Get the tokens that intersects with the link
+                    span = align_link(starts, ends, link)
+                    if span is not None:
+                        tok_start_idx = article_toks[span[0]].i
+                        tok_end_idx = article_toks[span[1]].i
+                        tok = {'start': tok_start_idx, 'end': tok_end_idx, 'mention': link['label'], 'window': article_text[link['start'] - window:link['end'] + window]}
+                        tok_info.append(tok)
+            writer.write_article(article['curid'], article['title'], ' '.join(article_all_mentions), tok_info)
+    return num_articles, writer.rows
 
 
 """
@@ -118,58 +239,84 @@ def batch_create_mids(inputs, outputs, window, tokenizer, encoding, normalizer):
     for i in range(len(inputs)):
         create_mid_for_one_file(window, inputs[i], tokenizer, encoding, outputs[i], normalizer)
 
+
+# tokenizers come from cached_tokenizer, built once per worker instead of being pickled into it
+_worker_normalizer = None
+
+
+def _init_worker(normalizer):
+    global _worker_normalizer
+    _worker_normalizer = normalizer
+
+
+def _mid_task(task):
+    filename, outfile, window, encoding, lang, tokenizer, batch_size = task
+    start = time.time()
+    num_articles, num_rows = create_mid_for_one_file(window, filename, cached_tokenizer(lang, tokenizer), encoding,
+                                                     outfile, _worker_normalizer, batch_size=batch_size)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return os.getpid(), num_articles, num_rows, time.time() - start, peak_mb
+
 """
 Produce MID files given a directory where json files live in its subdirectories
 
 Parameters
 ----------
-link_dump_prefix Path to directory containing all input json files. For instance 'output/trwiki/output/link_in_pages'
+link_dump_prefix Path to directory containing all input page files (any of utils.page_json.PAGE_FORMATS). For instance 'output/trwiki/output/link_in_pages'
 out Path to output directory. For instance 'output/trwiki/output/mid'
+tokenizer Tokenizer backend, one of TOKENIZERS
+batch_size Number of article texts per tokenizer.pipe batch
+workers Number of worker processes, defaults to the number of CPUs
 
 Side Effects
 ------------
-It will create one process per CPU allowed for this parent process. To limit CPU usage, use taskset
+Files (largest first) are handed out one at a time to a pool of workers. To limit CPU usage, use --workers or taskset
 """
-def create_mids(link_dump_prefix, out, encoding, lang, window, normalizer):
+def create_mids(link_dump_prefix, out, encoding, lang, window, normalizer, tokenizer="spacy", batch_size=1000,
+                workers=None):
     dump_prefix_abs = os.path.abspath(link_dump_prefix)
     out_abs = os.path.abspath(out)
-    inputs_list = []
-    outputs_list = []
-    # Get the number of CPUs we are given
-    num_cpus = multiprocessing.cpu_count()
-    for i in range(num_cpus):
-        inputs_list.append([])
-        outputs_list.append([])
-
-    next_cpu_idx = 0
-    for directory in os.listdir(path=dump_prefix_abs):
+    tasks = []
+    for directory in sorted(os.listdir(path=dump_prefix_abs)):
         subdir = os.path.join(dump_prefix_abs, directory)
         # Should not append non directory file to path
         if os.path.isdir(subdir):
             outdir = os.path.join(out_abs, directory)
             if not os.path.exists(outdir):
                 os.makedirs(outdir)
-            # Schedule work per cpu
-            for f in os.listdir(path=subdir):
-                if f.endswith('.json'):
-                    inputs_list[next_cpu_idx].append(os.path.join(subdir, f))
-                    outputs_list[next_cpu_idx].append(os.path.join(outdir, os.path.splitext(f)[0] + '.csv'))
-                    next_cpu_idx += 1
-                    next_cpu_idx %= num_cpus
-
-    ps = []
-    logging.info('%d CPU(s) will be used' % num_cpus)
-    for i in range(num_cpus):
-        logging.info('# %d CPU will handle %d files' % (i, len(inputs_list[i])))
-    tokenizer = get_tokenizer(lang)
-    for i in range(num_cpus):
-        # Start one process per cpu available
-        proc = Process(target=batch_create_mids, args=(inputs_list[i], outputs_list[i], window, tokenizer, encoding, normalizer))
-        ps.append(proc)
-    for p in ps:
-        p.start()
-    for p in ps:
-        p.join()
+            for f in sorted(os.listdir(path=subdir)):
+                if page_format(f) is not None and not f.endswith(BRIEF_SUFFIX):
+                    tasks.append((os.path.join(subdir, f), os.path.join(outdir, strip_page_suffix(f) + '.csv'),
+                                  window, encoding, lang, tokenizer, batch_size))
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+    workers = workers or multiprocessing.cpu_count()
+    logging.info("creating MIDs from %d files with %d workers, %s tokenizer", len(tasks), workers, tokenizer)
+
+    start = time.time()
+    worker_stats = {}
+    if workers == 1:
+        _init_worker(normalizer)
+        results = map(_mid_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(normalizer,))
+        results = pool.imap_unordered(_mid_task, tasks)
+    for pid, num_articles, num_rows, secs, peak_mb in results:
+        files, articles, rows, busy, _ = worker_stats.get(pid, (0, 0, 0, 0.0, 0.0))
+        worker_stats[pid] = (files + 1, articles + num_articles, rows + num_rows, busy + secs, peak_mb)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    secs = time.time() - start
+    for pid in sorted(worker_stats):
+        files, articles, rows, busy, peak_mb = worker_stats[pid]
+        logging.info("worker %d: %d files, %d articles, %d rows in %.1f secs, %.1f articles/sec, %.1f rows/sec, "
+                     "peak rss %.0f MB", pid, files, articles, rows, busy, articles / max(busy, 1e-9),
+                     rows / max(busy, 1e-9), peak_mb)
+    total = sum(stats[1] for stats in worker_stats.values())
+    total_rows = sum(stats[2] for stats in worker_stats.values())
+    logging.info("%s tokenizer: %d articles, %d rows from %d files in %.1f secs, %.1f articles/sec, %.1f rows/sec",
+                 tokenizer, total, total_rows, len(tasks), secs, total / max(secs, 1e-9), total_rows / max(secs, 1e-9))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Produce MID files from links info')
@@ -181,11 +328,25 @@ if __name__ == "__main__":
     parser.add_argument('--redirects', type=str, required=True, help='redirect --> title')
     parser.add_argument('--lang', type=str, required=True, help='language code')
     parser.add_argument('--window', type=str, required=True, help='context window length')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted uses the mmapped <redirects>.lookup file')
+    parser.add_argument('--tokenizer', type=str, default="spacy", choices=TOKENIZERS,
+                        help='spacy, or regex (word characters and single punctuation) where spacy is too slow')
+    parser.add_argument('--batch_size', type=int, default=1000, help='article texts per tokenizer.pipe batch')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes, defaults to the number of CPUs')
     args = parser.parse_args()
     args = vars(args)
-    redirect2title = load_redirects(args["redirects"])
-    id2t, t2id, is_redirect_map = load_id2title(args["id2t"])
+    redirect2title, t2id, lookup = None, None, None
+    if args["lookup"] == "sorted":
+        # the workers share the mmapped lookup, the dicts are not loaded at all
+        lookup = SortedArrayLookup.for_paths(args["id2t"], args["redirects"])
+    else:
+        redirect2title = load_redirects(args["redirects"])
+        id2t, t2id, is_redirect_map = load_id2title(args["id2t"])
     normalizer = TitleNormalizer(lang=args['lang'],
                                  redirect_map=redirect2title,
-                                 t2id=t2id)
-    create_mids(link_dump_prefix=args["dump"], out=args["out"], encoding="utf-8", lang=args['lang'], window=int(args['window']), normalizer=normalizer)
+                                 t2id=t2id,
+                                 lookup=lookup)
+    create_mids(link_dump_prefix=args["dump"], out=args["out"], encoding="utf-8", lang=args['lang'], window=int(args['window']), normalizer=normalizer,
+                tokenizer=args["tokenizer"], batch_size=args["batch_size"], workers=args["workers"])
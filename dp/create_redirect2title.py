@@ -5,7 +5,6 @@ import logging
 import sys
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 from utils.misc_utils import load_id2title
-import gzip
 from .dp_common import *
 
 
@@ -18,35 +17,21 @@ def read_redirects(filename, encoding, id2t):
     total, missed = 0, 0
     schema = parse_schema(filename, encoding)
     if 'rd_from' not in schema:
-        raise RuntimeException('Redirect from id not found in schema!')
+        raise RuntimeError('Redirect from id not found in schema!')
     if 'rd_title' not in schema:
-        raise RuntimeException('Redirect title not found in schema!')
-    f = gzip.open(filename, "rt", encoding=encoding,errors="ignore")
-    for line in f:
-        if "INSERT INTO" not in line:
-            continue
-        start = line.index("(")
-        line = line[start + 1:]
-        parts = line.split("),(")
-        for part in parts:
-            all_fields = split_str(',', part)
-            redirect_page_id = all_fields[schema['rd_from']]
-            title = all_fields[schema['rd_title']]
-            # THIS GETS MISSED BECAUSE WE DO NOT HAVE FR ID TO TITLE FOR ALL PAGES
-            #title = title[:len(title) - 1]
-            #title = title.replace(" ", "_")
-            #if "\\" in title:
-            #    title = title.replace("\\", "")
-            # print(list(id2t.keys())[0:5])
-            if redirect_page_id in id2t:
-                re_title = id2t[redirect_page_id]
-                # print(re_title,title)
-                redirect2title[re_title] = title
-            else:
-                # print("missed",redirect_page_id)
-                missed += 1
-            total += 1
-    logging.info("missed ids %d total redirects %d", missed, total)
+        raise RuntimeError('Redirect title not found in schema!')
+    reader = SqlInsertReader(filename, columns=[schema['rd_from'], schema['rd_title']], width=len(schema),
+                             encoding=encoding, errors="ignore")
+    for redirect_page_id, title in reader:
+        redirect_page_id = str(redirect_page_id)
+        # THIS GETS MISSED BECAUSE WE DO NOT HAVE FR ID TO TITLE FOR ALL PAGES
+        if redirect_page_id in id2t:
+            re_title = id2t[redirect_page_id]
+            redirect2title[re_title] = title
+        else:
+            missed += 1
+        total += 1
+    logging.info("missed ids %d total redirects %d bad tuples %d", missed, total, reader.bad)
     logging.info("redirect map size %d", len(redirect2title))
     return redirect2title
 
@@ -0,0 +1,446 @@
+# coding=utf-8
+"""
+Updates the outputs of a previous run (surface links and their page index, .counts, the probmap tsvs, the page files of
+extract_link_from_pages and the MID files) to a newer dump, reprocessing only the pages that were added or changed.
+
+Every page of the new wikiextractor output is fingerprinted (utils.page_index) and compared to the index written with
+the previous surface links (count_popular_entities_v2 --index). Added and changed pages are copied to a small
+wikiextractor output of their own, which goes through EntityCounter, extract_links and create_mids as usual. Changed
+and removed pages are dropped from the previous outputs:
+
+    surface links   the lines of the kept pages are copied (their byte ranges come from the index) with their titles
+                    renamed, those of the delta pages appended, and a new index written
+    .counts         the titles of the dropped pages' links are subtracted, the delta pages' counted
+    probmap         the (surface, title) pairs of the dropped pages' links are subtracted and the delta pages' added,
+                    with the same code as compute_probs2, and the titles and redirects pairs (.tnr) redone from the
+                    new tables; each file is rewritten from the previous one with the changed counts (pair_counts)
+    page and MID    files are hard linked when none of their pages was dropped or renamed, otherwise rewritten
+                    without the dropped pages and with the titles renamed; the delta pages go to a delta-<date> shard
+
+Titles from the previous run are normalized again with the new tables, in every output, so links to pages that became
+redirects follow them and links to deleted pages are left out, as a full run does. Only resolved titles are kept,
+so links through a redirect that now points elsewhere keep the old target, and links of unchanged pages that the
+previous run could not resolve (eg. to pages created since) are only counted once the page changes. A full run now
+and then picks them up.
+
+Parsing and tokenizing scale with the number of changed pages. Reading the new text for fingerprints and rewriting
+the outputs is still proportional to the corpus, but is plain I/O.
+
+Usage:
+    python -m dp.delta_update --wikitext trwiki_with_links --date 20190601 --lang tr \\
+        --id2t idmap/trwiki-20190601.id2t --redirects idmap/trwiki-20190601.r2t \\
+        --prev_links surface_links.20190501 --prev_counts trwiki-20190501.counts \\
+        --prev_prob_prefix probmap/trwiki-20190501 --prev_pages trlink_in_pages.20190501 --prev_mid trmid.20190501 \\
+        --links surface_links --counts trwiki-20190601.counts --prob_prefix probmap/trwiki-20190601 \\
+        --pages trlink_in_pages --mid trmid
+"""
+import argparse
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from dp.compute_probs2 import add_titles_and_redirects, add_titles_and_redirects_tokens, read_surface_title_maps
+from dp.count_popular_entities_v2 import EntityCounter, write_counts
+from dp.create_mid import TOKENIZERS, create_mids
+from dp.extract_link_from_pages import extract_links
+from dp.pair_counts import ListPairCounts, PairDelta, iter_x_given_y, update_x_given_y
+from dp.title_normalizer import TitleNormalizer
+from processors.page_iterator import iter_page_blocks
+from utils.misc_utils import load_id2title, load_redirects
+from utils.page_index import index_path, page_fingerprint, read_index, write_index_entries
+from utils.page_json import BRIEF_SUFFIX, PAGE_FORMATS, PageWriter, iter_page_file, page_format, strip_page_suffix
+from utils.title_lookup import SortedArrayLookup
+import utils.constants as K
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+__author__ = 'Shyam'
+
+# bytes of text per file of the delta pages, as wikiextractor -b 1M
+DELTA_FILE_SIZE = 1 << 20
+
+# (s2t, t2s) probmap files of the phrase and the word pairs
+PROB_FILES = [("p2t2prob", "t2p2prob"), ("w2t2prob", "t2w2prob")]
+
+
+def renamer(normalizer):
+    """
+    title --> title it is counted as with the normalizer's tables, None if it is not a title anymore.
+    """
+    memo = {}
+
+    def rename(title):
+        if title not in memo:
+            nrm = normalizer.normalize(title)
+            memo[title] = None if nrm == K.NULL_TITLE else nrm
+        return memo[title]
+    return rename
+
+
+def diff_pages(wikitext, prev_fingerprints, out_dir):
+    """
+    Compares the pages of the wikiextractor output wikitext to prev_fingerprints (page id --> fingerprint), and writes
+    the added and changed pages to wikiextractor files in out_dir.
+
+    Returns (ids of the unchanged pages, number of added pages, number of changed pages)
+    """
+    os.makedirs(out_dir)
+    kept = set()
+    added, changed = 0, 0
+    out, written, num_files = None, 0, 0
+    for dirname in sorted(os.listdir(wikitext)):
+        dirpath = os.path.join(wikitext, dirname)
+        if not os.path.isdir(dirpath):
+            continue
+        for filename in sorted(os.listdir(dirpath)):
+            with open(os.path.join(dirpath, filename), encoding="utf-8") as f:
+                for page_id, page_title, page_content, block in iter_page_blocks(f):
+                    prev = prev_fingerprints.get(page_id)
+                    if prev is not None and prev == page_fingerprint(page_title, page_content):
+                        kept.add(page_id)
+                        continue
+                    if prev is None:
+                        added += 1
+                    else:
+                        changed += 1
+                    if out is None or written >= DELTA_FILE_SIZE:
+                        if out is not None:
+                            out.close()
+                        out = open(os.path.join(out_dir, "wiki_%04d" % num_files), "w", encoding="utf-8")
+                        written, num_files = 0, num_files + 1
+                    out.write(block)
+                    written += len(block)
+    if out is not None:
+        out.close()
+    return kept, added, changed
+
+
+def rename_lines(data, rename, encoding):
+    """
+    Surface links lines (bytes) with their titles renamed, without the lines of titles that are gone. Returns data
+    itself when no title changes.
+    """
+    lines = data.split(b"\n")
+    changed = False
+    # the last item is what follows the final newline
+    for i in range(len(lines) - 1):
+        line = lines[i]
+        tab = line.rfind(b"\t")
+        if tab < 0:
+            # rest of an anchor text with a newline, its title is on the next line
+            continue
+        title = line[tab + 1:].decode(encoding)
+        nrm = rename(title)
+        if nrm != title:
+            changed = True
+            lines[i] = None if nrm is None else line[:tab + 1] + nrm.encode(encoding)
+    if not changed:
+        return data
+    return b"".join(line + b"\n" for line in lines[:-1] if line is not None)
+
+
+def split_links(prev_links, entries, dropped, rename, out):
+    """
+    Copies the surface links lines of the pages of entries (the index of prev_links, in file order) to out (a binary
+    file), except those of the dropped pages. The titles of the kept pages are renamed (rename_lines), so their links
+    follow the redirects and deletions of the new dump.
+
+    Returns (index entries of the kept pages at their offset in out, lines of the dropped pages, ids of the kept pages
+    with a renamed title)
+    """
+    kept, removed, renamed = [], [], set()
+    with open(prev_links) as text:
+        f = text.buffer
+        pos, offset = 0, 0
+        for page_id, fingerprint, shard, start, length in entries:
+            if start != pos:
+                f.seek(start)
+            data = f.read(length)
+            pos = start + length
+            if page_id in dropped:
+                removed.append(data)
+                continue
+            lines = rename_lines(data, rename, text.encoding)
+            if lines is not data:
+                renamed.add(page_id)
+            out.write(lines)
+            kept.append((page_id, fingerprint, shard, offset, len(lines)))
+            offset += len(lines)
+        # lines as compute_probs2 reads them from the file
+        removed = list(io.TextIOWrapper(io.BytesIO(b"".join(removed)), encoding=text.encoding))
+    return kept, removed, renamed
+
+
+def update_counts(prev_counts, removed_lines, delta_counts, rename):
+    """
+    Counts of the previous .counts file, minus the titles of removed_lines, with the titles normalized again, plus
+    delta_counts.
+    """
+    counts = Counter()
+    with open(prev_counts) as f:
+        for line in f:
+            _, title, cnt = line.rstrip("\n").split("\t")
+            counts[title] = int(cnt)
+    for line in removed_lines:
+        # the title is the last field, anchor texts may contain tabs
+        title = line.rstrip("\n").rsplit("\t", 1)[-1]
+        # titles missing from t2id were not written to the counts file
+        if title in counts:
+            counts[title] -= 1
+    negative = sum(1 for cnt in counts.values() if cnt < 0)
+    if negative:
+        logging.info("%d titles went below 0, the previous counts and the removed pages do not match", negative)
+    ans = Counter()
+    for title, cnt in counts.items():
+        title = rename(title)
+        if title is not None:
+            ans[title] += max(cnt, 0)
+    ans.update(delta_counts)
+    return ans
+
+
+def update_probs(prev_prefix, out_prefix, removed_lines, delta_links, normalizer, rename, t2id, is_redirect,
+                 redirects, lang, add_ascii=False):
+    """
+    Writes the probmap tsvs of compute_probs2 --mode all at out_prefix, from those at prev_prefix.
+    """
+    phrase_delta, word_delta = PairDelta(), PairDelta()
+    phrase_delta.sign = word_delta.sign = -1
+    read_surface_title_maps(pairs=phrase_delta, cand_file=removed_lines, normalizer=normalizer, lang=lang,
+                            add_ascii=add_ascii, word_pairs=word_delta)
+    phrase_delta.sign = word_delta.sign = 1
+    with open(delta_links) as cand_file:
+        read_surface_title_maps(pairs=phrase_delta, cand_file=cand_file, normalizer=normalizer, lang=lang,
+                                add_ascii=add_ascii, word_pairs=word_delta)
+
+    for delta, add_titles, (s2t_name, t2s_name) in [(phrase_delta, add_titles_and_redirects, PROB_FILES[0]),
+                                                    (word_delta, add_titles_and_redirects_tokens, PROB_FILES[1])]:
+        # titles and redirects pairs are redone from the new tables, what changed goes into the delta
+        tnr = ListPairCounts()
+        add_titles(pairs=tnr, t2id=t2id, is_redirect=is_redirect, redirects=redirects, lang=lang,
+                   add_ascii=add_ascii)
+        tnr.write(out_prefix + ".tnr." + s2t_name, out_prefix + ".tnr." + t2s_name)
+        delta.update({s: Counter(ts) for s, ts in tnr.s2t.items()})
+        tnr.close()
+        for s, xs in iter_x_given_y(prev_prefix + ".tnr." + s2t_name):
+            t2cnt = Counter()
+            for t, cnt in xs:
+                t = rename(t)
+                if t is not None:
+                    t2cnt[t] += cnt
+            delta.update({s: t2cnt}, sign=-1)
+        update_x_given_y(prev_prefix + "." + s2t_name, out_prefix + "." + s2t_name, delta.s2t, rename_x=rename)
+        update_x_given_y(prev_prefix + "." + t2s_name, out_prefix + "." + t2s_name, delta.t2s(), rename_y=rename)
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def page_shard(name):
+    """
+    wiki_00.jsonl.gz, wiki_00.jsonl.gz.brief --> wiki_00, None if name is not a page file.
+    """
+    if page_format(name) is None:
+        return None
+    if name.endswith(BRIEF_SUFFIX):
+        name = name[:-len(BRIEF_SUFFIX)]
+    return strip_page_suffix(name)
+
+
+def mid_shard(name):
+    return name[:-len(".csv")] if name.endswith(".csv") else None
+
+
+def rename_label(label, rename):
+    """
+    Link label of a page or MID file, renamed. NULLTITLE labels (extract_link_from_pages --preserve-null) stay, None
+    if the title is gone.
+    """
+    return label if label == K.NULL_TITLE else rename(label)
+
+
+def rewrite_page_file(src, dst, dropped, rename):
+    """
+    Copies a page file without the dropped pages, renaming the labels of the links and leaving out those whose title
+    is gone, as extract_link_from_pages does for links it cannot normalize.
+    """
+    with PageWriter(dst) as out:
+        for page in iter_page_file(src):
+            if page['curid'] in dropped:
+                continue
+            if page.get('linked_spans'):
+                spans = []
+                for span in page['linked_spans']:
+                    span['label'] = rename_label(span['label'], rename)
+                    if span['label'] is not None:
+                        spans.append(span)
+                page['linked_spans'] = spans
+            out.write(page)
+
+
+def rewrite_mid_file(src, dst, dropped, rename):
+    """
+    Copies a MID file without the rows of the dropped pages, renaming the titles of the other rows. Rows of links whose
+    title is gone are left out, and their labels taken out of the mentions of the article.
+    """
+    with open(src, encoding="utf-8") as f, open(dst, "w", encoding="utf-8") as out:
+        for line in f:
+            # MID, article id, article title, token start, token end, label, window, labels of the article
+            fields = line.rstrip("\n").split("\t")
+            if fields[1] in dropped:
+                continue
+            fields[5] = rename_label(fields[5], rename)
+            if fields[5] is None:
+                continue
+            fields[2] = rename_label(fields[2], rename) or K.NULL_TITLE
+            mentions = [rename_label(label, rename) for label in fields[7].split(" ")]
+            fields[7] = " ".join(label for label in mentions if label is not None)
+            out.write("\t".join(fields) + "\n")
+
+
+def update_shard_files(prev_dir, out_dir, shard2dropped, shard_name, rewrite):
+    """
+    Copies the files under prev_dir to out_dir. shard_name(file name) gives the shard of a file, rewrite(src, dst,
+    dropped ids) copies the file of a shard in shard2dropped without the dropped pages and with its titles renamed.
+    Files of the other shards are hard linked (copied across file systems).
+
+    Returns the number of files rewritten.
+    """
+    rewritten = 0
+    for root, _, names in os.walk(prev_dir):
+        rel = os.path.relpath(root, prev_dir)
+        os.makedirs(os.path.join(out_dir, rel), exist_ok=True)
+        for name in sorted(names):
+            src, dst = os.path.join(root, name), os.path.join(out_dir, rel, name)
+            shard = shard_name(name)
+            dropped = shard2dropped.get(os.path.normpath(os.path.join(rel, shard))) if shard is not None else None
+            if dropped is not None:
+                rewrite(src, dst, dropped)
+                rewritten += 1
+            else:
+                link_or_copy(src, dst)
+    return rewritten
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Update the outputs of a previous run to a new dump, '
+                                                 'reprocessing only the added and changed pages.')
+    parser.add_argument('--wikitext', type=str, required=True, help='wikiextractor output of the new dump')
+    parser.add_argument('--date', type=str, required=True, help='date of the new dump, names the delta shard')
+    parser.add_argument('--id2t', type=str, required=True, help='id --> title of the new dump')
+    parser.add_argument('--redirects', type=str, required=True, help='redirect --> title of the new dump')
+    parser.add_argument('--lang', type=str, required=True, help='language code')
+    parser.add_argument('--prev_links', type=str, required=True,
+                        help='previous surface links, written with count_popular_entities_v2 --index')
+    parser.add_argument('--prev_counts', type=str, required=True, help='previous .counts')
+    parser.add_argument('--prev_prob_prefix', type=str, required=True,
+                        help='previous probmap prefix (compute_probs2 --mode all), eg. probmap/trwiki-20190501')
+    parser.add_argument('--prev_pages', type=str, required=True, help='previous extract_link_from_pages output')
+    parser.add_argument('--prev_mid', type=str, required=True, help='previous create_mid output')
+    parser.add_argument('--links', type=str, required=True, help='surface links to write (and <links>.index)')
+    parser.add_argument('--counts', type=str, required=True, help='.counts to write')
+    parser.add_argument('--prob_prefix', type=str, required=True, help='probmap prefix to write')
+    parser.add_argument('--pages', type=str, required=True, help='directory to write the page files in')
+    parser.add_argument('--mid', type=str, required=True, help='directory to write the MID files in')
+    parser.add_argument('--add_ascii', action="store_true", help='as compute_probs2 --add_ascii')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted uses the mmapped <redirects>.lookup file')
+    parser.add_argument('--format', type=str, default="json", choices=PAGE_FORMATS,
+                        help='format of the page files of the delta pages')
+    parser.add_argument('--tokenizer', type=str, default="spacy", choices=TOKENIZERS, help='MID tokenizer')
+    parser.add_argument('--window', type=int, default=20, help='MID context window length')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    args = parser.parse_args()
+    args = vars(args)
+    for prev, new in [("prev_links", "links"), ("prev_counts", "counts"), ("prev_prob_prefix", "prob_prefix"),
+                      ("prev_pages", "pages"), ("prev_mid", "mid")]:
+        if os.path.abspath(args[prev]) == os.path.abspath(args[new]):
+            parser.error("--%s and --%s must differ, the previous outputs are read while the new ones are written"
+                         % (prev, new))
+    for path in [args["pages"], args["mid"]]:
+        if os.path.exists(path):
+            parser.error("%s already exists" % path)
+    lang = args["lang"]
+    if lang == "tr" and not args["add_ascii"]:
+        logging.info("Turning ascii on because its Turkish...")
+        args["add_ascii"] = True
+
+    start = time.time()
+    redirect2title = load_redirects(args["redirects"])
+    id2t, t2id, is_redirect_map = load_id2title(args["id2t"])
+    lookup = None
+    if args["lookup"] == "sorted":
+        lookup = SortedArrayLookup.for_paths(args["id2t"], args["redirects"])
+    normalizer = TitleNormalizer(lang=lang, redirect_map=redirect2title, t2id=t2id, lookup=lookup)
+    rename = renamer(normalizer)
+
+    entries = read_index(index_path(args["prev_links"]))
+    scratch = tempfile.mkdtemp(prefix="delta.", dir=os.path.dirname(os.path.abspath(args["links"])))
+    shard_dir = "delta-%s" % args["date"]
+    if os.path.exists(os.path.join(args["prev_pages"], shard_dir)):
+        raise ValueError("%s already has a %s shard" % (args["prev_pages"], shard_dir))
+    delta_text = os.path.join(scratch, "text")
+    kept, added, changed = diff_pages(args["wikitext"], {entry[0]: entry[1] for entry in entries},
+                                      os.path.join(delta_text, shard_dir))
+    dropped = set(entry[0] for entry in entries) - kept
+    logging.info("%d pages: %d unchanged, %d changed, %d added, %d removed (%.2f%% churn) in %.1f secs",
+                 len(kept) + added + changed, len(kept), changed, added, len(dropped) - changed,
+                 100.0 * (added + len(dropped)) / max(len(kept) + added + len(dropped), 1), time.time() - start)
+
+    # surface links, page index and counts
+    stage_start = time.time()
+    delta_links = os.path.join(scratch, "surface_links")
+    counter = EntityCounter(wikipath=delta_text, linksout=delta_links, contsout=None, redirect_map=redirect2title,
+                            t2id=t2id, limit=0, lookup=lookup, indexout=index_path(delta_links))
+    counter.run(workers=args["workers"])
+    with open(args["links"], "wb") as out:
+        kept_entries, removed_lines, renamed = split_links(args["prev_links"], entries, dropped, rename, out)
+        base = out.tell()
+        with open(delta_links, "rb") as f:
+            shutil.copyfileobj(f, out)
+    # shards whose page and MID files are rewritten: those with dropped pages, or pages with renamed titles
+    shard2dropped = {}
+    for page_id, _, shard, _, _ in entries:
+        if page_id in dropped:
+            shard2dropped.setdefault(shard, set()).add(page_id)
+        elif page_id in renamed:
+            shard2dropped.setdefault(shard, set())
+    del entries
+    with open(index_path(args["links"]), "w", encoding="utf-8") as out:
+        write_index_entries(out, kept_entries)
+        write_index_entries(out, [(page_id, fingerprint, shard, base + offset, length) for
+                                  page_id, fingerprint, shard, offset, length in read_index(index_path(delta_links))])
+    write_counts(args["counts"], update_counts(args["prev_counts"], removed_lines, counter.counts, rename), t2id)
+    logging.info("links and counts: %d lines removed, %d unchanged pages with renamed titles in %.1f secs",
+                 len(removed_lines), len(renamed), time.time() - stage_start)
+
+    stage_start = time.time()
+    update_probs(args["prev_prob_prefix"], args["prob_prefix"], removed_lines, delta_links, normalizer, rename, t2id,
+                 is_redirect_map, redirect2title, lang, add_ascii=args["add_ascii"])
+    logging.info("probmap in %.1f secs", time.time() - stage_start)
+
+    # page and MID files
+    stage_start = time.time()
+    rewritten = update_shard_files(args["prev_pages"], args["pages"], shard2dropped, page_shard,
+                                   lambda src, dst, dropped: rewrite_page_file(src, dst, dropped, rename))
+    rewritten += update_shard_files(args["prev_mid"], args["mid"], shard2dropped, mid_shard,
+                                    lambda src, dst, dropped: rewrite_mid_file(src, dst, dropped, rename))
+    if added + changed > 0:
+        delta_pages = os.path.join(scratch, "pages")
+        extract_links(dump_prefix=delta_text, out=delta_pages, encoding="utf-8", normalizer=normalizer,
+                      ignore_null=True, fmt=args["format"], workers=args["workers"])
+        create_mids(link_dump_prefix=delta_pages, out=args["mid"], encoding="utf-8", lang=lang,
+                    window=args["window"], normalizer=normalizer, tokenizer=args["tokenizer"],
+                    workers=args["workers"])
+        shutil.move(os.path.join(delta_pages, shard_dir), os.path.join(args["pages"], shard_dir))
+    logging.info("pages and MIDs: %d files rewritten in %.1f secs", rewritten, time.time() - stage_start)
+    shutil.rmtree(scratch)
+    logging.info("updated to %s in %.1f secs", args["date"], time.time() - start)
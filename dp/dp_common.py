@@ -1,5 +1,18 @@
 import gzip
 import logging
+import re
+
+
+def open_dump(filename, mode="rb", encoding=None, errors=None):
+    """
+    Open a (possibly gzipped) sql dump. Binary mode by default, text mode if mode is "rt".
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode, encoding=encoding, errors=errors)
+    if "t" in mode:
+        return open(filename, "r", encoding=encoding, errors=errors)
+    return open(filename, "rb")
+
 
 def parse_schema(filename, encoding):
     """
@@ -22,7 +35,7 @@ def parse_schema(filename, encoding):
     """
     schema = {}
     logging.info("Parsing schema for %s", filename)
-    f = gzip.open(filename, "rt", encoding=encoding)
+    f = open_dump(filename, "rt", encoding=encoding)
     start_parse = False
     fields = []
     for line in f:
@@ -75,3 +88,132 @@ def split_str(split_char, split_str):
         i += 1
     return_list.append(split_str[last_pos:])
     return return_list
+
+
+# one quoted string (with backslash escapes) or one bare value (number, NULL)
+_SQL_VALUE = rb"'[^'\\]*(?:\\.[^'\\]*)*'|[^,()']+"
+# one (v1,v2,...) tuple of a VALUES list, of any width
+_SQL_TUPLE = re.compile(rb"\((?:" + _SQL_VALUE + rb")(?:,(?:" + _SQL_VALUE + rb"))*\)")
+_SQL_FIELD = re.compile(_SQL_VALUE)
+_SQL_ESCAPE = re.compile(rb"\\(.)", re.DOTALL)
+_SQL_ESCAPES = {b"0": b"\0", b"b": b"\b", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"Z": b"\x1a"}
+
+
+def _unescape(value):
+    return _SQL_ESCAPE.sub(lambda m: _SQL_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def _tuple_regex(width, columns):
+    """
+    Regex matching a tuple of exactly `width` fields, capturing only the fields in `columns`.
+    """
+    fields = [(b"(" if i in columns else b"(?:") + _SQL_VALUE + b")" for i in range(width)]
+    return re.compile(rb"\(" + b",".join(fields) + rb"\)")
+
+
+class SqlInsertReader:
+    """
+    Streams the tuples of all `INSERT INTO ... VALUES (...),(...);` statements of a mysql dump.
+
+    The dump is read as bytes, straight from the gzip stream, and each tuple is tokenized with compiled regexes,
+    so quotes, commas, parentheses and backslash escapes inside strings are handled correctly (e.g. a title
+    containing "),(" does not split the tuple). When the width is known, one regex per schema matches a whole
+    tuple and captures only the requested columns.
+
+    Parameters
+    -------------
+    filename: str
+        Path to the *.sql.gz (or uncompressed *.sql) file
+    columns: list of int
+        Zero-indexed fields to yield (e.g. from parse_schema). All fields are yielded if None.
+    width: int
+        Expected number of fields per tuple. Tuples of any other width are counted in `bad` and skipped.
+    encoding, errors: str
+        Used to decode quoted strings.
+
+    Yields
+    -------------
+    Tuples of typed values: quoted strings become str (unescaped), NULL becomes None, numbers become int or float.
+    """
+
+    def __init__(self, filename, columns=None, width=None, encoding="utf-8", errors="strict"):
+        self.filename = filename
+        self.columns = columns
+        self.width = width
+        self.encoding = encoding
+        self.errors = errors
+        self.total = 0
+        self.bad = 0
+        self._tuple = None
+        if width is not None:
+            if columns is None:
+                columns = range(width)
+            self._tuple = _tuple_regex(width, set(columns))
+            # regex groups are numbered in field order, map them back to the requested column order
+            order = sorted(set(columns))
+            self._groups = [order.index(c) for c in columns]
+
+    def _convert(self, value):
+        if value[:1] == b"'":
+            value = value[1:-1]
+            if b"\\" in value:
+                value = _unescape(value)
+            return value.decode(self.encoding, self.errors)
+        if value == b"NULL":
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    def parse_line(self, line):
+        """
+        Returns the list of typed tuples in one INSERT line (empty for any other line).
+        """
+        if not line.startswith(b"INSERT INTO"):
+            return []
+        if self._tuple is None:
+            return self._parse_any_width(line)
+        ans = []
+        convert, groups = self._convert, self._groups
+        match_tuple = self._tuple.match
+        pos = line.index(b"(")
+        while True:
+            m = match_tuple(line, pos)
+            self.total += 1
+            if m is None:
+                # skip over a tuple of the wrong width
+                m = _SQL_TUPLE.match(line, pos)
+                if m is None:
+                    logging.info("could not parse tuple at offset %d, skipping rest of line", pos)
+                    self.bad += 1
+                    break
+                self.bad += 1
+            else:
+                values = m.groups()
+                ans.append(tuple([convert(values[g]) for g in groups]))
+            pos = m.end()
+            if line[pos:pos + 1] != b",":
+                break
+            pos += 1
+        return ans
+
+    def _parse_any_width(self, line):
+        ans = []
+        convert, columns = self._convert, self.columns
+        for m in _SQL_TUPLE.finditer(line, line.index(b"(")):
+            fields = _SQL_FIELD.findall(m.group(0), 1, m.end() - m.start() - 1)
+            self.total += 1
+            if columns is None:
+                ans.append(tuple([convert(v) for v in fields]))
+            elif len(fields) <= max(columns):
+                self.bad += 1
+            else:
+                ans.append(tuple([convert(fields[c]) for c in columns]))
+        return ans
+
+    def __iter__(self):
+        with open_dump(self.filename) as f:
+            for line in f:
+                for tup in self.parse_line(line):
+                    yield tup
@@ -1,18 +1,22 @@
 # coding=utf-8
-from bs4 import BeautifulSoup
-from dp.title_normalizer import TitleNormalizer
+from bs4 import BeautifulSoup, NavigableString, CData
+from dp.title_normalizer import TitleNormalizer, CACHE_POLICIES
 from utils.misc_utils import load_id2title, load_redirects
-from multiprocessing import Process
+from utils.title_lookup import SortedArrayLookup
+from utils.page_json import PAGE_FORMATS, BRIEF_SUFFIX, PageWriter
+import multiprocessing
 import argparse
 import sys
 import os
-import json
-import copy
 import logging
+import time
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 import urllib.parse
 
+# string types that Tag.get_text() concatenates
+_TEXT_TYPES = (NavigableString, CData)
+
 """
 Class that encapsulates information about one link
 """
@@ -63,7 +67,28 @@ class LinkInfo:
 
 
 """
-Extract link information from one file and dumps into json outputs
+Yields the text of every <doc ...> ... </doc> block of a wikiextractor file, so that each page is parsed on its own
+
+Parameters
+------------------
+f: file
+    Open wikiextractor output file
+"""
+def iter_doc_blocks(f):
+    block = None
+    for line in f:
+        if block is None:
+            if line.startswith("<doc "):
+                block = [line]
+        else:
+            block.append(line)
+            if line.startswith("</doc>"):
+                yield "".join(block)
+                block = None
+
+
+"""
+Extract link information from one file and dumps into json outputs, one page at a time
 
 Parameters
 ------------------
@@ -72,7 +97,7 @@ file_path: str
 encoding: str
     Encoding of the input file
 out_path: str
-    Output file path, should be a complete path
+    Output file path, should be a complete path. Its extension picks the format, one of utils.page_json.PAGE_FORMATS
 normalizer: TitleNormalizer object
     Normalizer to use to normalize the the titles
 ignore_null: Bool
@@ -89,100 +114,117 @@ Outputs two file, one named `out_path`, containing a list of page with their tex
 Another named `out_path.brief`, where linked_span info is omitted
 """
 def extract_from_one_file(file_path, encoding, out_path, normalizer, ignore_null):
-    pages = []
-    pages_brief = []
     doc_count = 0
-    with open(file_path, 'r', encoding=encoding) as f:
-        soup = BeautifulSoup(f, "html.parser", from_encoding='utf-8')
-        for doc in soup.find_all('doc'):
-            doc_count += 1
-            this_page = {}
-            this_page['curid'] = doc['id']
-            this_page['title'] = doc['title']
-            this_page['text'] = doc.get_text()
-            pages_brief.append(copy.copy(this_page))
-            this_page['linked_spans'] = []
-
-            list_of_links = []
-            next_search_pos = 0
-
-            for c in doc.contents:
-                # node is link:
-                if c.name == 'a':
-                    prev_node = c.previous_sibling
-                    next_node = c.next_sibling
-                    if prev_node is None and next_node is None:
-                        raise RuntimeError("Page contained one link and nothing else, is data corrupted?")
-                    # Skip the links that has its text section as nested tag (for example, the <nowiki> links)
-                    if len(c.contents) != 1:
-                        continue
-                    if c.contents[0].name is not None:
-                        continue
-
-                    # Text of the link, for instance, in the link <a href=xxx>link</a>, text is 'link'
-                    link_text = c.contents[0]
-
-                    # The text of previous node (usually just text paragraph), the link node's text, and the next node's text will uniquely identify the location of the link in the text
-                    # For instance, if we have the following selection from an article:
-                    # 
-                    # Consider this <a href='Article'>article</a> which contains a link
-                    #
-                    # In the case above, link node would be <a href='Article'>article</a>, prev_node would be the string 'Consider this ', and next_node would be ' which contains a link'
-                    # The assembled search string would be 'Consider this article which contains a link'. Searching that in the processed text of the web page would give us the location of the search string
-                    # We then add length of the prev_node to that location to get the location of the link
-                    # Notice that there is a chance that this search string may appear more than once. For this purpose, we keep a record of last search position and starts every new search from that. 
-                    prev_node_search_str = ""
-                    if prev_node is not None:
-                        if prev_node.name is None:
-                            prev_node_search_str = prev_node
-                        else:
-                            # handle the case when the prev_node is also a link
-                            prev_node.get_text()
-                    next_node_search_str = ""
-                    if next_node is not None:
-                        if next_node.name is None:
-                            next_node_search_str = next_node
-                        else:
-                            next_node.get_text()
-                    link_and_adjacent_text_search_str = prev_node_search_str + link_text + next_node_search_str;        
-                    loc = this_page['text'].find(link_and_adjacent_text_search_str,
-                                                 next_search_pos)
-                    next_search_pos = loc + 1
-                    this_link_info = LinkInfo(link_text, c['href'])
-                    this_link_info.set_location(loc + len(prev_node_search_str))
-                    link_result = this_link_info.as_result()
-
-                    actual_partition = this_page['text'][link_result['start']:link_result['end']]
-                    # check if the parsed location is correct
-                    if actual_partition != this_link_info.text():
-                        logging.warning('got in text: %s, expected %s' % (actual_partition, link_result['label']))
-                    else:
-                        link_result['label'] = normalizer.normalize(link_result['label'])
-                        if not ignore_null:
-                            list_of_links.append(link_result)
-                        else:
-                            if link_result['label'] != 'NULLTITLE':
-                                list_of_links.append(link_result)
-
-            # if there are no links, we can move onto the next doc
-            if len(list_of_links) == 0:
-                logging.debug("Page titled %s in file %s has no links" % (this_page['title'], file_path))
-                pages.append(this_page)
+    stats = {}
+    dir_to_write = os.path.dirname(out_path)
+    os.makedirs(dir_to_write, exist_ok=True)
+    with open(file_path, 'r', encoding=encoding) as f, PageWriter(out_path) as pages, \
+            PageWriter(out_path + BRIEF_SUFFIX) as pages_brief:
+        for block in iter_doc_blocks(f):
+            soup = BeautifulSoup(block, "html.parser")
+            for doc in soup.find_all('doc'):
+                doc_count += 1
+                this_page = extract_page(doc, file_path, normalizer, ignore_null, stats)
+                pages_brief.write({'curid': this_page['curid'], 'title': this_page['title'],
+                                   'text': this_page['text']})
+                pages.write(this_page)
+    logging.info("%s: %d pages, %d links, %d offset mismatches", file_path, doc_count, stats.get("links", 0),
+                 stats.get("mismatches", 0))
+    return doc_count
+
+
+"""
+Extract the text and the links of one <doc> node
+
+The text of the page is doc.get_text(), the concatenation of the strings under the doc. Walking the children of the
+doc once with a running cursor over that text gives the start of every link directly, instead of searching for it.
+
+Parameters
+------------------
+stats: dict
+    If given, counts the "links" located and the "mismatches" where the text at the computed span is not the link
+    text (should stay 0)
+
+Returns
+-------------------
+Dictionary with the curid, title, text and linked_spans of the page
+"""
+def extract_page(doc, file_path, normalizer, ignore_null, stats=None):
+    this_page = {}
+    this_page['curid'] = doc['id']
+    this_page['title'] = doc['title']
+    this_page['text'] = doc.get_text()
+    this_page['linked_spans'] = []
+
+    list_of_links = []
+    links, mismatches = 0, 0
+    cursor = 0
+
+    for c in doc.contents:
+        if c.name is None:
+            # get_text() only keeps plain strings, not comments and the like
+            if type(c) in _TEXT_TYPES:
+                cursor += len(c)
+            continue
+        start = cursor
+        # the text of a <style>, <script> or <template> child is not part of doc.get_text(), but is in its own
+        cursor += len(c.get_text(types=_TEXT_TYPES))
+        # node is link:
+        if c.name == 'a':
+            if c.previous_sibling is None and c.next_sibling is None:
+                raise RuntimeError("Page contained one link and nothing else, is data corrupted?")
+            # Skip the links that has its text section as nested tag (for example, the <nowiki> links)
+            if len(c.contents) != 1:
                 continue
+            if c.contents[0].name is not None:
+                continue
+
+            # Text of the link, for instance, in the link <a href=xxx>link</a>, text is 'link'
+            link_text = c.contents[0]
+            this_link_info = LinkInfo(link_text, c['href'])
+            this_link_info.set_location(start)
+            link_result = this_link_info.as_result()
+            links += 1
+
+            actual_partition = this_page['text'][link_result['start']:link_result['end']]
+            # check if the parsed location is correct
+            if actual_partition != this_link_info.text():
+                mismatches += 1
+                logging.warning('got in text: %s, expected %s' % (actual_partition, link_result['label']))
             else:
-                this_page['linked_spans'] = list_of_links
+                link_result['label'] = normalizer.normalize(link_result['label'])
+                if not ignore_null:
+                    list_of_links.append(link_result)
+                else:
+                    if link_result['label'] != 'NULLTITLE':
+                        list_of_links.append(link_result)
 
-            pages.append(this_page)
+    if stats is not None:
+        stats["links"] = stats.get("links", 0) + links
+        stats["mismatches"] = stats.get("mismatches", 0) + mismatches
+    # if there are no links, we can move onto the next doc
+    if len(list_of_links) == 0:
+        logging.debug("Page titled %s in file %s has no links" % (this_page['title'], file_path))
+    else:
+        this_page['linked_spans'] = list_of_links
+    return this_page
 
-    dir_to_write = os.path.dirname(out_path)
-    os.makedirs(dir_to_write, exist_ok=True)
-    with open(out_path, 'w') as out_f:
-        # out_f.write(json.dumps(pages, indent=4))
-        json.dump(pages, out_f, ensure_ascii=False, indent=4)
-    with open("%s.brief" % out_path, 'w') as out_f:
-        # out_f.write(json.dumps(pages_brief, indent=4))
-        json.dump(pages_brief, out_f, ensure_ascii=False, indent=4)
-    return doc_count
+
+# normalizer shared by the file tasks of one pool worker
+_worker_normalizer = None
+
+
+def _init_worker(normalizer):
+    global _worker_normalizer
+    _worker_normalizer = normalizer
+
+
+def _extract_task(task):
+    file_path, out_path, encoding, ignore_null = task
+    start = time.time()
+    num_articles = extract_from_one_file(file_path, encoding, out_path, _worker_normalizer, ignore_null)
+    _worker_normalizer.log_stats()
+    return os.getpid(), num_articles, time.time() - start
 
 
 """
@@ -190,7 +232,7 @@ Extract link information from one directory and dumps into json outputs
 
 Parameters, Returns and Side Effect similar to extract_from_one_file
 """
-def extract_from_one_directory(directory, out, encoding, normalizer, ignore_null):
+def extract_from_one_directory(directory, out, encoding, normalizer, ignore_null, fmt="json"):
     all_files = []
     for f in os.listdir(path=directory):
         full_path = os.path.join(directory, f)
@@ -199,8 +241,9 @@ def extract_from_one_directory(directory, out, encoding, normalizer, ignore_null
     for wiki in all_files:
         original_dir = os.path.basename(os.path.dirname(wiki))
         original_file_name = os.path.basename(wiki)
-        num_articles += extract_from_one_file(wiki, encoding, os.path.join(out, "%s/%s.json" % (original_dir, original_file_name)),
+        num_articles += extract_from_one_file(wiki, encoding, os.path.join(out, "%s/%s.%s" % (original_dir, original_file_name, fmt)),
                               normalizer, ignore_null)
+        normalizer.log_stats()
     logging.info("Process with pid %d finished, processed %d files and %d articles" % (os.getpid(), len(all_files), num_articles))
 
 """
@@ -219,6 +262,10 @@ normalizer: TitleNormalizer object
 ignore_null: Bool
     If ignore_null is set to True, output will not contain titles that cannot be normalized through the normalizer. 
     Otherwise, NULLTITLE will be included in the output file
+fmt: str
+    Output format, one of utils.page_json.PAGE_FORMATS
+workers: int
+    Number of worker processes, defaults to the number of CPUs
 
 Returns
 -------------------
@@ -229,28 +276,48 @@ Side Effect
 Outputs N*2 files, where N is number of files under input directory's subdirs. 
 For each file, two json output will be produced, as specified by extract_from_one_file function
 
-It will create one process per subdirectory to parallelize the work 
-On most systems the default behavior will most likely utilize all the cores available.
+Files (largest first) are handed out one at a time to a pool of workers, so no worker idles while another works
+through a big directory. The normalizer reaches each worker once, when the pool starts.
 """       
-def extract_links(dump_prefix, out, encoding, normalizer, ignore_null):
+def extract_links(dump_prefix, out, encoding, normalizer, ignore_null, fmt="json", workers=None):
     dump_prefix_abs = os.path.abspath(dump_prefix)
-    all_files = []
-    all_dirs = []
-    for directory in os.listdir(path=dump_prefix_abs):
+    tasks = []
+    for directory in sorted(os.listdir(path=dump_prefix_abs)):
         subdir = os.path.join(dump_prefix_abs, directory)
         # Should not append non directory file to path
-        if os.path.isdir(subdir):
-            all_dirs.append(subdir)
-    ps = []
-    for directory in all_dirs:
-        # Start one process per subdirectory
-        proc = Process(target=extract_from_one_directory, args=(directory, out, encoding, normalizer, ignore_null));
-        ps.append(proc)
-        logging.info("Started new process to handle directory %s" % directory)
-    for p in ps:
-        p.start()
-    for p in ps:
-        p.join()
+        if not os.path.isdir(subdir):
+            continue
+        for f in sorted(os.listdir(path=subdir)):
+            wiki = os.path.join(subdir, f)
+            out_path = os.path.join(out, "%s/%s.%s" % (directory, f, fmt))
+            tasks.append((wiki, out_path, encoding, ignore_null))
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+    workers = workers or multiprocessing.cpu_count()
+    logging.info("extracting links from %d files with %d workers", len(tasks), workers)
+
+    start = time.time()
+    worker_stats = {}
+    if workers == 1:
+        _init_worker(normalizer)
+        results = map(_extract_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(normalizer,))
+        results = pool.imap_unordered(_extract_task, tasks)
+    for pid, num_articles, secs in results:
+        files, pages, busy = worker_stats.get(pid, (0, 0, 0.0))
+        worker_stats[pid] = (files + 1, pages + num_articles, busy + secs)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    secs = time.time() - start
+    for pid in sorted(worker_stats):
+        files, pages, busy = worker_stats[pid]
+        logging.info("worker %d: %d files, %d pages in %.1f secs, %.1f pages/sec", pid, files, pages, busy,
+                     pages / max(busy, 1e-9))
+    total = sum(pages for _, pages, _ in worker_stats.values())
+    logging.info("extracted %d pages from %d files in %.1f secs, %.1f pages/sec", total, len(tasks), secs,
+                 total / max(secs, 1e-9))
 
 
 if __name__ == "__main__":
@@ -263,13 +330,31 @@ if __name__ == "__main__":
     parser.add_argument('--redirects', type=str, required=True, help='redirect --> title')
     parser.add_argument('--lang', type=str, required=True, help='language code')
     parser.add_argument('--preserve-null', type=str, required=False, help='if ignore null links in output')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted uses the mmapped <redirects>.lookup file')
+    parser.add_argument('--cache_size', type=int, default=0,
+                        help='memoize this many normalized titles (0 disables the cache)')
+    parser.add_argument('--cache_policy', type=str, default="lru", choices=CACHE_POLICIES,
+                        help='eviction policy of the normalization cache')
+    parser.add_argument('--format', type=str, default="json", choices=PAGE_FORMATS,
+                        help='json writes one array per file, jsonl one page per line (optionally compressed)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
     args = parser.parse_args()
     args = vars(args)
-    redirect2title = load_redirects(args["redirects"])
-    id2t, t2id, is_redirect_map = load_id2title(args["id2t"])
+    redirect2title, t2id, lookup = None, None, None
+    if args["lookup"] == "sorted":
+        # the workers share the mmapped lookup, the dicts are not loaded at all
+        lookup = SortedArrayLookup.for_paths(args["id2t"], args["redirects"])
+    else:
+        redirect2title = load_redirects(args["redirects"])
+        id2t, t2id, is_redirect_map = load_id2title(args["id2t"])
     normalizer = TitleNormalizer(lang=args['lang'],
                                  redirect_map=redirect2title,
-                                 t2id=t2id)
+                                 t2id=t2id,
+                                 lookup=lookup,
+                                 cache_size=args["cache_size"],
+                                 cache_policy=args["cache_policy"])
     extract_links(dump_prefix=args["dump"], out=args["out"], encoding="utf-8", normalizer=normalizer,
-                  ignore_null='preserve-null' not in args)
+                  ignore_null='preserve-null' not in args, fmt=args["format"], workers=args["workers"])
 
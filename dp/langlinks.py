@@ -4,8 +4,8 @@ import logging
 import sys
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
-import gzip
 from dp.create_redirect2title import load_id2title
+from dp.dp_common import parse_schema, SqlInsertReader
 
 
 def read_frid2en(filename, target_lang, encoding):
@@ -15,33 +15,18 @@ def read_frid2en(filename, target_lang, encoding):
     logging.info("Reading lang links %s", filename)
     id2en = {}
     all_lang_map = []
-    if filename.endswith(".gz"):
-        f = gzip.open(filename, "rt", encoding=encoding, errors="ignore")
-    else:
-        f = open(filename, "r", errors='ignore')
-    for line in f:
-        if "INSERT INTO" not in line:
-            continue
-        # (150055,'en','Idanha-a-Nova'),(5954745,'en','Idanre')
-        start = line.index("(")
-        line = line[start + 1:]
-        parts = line.split("),(")
-        # [ (150055,'en','Idanha-a-Nova' , 5954745,'en','Idanre')]
-        for t in parts:
-            ts = t.split(",'")
-            # [(150055, en', Idanha-a-Nova']
-            if len(ts) < 3: continue
-            fr_page_id, lang, en_title = ts[0], ts[1], ts[2]
-            lang = lang[:len(lang) - 1]  # strip the extra '
-            en_title = en_title[:len(en_title) - 1]  # strip the extra '
-            en_title = en_title.replace(" ", "_")
-            if "\\" in en_title:
-                en_title = en_title.replace("\\", "")
-            # en_title = str(en_title,"utf-8")
-            # en_title = en_title.encode(encoding).decode("utf-8")
-            all_lang_map.append((fr_page_id, lang, en_title))
-            if lang == target_lang:
-                id2en[fr_page_id] = en_title
+    schema = parse_schema(filename, encoding)
+    # (150055,'en','Idanha-a-Nova'),(5954745,'en','Idanre')
+    columns = [schema.get('ll_from', 0), schema.get('ll_lang', 1), schema.get('ll_title', 2)]
+    reader = SqlInsertReader(filename, columns=columns, width=len(schema) or None, encoding=encoding,
+                             errors="ignore")
+    for fr_page_id, lang, en_title in reader:
+        fr_page_id = str(fr_page_id)
+        en_title = en_title.replace(" ", "_")
+        all_lang_map.append((fr_page_id, lang, en_title))
+        if lang == target_lang:
+            id2en[fr_page_id] = en_title
+    logging.info("read %d langlinks, %d bad", reader.total, reader.bad)
     return id2en, all_lang_map
 
 
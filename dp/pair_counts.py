@@ -0,0 +1,398 @@
+# coding=utf-8
+"""
+Accumulators for the (surface, title) pairs counted by compute_probs2.
+
+Both directions of a pair are counted, and write() emits p(title | surface) and p(surface | title) files with lines
+    y <tab> x <tab> p(x|y) <tab> count(x,y)/count(y)
+
+snapshot() marks the pairs added so far (eg. the titles and redirects before the links), and write(..., snapshot=mark)
+writes the files as they were at that mark, without a write pass at the time of the snapshot.
+
+ListPairCounts keeps the original dict-of-lists in memory (~20-25G for enwiki). InternedPairCounts interns surfaces and
+titles to int32 ids and counts the pairs in NumPy arrays. SpillPairCounts hash-partitions the pairs into spill files on
+disk and counts one partition at a time, so memory is bounded by the size of a partition.
+
+PairDelta and update_x_given_y update the files of a previous run by signed counts instead (see dp.delta_update).
+"""
+from __future__ import division
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from array import array
+from collections import Counter
+
+import numpy as np
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+__author__ = 'Shyam'
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)b?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "k": 2 ** 10, "m": 2 ** 20, "g": 2 ** 30, "t": 2 ** 40}
+
+# counting a partition in a dict of Counters takes roughly this many bytes of memory per byte of spill file
+SPILL_EXPANSION = 8
+# partitions still over budget are split again, at most this many times
+MAX_SPLIT_DEPTH = 3
+
+PAIR_COUNTS = ["list", "interned", "spill"]
+
+
+def parse_size(size):
+    """
+    "16G", "512M", "2.5g", "1048576" --> number of bytes.
+    """
+    m = _SIZE.match(str(size))
+    if m is None:
+        raise ValueError("cannot parse size %s, expected eg. 16G or 512M" % size)
+    return int(float(m.group(1)) * _UNITS[m.group(2).lower()])
+
+
+def write_x_given_y(out, y2x2cnt):
+    """
+    y2x2cnt yields (y, Counter of x), lines are written in the iteration order of both.
+    """
+    for y, x2cnt in y2x2cnt:
+        total = sum(x2cnt.values())
+        for x in x2cnt:
+            prob = x2cnt[x] / total
+            buf = "%s\t%s\t%f\t%d/%d\n" % (y, x, prob, x2cnt[x], total)
+            out.write(buf)
+
+
+def _read_lines(f, size):
+    """
+    Lines of the first size bytes of a binary file.
+    """
+    for line in f:
+        size -= len(line)
+        if size < 0:
+            break
+        yield line
+
+
+class ListPairCounts:
+    """
+    In memory, surface --> list of titles and title --> list of surfaces. Lines come out in first-seen order.
+    """
+
+    def __init__(self):
+        self.s2t = {}
+        self.t2s = {}
+
+    def add(self, s, t):
+        if s not in self.s2t: self.s2t[s] = []
+        self.s2t[s].append(t)
+        if t not in self.t2s: self.t2s[t] = []
+        self.t2s[t].append(s)
+
+    def snapshot(self):
+        # lists are only appended to, the state at the mark is a prefix of every list
+        return ({y: len(xs) for y, xs in self.s2t.items()}, {y: len(xs) for y, xs in self.t2s.items()})
+
+    def write(self, s2t_path, t2s_path, snapshot=None):
+        if snapshot is None:
+            snapshot = (None, None)
+        for path, y2x, y2len in [(s2t_path, self.s2t, snapshot[0]), (t2s_path, self.t2s, snapshot[1])]:
+            if path is None:
+                continue
+            start = time.time()
+            with open(path, "w") as out:
+                if y2len is None:
+                    write_x_given_y(out, ((y, Counter(y2x[y])) for y in y2x))
+                else:
+                    write_x_given_y(out, ((y, Counter(y2x[y][:n])) for y, n in y2len.items()))
+            logging.info("wrote %s in %d secs", path, time.time() - start)
+
+    def close(self):
+        self.s2t, self.t2s = {}, {}
+
+
+class InternedPairCounts:
+    """
+    Surfaces and titles are interned to int32 ids in first-seen order, and each pair is appended to two int32 arrays.
+    Every flush_every pairs the buffer is folded into the unique pairs seen so far, kept as packed 64-bit keys
+    (surface_id << 32 | title_id) with their count and the position of their first occurrence.
+
+    Both directions are written from the same counts. Sorting by (y, first occurrence) gives the lines in the order
+    ListPairCounts writes them, so the files are identical.
+    """
+
+    def __init__(self, flush_every=2 ** 24):
+        self.flush_every = flush_every
+        self.s2id, self.surfaces = {}, []
+        self.t2id, self.titles = {}, []
+        self.buf_s, self.buf_t = array("i"), array("i")
+        self.pairs = 0
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.first = np.zeros(0, dtype=np.int64)
+
+    def add(self, s, t):
+        sid = self.s2id.get(s)
+        if sid is None:
+            sid = self.s2id[s] = len(self.surfaces)
+            self.surfaces.append(s)
+        tid = self.t2id.get(t)
+        if tid is None:
+            tid = self.t2id[t] = len(self.titles)
+            self.titles.append(t)
+        self.buf_s.append(sid)
+        self.buf_t.append(tid)
+        if len(self.buf_s) >= self.flush_every:
+            self._flush()
+
+    def _flush(self):
+        if len(self.buf_s) == 0:
+            return
+        sids = np.frombuffer(self.buf_s, dtype=np.int32).astype(np.int64)
+        tids = np.frombuffer(self.buf_t, dtype=np.int32).astype(np.int64)
+        keys = np.concatenate([self.keys, (sids << 32) | tids])
+        counts = np.concatenate([self.counts, np.ones(len(sids), dtype=np.int64)])
+        first = np.concatenate([self.first, np.arange(self.pairs, self.pairs + len(sids), dtype=np.int64)])
+        self.pairs += len(sids)
+        self.buf_s, self.buf_t = array("i"), array("i")
+        # stable sort on key keeps the earliest position of a pair first in its run
+        order = np.argsort(keys, kind="stable")
+        keys, counts, first = keys[order], counts[order], first[order]
+        self.keys, starts = np.unique(keys, return_index=True)
+        self.counts = np.add.reduceat(counts, starts)
+        self.first = first[starts]
+
+    def snapshot(self):
+        self._flush()
+        return self.keys.copy(), self.counts.copy(), self.first.copy(), self.pairs
+
+    def write(self, s2t_path, t2s_path, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        keys, pair_counts, first, num_pairs = snapshot
+        sids = keys >> 32
+        tids = keys & 0xffffffff
+        for path, ys, xs, y_names, x_names in [(s2t_path, sids, tids, self.surfaces, self.titles),
+                                               (t2s_path, tids, sids, self.titles, self.surfaces)]:
+            if path is None:
+                continue
+            start = time.time()
+            order = np.lexsort((first, ys))
+            ys_sorted, xs_sorted, counts = ys[order], xs[order], pair_counts[order]
+            totals = np.bincount(ys_sorted, weights=counts).astype(np.int64)[ys_sorted]
+            with open(path, "w") as out:
+                for y, x, cnt, total in zip(ys_sorted.tolist(), xs_sorted.tolist(), counts.tolist(),
+                                            totals.tolist()):
+                    out.write("%s\t%s\t%f\t%d/%d\n" % (y_names[y], x_names[x], cnt / total, cnt, total))
+            logging.info("wrote %s from %d pairs (%d unique) in %d secs", path, num_pairs, len(keys),
+                         time.time() - start)
+
+    def close(self):
+        self.__init__(self.flush_every)
+
+
+class SpillPairCounts:
+    """
+    Every pair is appended to two spill files, one picked by crc32(surface) for p(title | surface) and one by
+    crc32(title) for p(surface | title), so all lines of one y land in the same partition. write() counts the
+    partitions one by one; a partition whose spill file would need more than max_memory to count is split again on a
+    salted hash first.
+
+    Lines of a y are written in first-seen order as ListPairCounts does, but the y's are grouped by partition, so the
+    files have the same lines in a different order.
+
+    The spill files are kept until close(), so write() can be called again after more pairs are added. Pairs are
+    only appended, so a snapshot is the size of every spill file and is counted from their prefixes.
+    """
+
+    def __init__(self, max_memory, spill_dir=None, partitions=None):
+        self.max_memory = max_memory
+        if partitions is None:
+            # expect the spill of one direction to be up to ~20G
+            partitions = max(16, min(128, 20 * 2 ** 30 * SPILL_EXPANSION // max(max_memory, 1)))
+        self.partitions = partitions
+        self.spill_dir = tempfile.mkdtemp(prefix="pairs.", dir=spill_dir)
+        self.pairs = 0
+        self.spills = {}
+        for direction in ["s2t", "t2s"]:
+            self.spills[direction] = [open(self._spill_path(direction, k), "wb", buffering=2 ** 16)
+                                      for k in range(partitions)]
+        logging.info("spilling pairs to %d partitions in %s, memory budget %d MB", partitions, self.spill_dir,
+                     max_memory // 2 ** 20)
+
+    def _spill_path(self, direction, k):
+        return os.path.join(self.spill_dir, "%s.%04d" % (direction, k))
+
+    def add(self, s, t):
+        s, t = s.encode("utf-8"), t.encode("utf-8")
+        self.spills["s2t"][zlib.crc32(s) % self.partitions].write(s + b"\t" + t + b"\n")
+        self.spills["t2s"][zlib.crc32(t) % self.partitions].write(t + b"\t" + s + b"\n")
+        self.pairs += 1
+
+    def snapshot(self):
+        sizes = {}
+        for direction in self.spills:
+            for spill in self.spills[direction]:
+                spill.flush()
+            sizes[direction] = [os.path.getsize(spill.name) for spill in self.spills[direction]]
+        return sizes, self.pairs
+
+    def write(self, s2t_path, t2s_path, snapshot=None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        sizes, num_pairs = snapshot
+        for direction, path in [("s2t", s2t_path), ("t2s", t2s_path)]:
+            if path is None:
+                continue
+            start = time.time()
+            with open(path, "w") as out:
+                for k, spill in enumerate(self.spills[direction]):
+                    spill.flush()
+                    self._count_spill(spill.name, out, depth=0, size=sizes[direction][k])
+            logging.info("wrote %s from %d pairs (%d MB spilled) in %d secs", path, num_pairs,
+                         sum(sizes[direction]) // 2 ** 20, time.time() - start)
+
+    def _count_spill(self, path, out, depth, size=None):
+        # only the first size bytes of the file belong to the snapshot
+        if size is None:
+            size = os.path.getsize(path)
+        if size * SPILL_EXPANSION > self.max_memory and depth < MAX_SPLIT_DEPTH:
+            self._split_spill(path, out, depth, size)
+            return
+        if size * SPILL_EXPANSION > self.max_memory:
+            logging.info("partition %s (%d MB) is over the memory budget after %d splits, a few y's must have "
+                         "too many pairs", path, size // 2 ** 20, depth)
+        y2x2cnt = {}
+        with open(path, "rb") as spill:
+            for line in _read_lines(spill, size):
+                y, x = line[:-1].split(b"\t")
+                if y not in y2x2cnt:
+                    y2x2cnt[y] = Counter()
+                y2x2cnt[y][x] += 1
+        write_x_given_y(out, ((y.decode("utf-8"), Counter({x.decode("utf-8"): cnt for x, cnt in x2cnt.items()}))
+                              for y, x2cnt in y2x2cnt.items()))
+
+    def _split_spill(self, path, out, depth, size):
+        # sub-partitions are read in order, so a y keeps the relative order of its lines
+        salt = b"%d" % (depth + 1)
+        parts = self.partitions
+        sub_paths = ["%s.%d.%04d" % (path, depth + 1, k) for k in range(parts)]
+        subs = [open(sub_path, "wb", buffering=2 ** 16) for sub_path in sub_paths]
+        with open(path, "rb") as spill:
+            for line in _read_lines(spill, size):
+                y = line[:line.index(b"\t")]
+                subs[zlib.crc32(salt + y) % parts].write(line)
+        for sub in subs:
+            sub.close()
+        for sub_path in sub_paths:
+            self._count_spill(sub_path, out, depth + 1)
+            os.remove(sub_path)
+
+    def close(self):
+        for direction in self.spills:
+            for spill in self.spills[direction]:
+                spill.close()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+class PairDelta:
+    """
+    Signed counts of (surface, title) pairs, surface --> Counter of titles. add() counts a pair with the current
+    sign, so the pairs of the pages removed from a dump can be taken away (sign -1) and those of the added pages added
+    (sign 1) by the same code that counts them.
+    """
+
+    def __init__(self):
+        self.s2t = {}
+        self.sign = 1
+
+    def add(self, s, t):
+        if s not in self.s2t: self.s2t[s] = Counter()
+        self.s2t[s][t] += self.sign
+
+    def update(self, s2t, sign=1):
+        """
+        Adds sign times the counts of s2t (surface --> Counter of titles).
+        """
+        for s, t2cnt in s2t.items():
+            if s not in self.s2t: self.s2t[s] = Counter()
+            for t, cnt in t2cnt.items():
+                self.s2t[s][t] += sign * cnt
+
+    def t2s(self):
+        t2s = {}
+        for s, t2cnt in self.s2t.items():
+            for t, cnt in t2cnt.items():
+                if t not in t2s: t2s[t] = Counter()
+                t2s[t][s] += cnt
+        return t2s
+
+
+def iter_x_given_y(path):
+    """
+    Yields (y, [(x, count(x, y)), ...]) for the runs of lines with the same y of a file written by write_x_given_y
+    (all the lines of a y are next to each other in the files of every accumulator).
+    """
+    y, xs = None, []
+    with open(path) as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 4:
+                continue
+            if parts[0] != y:
+                if xs:
+                    yield y, xs
+                y, xs = parts[0], []
+            xs.append((parts[1], int(parts[3].split("/")[0])))
+    if xs:
+        yield y, xs
+
+
+def update_x_given_y(prev_path, out_path, y2delta, rename_y=None, rename_x=None):
+    """
+    Writes out_path as prev_path (written by write_x_given_y) with the signed counts of y2delta (y --> Counter of x)
+    added, and p(x|y) recomputed for the y's whose counts changed. rename_y and rename_x give the y (or x) a y (or x)
+    of prev_path is counted as now, None to drop it (eg. titles that became redirects or were deleted).
+
+    Lines keep the order of prev_path, new x's of a y come after its old ones and new y's at the end. Pairs whose
+    count drops to 0 or below are left out. Memory is that of y2delta and of the y's that are renamed.
+    """
+    y2delta = {y: Counter(x2cnt) for y, x2cnt in y2delta.items()}
+    if rename_y is not None:
+        # renamed y's are added to the y they are renamed to, which may come earlier in the file
+        for y, xs in iter_x_given_y(prev_path):
+            new_y = rename_y(y)
+            if new_y == y or new_y is None:
+                continue
+            if new_y not in y2delta: y2delta[new_y] = Counter()
+            for x, cnt in xs:
+                y2delta[new_y][x] += cnt
+    def updated():
+        for y, xs in iter_x_given_y(prev_path):
+            if rename_y is not None and rename_y(y) != y:
+                continue
+            x2cnt = Counter()
+            for x, cnt in xs:
+                if rename_x is not None:
+                    x = rename_x(x)
+                    if x is None:
+                        continue
+                x2cnt[x] += cnt
+            if y in y2delta:
+                x2cnt.update(y2delta.pop(y))
+            yield y, x2cnt
+        for y in list(y2delta):
+            yield y, y2delta.pop(y)
+
+    start = time.time()
+    negative = 0
+    with open(out_path, "w") as out:
+        for y, x2cnt in updated():
+            negative += sum(1 for cnt in x2cnt.values() if cnt < 0)
+            # unary + keeps the positive counts, in order
+            write_x_given_y(out, [(y, +x2cnt)])
+    if negative:
+        logging.info("%d pairs went below 0 in %s, the previous run and the removed pages do not match", negative,
+                     out_path)
+    logging.info("wrote %s from %s in %d secs", out_path, prev_path, time.time() - start)
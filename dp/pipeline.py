@@ -0,0 +1,641 @@
+# coding=utf-8
+"""
+Runs the dp stages of the makefile for one language and dump date, rerunning only the stages that are stale.
+
+Each stage that ran successfully leaves a manifest in <outdir>/manifests/<lang>wiki-<date>.<stage>.json recording
+    inputs   fingerprint (size, mtime, sha1 of the content) of every input file or directory
+    outputs  fingerprint of every output
+    params   the settings that change the output (lookup, format, window ...)
+    code     sha1 of the stage's modules and of the repository modules they import
+A stage is rerun when its manifest is missing, when any of these changed, or when an output is missing or does not
+match its fingerprint (a partial or modified output). Hashes are only recomputed for files whose size or mtime
+changed since the manifest was written.
+
+A stage writes into a scratch directory <outdir>/tmp/<stage>.<pid>. Only once every command succeeded are its outputs
+renamed into place, then its manifest written, so an interrupted stage never looks complete.
+
+Stages run as soon as the stages producing their inputs are done, several at a time within a cpu and a memory budget,
+and a timing report with the critical path is logged at the end.
+
+Usage:
+    python -m dp.pipeline --lang tr --date 20190501 --dumpdir dumpdir --outdir outdir --wikiextractor WikiExtractor.py
+    python -m dp.pipeline --lang tr --date 20190501 --dumpdir dumpdir --outdir outdir --stages probmap --dry_run
+"""
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dp.pair_counts import parse_size
+from utils.page_index import index_path
+from utils.prob_map import prob_map_path
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+__author__ = 'Shyam'
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# caches the loaders of utils.misc_utils keep next to a tsv, stale once the tsv is rewritten
+DERIVED_CACHES = [".pkl"]
+# what a stage is assumed to need unless it says otherwise, only probmap is known to need much more (see build_stages)
+DEFAULT_STAGE_MEMORY = parse_size("2G")
+PROBMAP_MEMORY = parse_size("25G")
+
+
+def sha1_file(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(path, previous=None):
+    """
+    {"size", "mtime", "sha1"} of a file, the sha1 of previous is reused if size and mtime did not change. A directory
+    gets the fingerprints of its files under "files" and one sha1 over all of them. None if path does not exist.
+    """
+    if os.path.isdir(path):
+        previous_files = (previous or {}).get("files", {})
+        files = {}
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, path)
+                files[rel] = fingerprint(full, previous_files.get(rel))
+        digest = hashlib.sha1()
+        for rel in sorted(files):
+            digest.update(("%s\t%s\n" % (rel, files[rel]["sha1"])).encode("utf-8"))
+        return {"files": files, "sha1": digest.hexdigest()}
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    if previous is not None and previous.get("size") == st.st_size and previous.get("mtime") == st.st_mtime_ns:
+        return previous
+    return {"size": st.st_size, "mtime": st.st_mtime_ns, "sha1": sha1_file(path)}
+
+
+def same_content(a, b):
+    return a is not None and b is not None and a["sha1"] == b["sha1"]
+
+
+def module_path(module):
+    """
+    Source file of a repository module, None for modules from elsewhere (stdlib, site-packages).
+    """
+    path = os.path.join(REPO_ROOT, *module.split("."))
+    for candidate in [path + ".py", os.path.join(path, "__init__.py")]:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def module_files(modules):
+    """
+    Source files of the modules and, transitively, of the repository modules they import.
+    """
+    seen = set()
+    todo = [module_path(m) for m in modules]
+    while todo:
+        path = todo.pop()
+        if path is None or path in seen:
+            continue
+        seen.add(path)
+        package = os.path.relpath(os.path.dirname(path), REPO_ROOT).split(os.sep)
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    # from .dp_common import *, relative to the package of the importing module
+                    parent = package[:len(package) - node.level + 1]
+                    base = ".".join(parent + ([base] if base else []))
+                names = [base] + [base + "." + alias.name for alias in node.names]
+            else:
+                continue
+            todo += [module_path(name) for name in names if name]
+    return sorted(seen)
+
+
+def code_version(modules=(), files=()):
+    """
+    sha1 over the source of the modules (see module_files) and of any other files (eg. an external script).
+    """
+    digest = hashlib.sha1()
+    for path in module_files(modules) + sorted(files):
+        digest.update(os.path.relpath(path, REPO_ROOT).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    inputs and outputs are final paths, files or directories (output_dirs). commands(tmp) returns the argv lists to run,
+    in order, where tmp(path) is the scratch path to write the output path to. params are the settings recorded in the
+    manifest, modules the python modules whose code the stage runs. cpus and memory (bytes) are what the stage is
+    expected to use at most, the scheduler keeps the sum over the running stages within its budgets.
+    """
+
+    def __init__(self, name, inputs, outputs, commands, params=None, modules=(), code_files=(), output_dirs=(),
+                 cpus=1, memory=DEFAULT_STAGE_MEMORY, wiki=""):
+        self.name = name
+        self.wiki = wiki
+        self.inputs = list(inputs)
+        self.outputs = list(outputs) + list(output_dirs)
+        self.output_dirs = set(output_dirs)
+        self.commands = commands
+        self.params = params or {}
+        self.modules = list(modules)
+        self.code_files = list(code_files)
+        self.cpus = cpus
+        self.memory = memory
+        self.deps = []
+
+    @property
+    def key(self):
+        """
+        Unique among the stages of all languages and dates, eg. trwiki-20190501.probmap
+        """
+        return "%s.%s" % (self.wiki, self.name) if self.wiki else self.name
+
+    def matches(self, names):
+        """
+        Whether names (eg. --stages, --force) select this stage, by name in every wiki or by key.
+        """
+        return self.name in names or self.key in names or "all" in names
+
+    def __repr__(self):
+        return "Stage(%s)" % self.key
+
+
+def link_stages(stages):
+    """
+    Sets the deps of every stage, the stages producing its inputs. stages must be in a valid order.
+    """
+    producer = {}
+    for stage in stages:
+        stage.deps = sorted(set(producer[path] for path in stage.inputs if path in producer), key=stages.index)
+        for path in stage.outputs:
+            producer[path] = stage
+    return stages
+
+
+def with_deps(stages, names):
+    """
+    The stages selected by names (see Stage.matches) and everything upstream of them, in pipeline order.
+    """
+    unknown = [name for name in names if not any(stage.matches([name]) for stage in stages)]
+    if unknown:
+        raise ValueError("unknown stages %s, expected some of %s" % (unknown, [stage.key for stage in stages]))
+    wanted = set()
+    todo = [stage for stage in stages if stage.matches(names)]
+    while todo:
+        stage = todo.pop()
+        if stage.key not in wanted:
+            wanted.add(stage.key)
+            todo += stage.deps
+    return [stage for stage in stages if stage.key in wanted]
+
+
+class Pipeline:
+    """
+    Runs stages whose manifest under outdir/manifests says they are stale, see the module docstring.
+    """
+
+    def __init__(self, stages, outdir):
+        self.stages = link_stages(stages)
+        self.outdir = outdir
+        self.manifest_dir = os.path.join(outdir, "manifests")
+        self.scratch_dir = os.path.join(outdir, "tmp")
+
+    def manifest_path(self, stage):
+        return os.path.join(self.manifest_dir, "%s.json" % stage.key)
+
+    def read_manifest(self, stage):
+        path = self.manifest_path(stage)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def write_manifest(self, stage, manifest):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        path = self.manifest_path(stage)
+        with open(path + ".tmp", "w") as out:
+            json.dump(manifest, out, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def current_state(self, stage, manifest):
+        """
+        Fingerprints of the inputs as they are now, reusing the hashes of the manifest where possible.
+        """
+        manifest = manifest or {}
+        return {"inputs": {path: fingerprint(path, manifest.get("inputs", {}).get(path)) for path in stage.inputs},
+                "params": stage.params,
+                "code": code_version(stage.modules, stage.code_files)}
+
+    def stale_reason(self, stage, manifest, state):
+        """
+        Why the stage has to run, None if it is up to date.
+        """
+        missing = [path for path, fp in state["inputs"].items() if fp is None]
+        if missing:
+            raise RuntimeError("stage %s is missing its inputs %s" % (stage.key, missing))
+        if manifest is None:
+            return "never ran"
+        for path in stage.outputs:
+            recorded = manifest["outputs"].get(path)
+            if not same_content(fingerprint(path, recorded), recorded):
+                return "output %s is missing or was modified" % path
+        if manifest["params"] != state["params"]:
+            return "params changed"
+        if manifest["code"] != state["code"]:
+            return "code changed"
+        for path, fp in state["inputs"].items():
+            if not same_content(fp, manifest["inputs"].get(path)):
+                return "input %s changed" % path
+        return None
+
+    def install(self, stage, scratch):
+        """
+        Renames the outputs from the scratch directory into place.
+        """
+        for path in stage.outputs:
+            tmp_path = os.path.join(scratch, os.path.basename(path))
+            if not os.path.exists(tmp_path):
+                raise RuntimeError("stage %s did not write %s" % (stage.key, path))
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if path in stage.output_dirs and os.path.exists(path):
+                # a directory cannot replace a non empty one, swap the old one out first
+                old = tmp_path + ".old"
+                os.rename(path, old)
+                os.rename(tmp_path, path)
+                shutil.rmtree(old)
+            else:
+                os.replace(tmp_path, path)
+            for suffix in DERIVED_CACHES:
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def run_stage(self, stage, state):
+        """
+        Runs the commands of a stage into a scratch directory, installs its outputs and records its manifest.
+        """
+        scratch = os.path.join(self.scratch_dir, "%s.%d" % (stage.key, os.getpid()))
+        if os.path.exists(scratch):
+            shutil.rmtree(scratch)
+        os.makedirs(scratch)
+        for path in stage.output_dirs:
+            os.makedirs(os.path.join(scratch, os.path.basename(path)))
+        # the old manifest goes first, a crash while installing must leave the stage stale
+        if os.path.exists(self.manifest_path(stage)):
+            os.remove(self.manifest_path(stage))
+        start = time.time()
+        peak_rss_mb = 0.0
+        try:
+            for cmd in stage.commands(lambda path: os.path.join(scratch, os.path.basename(path))):
+                logging.info("%s: %s", stage.key, " ".join(cmd))
+                peak_rss_mb = max(peak_rss_mb, run_command(cmd))
+            self.install(stage, scratch)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        secs = time.time() - start
+        manifest = dict(state)
+        manifest["outputs"] = {path: fingerprint(path) for path in stage.outputs}
+        manifest["secs"] = secs
+        manifest["peak_rss_mb"] = peak_rss_mb
+        self.write_manifest(stage, manifest)
+        logging.info("%s: done in %.1f secs, peak rss %.0f MB", stage.key, secs, peak_rss_mb)
+        return peak_rss_mb
+
+    def update(self, stage, force=()):
+        """
+        Runs the stage if it is stale (or forced). Returns its peak RSS in MB if it ran, None otherwise.
+        """
+        manifest = self.read_manifest(stage)
+        state = self.current_state(stage, manifest)
+        reason = "forced" if stage.matches(force) else self.stale_reason(stage, manifest, state)
+        if reason is None:
+            logging.info("%s: up to date", stage.key)
+            return None
+        logging.info("%s: stale, %s", stage.key, reason)
+        return self.run_stage(stage, state)
+
+    def dry_run(self, stages, force=()):
+        """
+        Logs which stages would run and why, in order. Returns them.
+        """
+        stale = []
+        for stage in stages:
+            if any(dep in stale for dep in stage.deps):
+                # its inputs are about to be rewritten, possibly do not even exist yet
+                logging.info("%s: stale, upstream stage is stale", stage.key)
+                stale.append(stage)
+                continue
+            manifest = self.read_manifest(stage)
+            state = self.current_state(stage, manifest)
+            reason = "forced" if stage.matches(force) else self.stale_reason(stage, manifest, state)
+            if reason is None:
+                logging.info("%s: up to date", stage.key)
+                continue
+            logging.info("%s: stale, %s", stage.key, reason)
+            stale.append(stage)
+        return stale
+
+    def priorities(self, stages):
+        """
+        Longest chain of last recorded run times from each stage to the end of the pipeline, the scheduler starts the
+        ready stage with the longest chain first.
+        """
+        priority = {}
+        for stage in reversed(stages):
+            manifest = self.read_manifest(stage) or {}
+            below = [priority[s.key] for s in stages if stage in s.deps]
+            priority[stage.key] = manifest.get("secs", 0.0) + max(below, default=0.0)
+        return priority
+
+    def run(self, names=None, force=(), dry_run=False, cpus=None, memory=None):
+        """
+        Brings the named stages (and their upstream stages) up to date. A stage starts once its upstream stages are
+        done and the cpus and memory it declares fit next to the running stages (a stage needing more than the whole
+        budget runs alone). Stages downstream of a failed one are skipped.
+
+        Returns {stage key: StageRun}.
+        """
+        stages = with_deps(self.stages, names) if names else self.stages
+        if dry_run:
+            self.dry_run(stages, force)
+            return {}
+        cpus = cpus or os.cpu_count()
+        memory = memory or os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        priority = self.priorities(stages)
+        pending = sorted(stages, key=lambda stage: -priority[stage.key])
+        running = {}
+        runs = {}
+        used_cpus, used_memory = 0, 0
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=len(stages) or 1) as executor:
+            while pending or running:
+                for stage in list(pending):
+                    if any(dep.key in runs and runs[dep.key].status in ("failed", "skipped") for dep in stage.deps):
+                        logging.info("%s: skipped, an upstream stage failed", stage.key)
+                        runs[stage.key] = StageRun(stage, "skipped", time.time() - start)
+                        pending.remove(stage)
+                        continue
+                    if not all(dep.key in runs for dep in stage.deps):
+                        continue
+                    need_cpus, need_memory = min(stage.cpus, cpus), min(stage.memory, memory)
+                    if used_cpus + need_cpus > cpus or used_memory + need_memory > memory:
+                        continue
+                    used_cpus, used_memory = used_cpus + need_cpus, used_memory + need_memory
+                    pending.remove(stage)
+                    running[executor.submit(self.update, stage, force)] = (stage, time.time() - start)
+                if not running:
+                    if pending:
+                        raise RuntimeError("cannot schedule %s" % pending)
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, began = running.pop(future)
+                    used_cpus -= min(stage.cpus, cpus)
+                    used_memory -= min(stage.memory, memory)
+                    peak_rss_mb = None
+                    try:
+                        peak_rss_mb = future.result()
+                        status = "up to date" if peak_rss_mb is None else "ran"
+                    except Exception as e:
+                        logging.info("%s: failed, %s", stage.key, e)
+                        status = "failed"
+                    runs[stage.key] = StageRun(stage, status, began, time.time() - start, peak_rss_mb)
+        log_timings(stages, runs, time.time() - start)
+        return runs
+
+
+def run_command(cmd, interval=0.1):
+    """
+    Runs cmd from the repository root, raises CalledProcessError if it fails. Returns the peak RSS in MB of the
+    command and its child processes (eg. its pool workers) summed, sampled every interval seconds while it runs.
+    """
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT)
+    peak = 0
+    while True:
+        peak = max(peak, tree_rss(proc.pid))
+        try:
+            proc.wait(timeout=interval)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return peak / 2 ** 20
+
+
+def tree_rss(pid):
+    """
+    RSS in bytes of a process and of its descendants, 0 once it exited. Pages a forked worker shares with its parent
+    count in both, so this overestimates pools of forked workers.
+    """
+    import psutil
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0
+    rss = 0
+    for p in procs:
+        try:
+            rss += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss
+
+
+class StageRun:
+    """
+    What happened to a stage in one run, times in seconds since the run started.
+    """
+
+    def __init__(self, stage, status, start, end=None, peak_rss_mb=None):
+        self.stage = stage
+        self.status = status
+        self.start = start
+        self.end = start if end is None else end
+        self.peak_rss_mb = peak_rss_mb
+
+    @property
+    def secs(self):
+        return self.end - self.start
+
+
+def critical_path(stages, runs):
+    """
+    Chain of stages with the largest sum of run times through the dependency graph, and that sum. With unlimited
+    cpus and memory the run could not have been shorter than this.
+    """
+    finish, best_dep = {}, {}
+    for stage in stages:
+        if stage.key not in runs:
+            continue
+        deps = [dep for dep in stage.deps if dep.key in finish]
+        best_dep[stage.key] = max(deps, key=lambda dep: finish[dep.key], default=None)
+        below = finish[best_dep[stage.key].key] if best_dep[stage.key] is not None else 0.0
+        finish[stage.key] = below + runs[stage.key].secs
+    if not finish:
+        return [], 0.0
+    last = max(finish, key=finish.get)
+    path, name = [], last
+    while name is not None:
+        path.append(name)
+        name = best_dep[name].key if best_dep[name] is not None else None
+    return path[::-1], finish[last]
+
+
+def log_timings(stages, runs, wall):
+    logging.info("%-28s %-10s %8s %8s %8s %5s %8s %9s", "stage", "status", "start", "end", "secs", "cpus", "memory",
+                 "peak rss")
+    for stage in stages:
+        if stage.key in runs:
+            run = runs[stage.key]
+            logging.info("%-28s %-10s %8.1f %8.1f %8.1f %5d %7.1fG %7.0fMB", stage.key, run.status, run.start,
+                         run.end, run.secs, stage.cpus, stage.memory / 2 ** 30, run.peak_rss_mb or 0.0)
+    path, secs = critical_path(stages, runs)
+    logging.info("critical path %s: %.1f secs of %.1f secs wall time (%.1f secs waiting for cpus or memory)",
+                 " -> ".join(path), secs, wall, max(wall - secs, 0.0))
+
+
+def build_stages(lang, date, dumpdir, outdir, wikiextractor=None, workers=None, lookup="dict",
+                 page_format="json", tokenizer="spacy", window=20, max_memory=None, python=sys.executable):
+    """
+    The stages of the makefile for one language and date, in a valid order. Without wikiextractor, the extracted
+    text (<outdir>/<lang>wiki_with_links) is an input of the pipeline instead of a stage. Without workers, each stage
+    keeps the default of its script, as the makefile targets do: one process for id2title and countsmap, all cores
+    for hyperlinks and mid.
+    """
+    # the commands run from the repository root
+    dumpdir, outdir = os.path.abspath(dumpdir), os.path.abspath(outdir)
+    wikiextractor = wikiextractor and os.path.abspath(wikiextractor)
+    wiki = "%swiki-%s" % (lang, date)
+    dump = os.path.join(dumpdir, "%swiki" % lang, wiki)
+    idmap = os.path.join(outdir, "idmap")
+    id2t = os.path.join(idmap, wiki + ".id2t")
+    r2t = os.path.join(idmap, wiki + ".r2t")
+    text = os.path.join(outdir, "%swiki_with_links" % lang)
+    counts = os.path.join(outdir, wiki + ".counts")
+    surface_links = os.path.join(outdir, "%ssurface_links" % lang)
+    page_index = index_path(surface_links)
+    langlinks = os.path.join(idmap, "%s2entitles" % lang)
+    prob_prefix = os.path.join(outdir, "probmap", wiki)
+    prob_tsvs = [prob_prefix + suffix for suffix in
+                 [".p2t2prob", ".t2p2prob", ".w2t2prob", ".t2w2prob",
+                  ".tnr.p2t2prob", ".tnr.t2p2prob", ".tnr.w2t2prob", ".tnr.t2w2prob"]]
+    link_in_pages = os.path.join(outdir, "%slink_in_pages" % lang)
+    mid = os.path.join(outdir, "%smid" % lang)
+    py = lambda module, *args: [python, "-m", module] + [str(a) for a in args]
+    workers_args = ["--workers", workers] if workers else []
+    # cpus of the stages whose scripts default to one process, and of those defaulting to all cores
+    serial_cpus, parallel_cpus = workers or 1, workers or os.cpu_count()
+
+    stages = []
+    if wikiextractor is not None:
+        stages.append(Stage("text", [dump + "-pages-articles.xml.bz2"], [], output_dirs=[text],
+                            commands=lambda tmp: [[wikiextractor, "-o", tmp(text), "-l", "-q",
+                                                   "--filter_disambig_pages", dump + "-pages-articles.xml.bz2"]],
+                            code_files=[wikiextractor]))
+    stages.append(Stage("id2title", [dump + "-page.sql.gz"], [id2t, id2t + ".store"],
+                        commands=lambda tmp: [py("dp.create_id2title", "--wiki", dump, "--out", tmp(id2t),
+                                                 *workers_args),
+                                              py("utils.title_store", "--id2t", tmp(id2t))],
+                        modules=["dp.create_id2title", "utils.title_store"], cpus=serial_cpus))
+    stages.append(Stage("redirects", [dump + "-redirect.sql.gz", id2t], [r2t, r2t + ".lookup"],
+                        commands=lambda tmp: [py("dp.create_redirect2title", "--id2t", id2t, "--wiki", dump,
+                                                 "--out", tmp(r2t)),
+                                              py("utils.title_lookup", "--id2t", id2t, "--redirects", tmp(r2t))],
+                        modules=["dp.create_redirect2title", "utils.title_lookup"]))
+    if lang != "en":
+        # dp.langlinks maps other languages to english titles, it writes nothing for english
+        stages.append(Stage("langlinks", [dump + "-langlinks.sql.gz", id2t], [langlinks, langlinks + ".all_langs"],
+                            commands=lambda tmp: [py("dp.langlinks", "--langlinks", dump + "-langlinks.sql.gz",
+                                                     "--frid2t", id2t, "--out", tmp(langlinks))],
+                            modules=["dp.langlinks"]))
+    stages.append(Stage("countsmap", [text, id2t, r2t, r2t + ".lookup"], [counts, surface_links, page_index],
+                        commands=lambda tmp: [py("dp.count_popular_entities_v2", "--wikitext", text,
+                                                 "--id2title", id2t, "--redirects", r2t, "--contsout", tmp(counts),
+                                                 "--linksout", tmp(surface_links), "--index", tmp(page_index),
+                                                 "--lookup", lookup, *workers_args)],
+                        params={"lookup": lookup}, modules=["dp.count_popular_entities_v2"], cpus=serial_cpus))
+    memory_args = ["--max_memory", max_memory] if max_memory else []
+    stages.append(Stage("probmap", [surface_links, id2t, r2t], prob_tsvs + [prob_map_path(tsv) for tsv in prob_tsvs],
+                        commands=lambda tmp: [py("dp.compute_probs2", "--links", surface_links, "--id2t", id2t,
+                                                 "--redirects", r2t, "--mode", "all", "--out_prefix",
+                                                 tmp(prob_prefix), "--lang", lang, *memory_args),
+                                              py("utils.prob_map", *[tmp(tsv) for tsv in prob_tsvs])],
+                        params={"lang": lang}, modules=["dp.compute_probs2", "utils.prob_map"],
+                        memory=parse_size(max_memory) if max_memory else PROBMAP_MEMORY))
+    stages.append(Stage("hyperlinks", [text, id2t, r2t, r2t + ".lookup"], [], output_dirs=[link_in_pages],
+                        commands=lambda tmp: [py("dp.extract_link_from_pages", "--dump", text, "--out",
+                                                 tmp(link_in_pages), "--lang", lang, "--id2t", id2t,
+                                                 "--redirects", r2t, "--format", page_format, "--lookup", lookup,
+                                                 *workers_args)],
+                        params={"lang": lang, "format": page_format, "lookup": lookup},
+                        modules=["dp.extract_link_from_pages"], cpus=parallel_cpus))
+    stages.append(Stage("mid", [link_in_pages, id2t, r2t, r2t + ".lookup"], [], output_dirs=[mid],
+                        commands=lambda tmp: [py("dp.create_mid", "--dump", link_in_pages, "--out", tmp(mid),
+                                                 "--lang", lang, "--id2t", id2t, "--redirects", r2t,
+                                                 "--lookup", lookup, "--tokenizer", tokenizer, "--window", window,
+                                                 *workers_args)],
+                        params={"lang": lang, "lookup": lookup, "tokenizer": tokenizer, "window": window},
+                        modules=["dp.create_mid"], cpus=parallel_cpus))
+    for stage in stages:
+        stage.wiki = wiki
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the stale stages of the preprocessing pipeline.')
+    parser.add_argument('--lang', type=str, required=True, help='language code, eg. tr')
+    parser.add_argument('--date', type=str, required=True, help='dump date, eg. 20190501')
+    parser.add_argument('--dumpdir', type=str, required=True, help='where <lang>wiki/<lang>wiki-<date>-* dumps are')
+    parser.add_argument('--outdir', type=str, required=True, help='where outputs (and manifests) are written')
+    parser.add_argument('--wikiextractor', type=str, default=None,
+                        help='WikiExtractor.py, without it <outdir>/<lang>wiki_with_links must already exist')
+    parser.add_argument('--stages', type=str, nargs='*', default=None,
+                        help='stages to bring up to date (with their upstream stages), default all')
+    parser.add_argument('--force', type=str, nargs='*', default=[], help='stages to rerun anyway, or all')
+    parser.add_argument('--dry_run', action="store_true", help='only log which stages are stale and why')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes of the stages that support it, defaults to what each stage uses alone')
+    parser.add_argument('--cpus', type=int, default=None,
+                        help='cpus shared by the stages running at the same time, defaults to all of them')
+    parser.add_argument('--memory', type=str, default=None,
+                        help='memory shared by the stages running at the same time (eg. 64G), defaults to all of it')
+    parser.add_argument('--lookup', type=str, default="dict", choices=["dict", "sorted"],
+                        help='title normalizer backend, sorted shares one mmapped table between many workers')
+    parser.add_argument('--page_format', type=str, default="json", help='format of the hyperlinks page files')
+    parser.add_argument('--tokenizer', type=str, default="spacy", help='tokenizer of the mid stage')
+    parser.add_argument('--window', type=int, default=20, help='context window of the mid stage')
+    parser.add_argument('--max_memory', type=str, default=None, help='memory budget of compute_probs2 (eg. 16G)')
+    args = parser.parse_args()
+    args = vars(args)
+    stages = build_stages(args["lang"], args["date"], args["dumpdir"], args["outdir"],
+                          wikiextractor=args["wikiextractor"], workers=args["workers"], lookup=args["lookup"],
+                          page_format=args["page_format"], tokenizer=args["tokenizer"], window=args["window"],
+                          max_memory=args["max_memory"])
+    pipeline = Pipeline(stages, args["outdir"])
+    runs = pipeline.run(names=args["stages"], force=args["force"], dry_run=args["dry_run"], cpus=args["cpus"],
+                        memory=parse_size(args["memory"]) if args["memory"] else None)
+    if any(run.status == "failed" for run in runs.values()):
+        sys.exit(1)
@@ -1,27 +1,88 @@
 import sys
 import logging
+from collections import OrderedDict
 
 from utils.misc_utils import load_id2title, load_redirects
+from utils.title_lookup import DictLookup
 import utils.constants as K
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 __author__ = 'Shyam'
 
 
+CACHE_POLICIES = ["lru", "fifo"]
+
+
+class NormalizationCache:
+    """
+    Bounded title -> normalized title cache. Evicts the least recently used entry ("lru") or the oldest inserted
+    entry ("fifo", cheaper since hits do not reorder).
+    """
+
+    def __init__(self, capacity, policy="lru"):
+        if policy not in CACHE_POLICIES:
+            raise ValueError("unknown cache policy %s, expected one of %s" % (policy, CACHE_POLICIES))
+        self.capacity = capacity
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, title):
+        nrm = self.entries.get(title)
+        if nrm is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.policy == "lru":
+            self.entries.move_to_end(title)
+        return nrm
+
+    def put(self, title, nrm):
+        if len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.entries[title] = nrm
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return "cache %s size %d/%d hits %d misses %d evictions %d hit rate %.3f" % (
+            self.policy, len(self.entries), self.capacity, self.hits, self.misses, self.evictions,
+            self.hits / lookups if lookups else 0.0)
+
+
 class TitleNormalizer:
-    def __init__(self, lang="en", redirect_map=None, t2id=None, id2t=None, redirect_set=None):
-        if t2id is None:
-            id2t, t2id, redirect_set = load_id2title('data/{}wiki/idmap/{}wiki-20170520.id2t'.format(lang,lang))
-        if redirect_map is None:
-            redirect_map = load_redirects('data/{}wiki/idmap/{}wiki-20170520.r2t'.format(lang,lang))
+    def __init__(self, lang="en", redirect_map=None, t2id=None, id2t=None, redirect_set=None, lookup=None,
+                 cache_size=0, cache_policy="lru"):
+        """
+        lookup is the backend answering title/redirect probes (see utils.title_lookup). By default it is a
+        DictLookup over redirect_map and t2id.
+        With cache_size > 0, results (including NULLTITLE) are memoized in a NormalizationCache of that capacity.
+        """
+        if lookup is None:
+            if t2id is None:
+                id2t, t2id, redirect_set = load_id2title('data/{}wiki/idmap/{}wiki-20170520.id2t'.format(lang,lang))
+            if redirect_map is None:
+                redirect_map = load_redirects('data/{}wiki/idmap/{}wiki-20170520.r2t'.format(lang,lang))
+            lookup = DictLookup(redirect_map, t2id)
         self.null_counts = 0
         self.call_counts = 0
         self.lang = lang
         self.redirect_map = redirect_map
         self.title2id, self.id2title, self.redirect_set = t2id, id2t, redirect_set
-        self.lower2upper = {title.lower():title for title in self.title2id}
-        for redirect in self.redirect_map:
-            self.lower2upper[redirect.lower()] = self.redirect_map[redirect]
+        self.lookup = lookup
+        self.cache = NormalizationCache(cache_size, cache_policy) if cache_size > 0 else None
+
+    def __getstate__(self):
+        # A shared lookup (eg. SortedArrayLookup) pickles as its path and is mapped again in the worker, so the
+        # worker gets no copy of the dicts. The cache starts empty in every worker.
+        state = self.__dict__.copy()
+        if not isinstance(self.lookup, DictLookup):
+            state["redirect_map"] = state["title2id"] = state["id2title"] = state["redirect_set"] = None
+        if self.cache is not None:
+            state["cache"] = NormalizationCache(self.cache.capacity, self.cache.policy)
+        return state
 
     def normalize(self, title):
         """
@@ -29,33 +90,60 @@ class TitleNormalizer:
         """
         # TODO disambiguation pages should ideally go to NULLTITLE
         self.call_counts += 1
-        # Check this first, because now tid can contains tids for titles that are redirect pages.
-        if title in self.redirect_map:
-            return self.redirect_map[title]
-
-        if title in self.title2id:
-            return title
+        if self.cache is None:
+            nrm = self._normalize(title)
+        else:
+            nrm = self.cache.get(title)
+            if nrm is None:
+                nrm = self._normalize(title)
+                self.cache.put(title, nrm)
+        if nrm == K.NULL_TITLE:
+            self.null_counts += 1
+        return nrm
+
+    def _normalize(self, title):
+        # Redirects are checked first, because now tid can contains tids for titles that are redirect pages.
+        nrm = self.lookup.resolve(title)
+        if nrm is not None:
+            return nrm
 
         title_tokens = title.split('_')
         title = "_".join([t.capitalize() for t in title_tokens])
 
-        if title in self.redirect_map:
-            return self.redirect_map[title]
+        nrm = self.lookup.resolve(title)
+        if nrm is not None:
+            return nrm
 
-        if title in self.title2id:
-            return title
-
-        self.null_counts += 1
         return K.NULL_TITLE
 
+    def take_stats(self):
+        """
+        Returns the counters of the normalizer and of its cache, and sets them to 0. Pool workers send them with each
+        shard to the parent's normalizer (add_stats), so its log_stats covers the whole run.
+        """
+        stats = (self.null_counts, self.call_counts)
+        self.null_counts, self.call_counts = 0, 0
+        if self.cache is not None:
+            stats += (self.cache.hits, self.cache.misses, self.cache.evictions)
+            self.cache.hits, self.cache.misses, self.cache.evictions = 0, 0, 0
+        return stats
+
+    def add_stats(self, stats):
+        self.null_counts += stats[0]
+        self.call_counts += stats[1]
+        if self.cache is not None:
+            self.cache.hits += stats[2]
+            self.cache.misses += stats[3]
+            self.cache.evictions += stats[4]
+
+    def log_stats(self):
+        logging.info("title nrm saw %d/%d nulls/calls", self.null_counts, self.call_counts)
+        if self.cache is not None:
+            logging.info("title nrm %s", self.cache.stats())
+
     def __del__(self):
         logging.info("dying ... title nrm saw %d/%d nulls/calls", self.null_counts, self.call_counts)
 
-    def lower2upper(self,title):
-        if title not in self.lower2upper:
-            return K.NULL_TITLE
-        return self.lower2upper[title]
-
 
 """
 TODO
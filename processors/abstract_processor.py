@@ -1,5 +1,7 @@
 import os
 import logging
+import multiprocessing
+import time
 
 """
 Helper function to recursively remove .DS_Store file in directories
@@ -16,27 +18,93 @@ def remove_file(dir, name):
                 os.remove(file_name)
 
 
+# processor shared by the shard tasks of one pool worker
+_worker_processor = None
+
+
+def _init_worker(processor):
+    global _worker_processor
+    _worker_processor = processor
+
+
+def _process_shard(task):
+    shard_idx, filepath = task
+    _worker_processor.begin_shard(shard_idx)
+    with open(filepath) as f:
+        _worker_processor.process_file(f)
+    _worker_processor.after_file_hook()
+    return _worker_processor.end_shard(shard_idx)
+
+
 class AbstractProcessor(object):
+    # processors that set this implement the shard hooks run(workers > 1) calls: begin_shard(shard_idx) in a pool
+    # worker before the file of a shard, to reset any partial state, end_shard(shard_idx) after it, returning the
+    # picklable partial result, and merge_shard(partial) in the parent with the result of every shard, in file order
+    supports_shards = False
+
     def __init__(self, wikipath):
         self.wikipath = wikipath
 
     def setup(self):
         pass
 
-    def run(self):
-        # Recursively clean .DS_Store files
-        remove_file(self.wikipath, '.DS_Store')
+    def list_files(self):
+        """
+        Returns (dirpath, filepath) for every file of the wikiextractor output, in processing order.
+        """
+        files = []
         for dirname in sorted(os.listdir(self.wikipath)):
             dirpath = os.path.join(self.wikipath, dirname)
-            logging.info(dirpath)
             for filename in sorted(os.listdir(dirpath)):
-                filepath = os.path.join(dirpath, filename)
-                f = open(filepath)
+                files.append((dirpath, os.path.join(dirpath, filename)))
+        return files
+
+    def run(self, workers=1):
+        """
+        With workers > 1, every file is a shard processed in a pool worker (see supports_shards). Partial results are
+        merged back in file order, so the result does not depend on the number of workers. Processors without
+        supports_shards only run with workers=1.
+        """
+        if workers > 1 and not self.supports_shards:
+            raise ValueError("%s does not support shards, run it with workers=1" % type(self).__name__)
+        # Recursively clean .DS_Store files
+        remove_file(self.wikipath, '.DS_Store')
+        if workers > 1:
+            self.run_parallel(workers)
+            return
+        last_dir = None
+        for dirpath, filepath in self.list_files():
+            if dirpath != last_dir:
+                if last_dir is not None:
+                    self.after_dir_hook()
+                logging.info(dirpath)
+                last_dir = dirpath
+            with open(filepath) as f:
                 self.process_file(f)
-                self.after_file_hook()
+            self.after_file_hook()
+        if last_dir is not None:
+            self.after_dir_hook()
+        self.finish()
+
+    def run_parallel(self, workers):
+        files = self.list_files()
+        logging.info("processing %d files with %d workers", len(files), workers)
+        start = time.time()
+        tasks = [(shard_idx, filepath) for shard_idx, (_, filepath) in enumerate(files)]
+        last_dir = None
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self,)) as pool:
+            for (dirpath, _), partial in zip(files, pool.imap(_process_shard, tasks)):
+                if dirpath != last_dir:
+                    if last_dir is not None:
+                        self.after_dir_hook()
+                    logging.info(dirpath)
+                    last_dir = dirpath
+                self.merge_shard(partial)
+        if last_dir is not None:
             self.after_dir_hook()
+        logging.info("processed %d files in %.1f secs", len(files), time.time() - start)
         self.finish()
-        
+
     def process_file(self, f_handle):
         pass
 
@@ -48,4 +116,3 @@ class AbstractProcessor(object):
 
     def finish(self):
         pass
-
@@ -1,31 +1,27 @@
 from bs4 import BeautifulSoup
 from processors.abstract_processor import AbstractProcessor
+from processors.page_iterator import iter_pages
+from utils.link_scanner import parse_doc_header
+
+# how pages are parsed: "scanner" (utils.link_scanner regexes) or "bs4" (BeautifulSoup html.parser)
+PARSERS = ["scanner", "bs4"]
 
 
 class BasicPageProcessor(AbstractProcessor):
-    def __init__(self, wikipath):
+    def __init__(self, wikipath, parser="scanner"):
         super(BasicPageProcessor, self).__init__(wikipath)
+        if parser not in PARSERS:
+            raise ValueError("unknown parser %s, expected one of %s" % (parser, PARSERS))
+        self.parser = parser
+
+    def parse_header(self, line):
+        if self.parser == "bs4":
+            doc = BeautifulSoup(line, "html.parser").find("doc")
+            return doc["id"], doc["title"]
+        return parse_doc_header(line)
 
     def process_file(self, f_handle):
-        page_content = ""
-        new_page = False
-        page_id, page_title = None, None
-        for line in f_handle:
-            if line.startswith("<doc id="):
-                new_page = True
-                if page_content:
-                    self.process_wikicontent(page_content, page_id, page_title)
-                page_content = ""
-                soup = BeautifulSoup(line, "html.parser")
-                doc = soup.find("doc")
-                page_id = doc["id"]
-                page_title = doc["title"].replace(" ", "_")
-            else:
-                if new_page:
-                    new_page = False
-                    continue  # do not add this line as it contains title
-                page_content += line
-        if page_content:
+        for page_id, page_title, page_content in iter_pages(f_handle, self.parse_header):
             self.process_wikicontent(page_content, page_id, page_title)
 
     def process_wikicontent(self, page_content, page_id, page_title):
@@ -0,0 +1,49 @@
+"""
+Page iterator shared by the processors: splits one wikiextractor output file into its <doc> pages.
+"""
+import re
+
+from utils.link_scanner import parse_doc_header
+
+__author__ = 'Shyam'
+
+# no ^ anchor, so the regex engine can jump between "<doc id=" literals, line starts are checked by hand
+_HEADER_LINE = re.compile(r"<doc id=[^\n]*")
+
+
+def iter_pages(f_handle, parse_header=parse_doc_header):
+    """
+    Yields (page_id, page_title, page_content) for every page of a wikiextractor file.
+
+    The file is read in one go and every page is a single slice of it, starting after the title line that follows
+    the <doc ...> header and running up to the next header (so it includes the closing </doc>). Pages with empty
+    content are skipped. Spaces in the title are replaced by underscores.
+
+    Parameters
+    -------------
+    f_handle: file
+        Open wikiextractor output file
+    parse_header: function
+        Returns (page_id, title) of a header line, defaults to the compiled regex of utils.link_scanner
+    """
+    for page_id, page_title, page_content, _ in iter_page_blocks(f_handle, parse_header):
+        yield page_id, page_title, page_content
+
+
+def iter_page_blocks(f_handle, parse_header=parse_doc_header):
+    """
+    As iter_pages, but yields (page_id, page_title, page_content, block) where block is the whole text of the page in
+    the file, from its <doc ...> header up to the next one. Writing the blocks of some pages one after the other gives
+    a wikiextractor file of these pages.
+    """
+    text = f_handle.read()
+    headers = [m for m in _HEADER_LINE.finditer(text) if m.start() == 0 or text[m.start() - 1] == "\n"]
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        # do not add the line after the header as it contains the title
+        start = text.find("\n", header.end() + 1, end)
+        start = end if start < 0 else start + 1
+        if start >= end:
+            continue
+        page_id, page_title = parse_header(header.group(0))
+        yield page_id, page_title.replace(" ", "_"), text[start:end], text[header.start():end]
@@ -1,9 +1,10 @@
 from collections import Counter
+import io
 
-from bs4 import BeautifulSoup
 import sys
 
 from processors.abstract_processor import AbstractProcessor
+from processors.page_iterator import iter_pages
 from utils.text_utils import tokenizer
 
 __author__ = 'Shyam'
@@ -16,31 +17,18 @@ class SectionProcessor(AbstractProcessor):
         self.section_cnt = Counter()
 
     def process_file(self, f_handle):
-        page_content = ""
-        new_page = False
-        page_id, page_title = None, None
-        sections = []
-        for line in f_handle:
-            if line.startswith("<doc id="):
-                new_page = True
-                if page_content:
-                    self.process_wikicontent(page_content, page_id, page_title, sections)
-                page_content = ""
-                soup = BeautifulSoup(line, "html.parser")
-                doc = soup.find("doc")
-                page_id = doc["id"]
-                page_title = doc["title"].replace(" ", "_")
-                sections = []
-            else:
-                if new_page:
-                    new_page = False
-                    continue  # do not add this line as it contains title
+        for page_id, page_title, content in iter_pages(f_handle):
+            page_content = []
+            sections = []
+            for line in io.StringIO(content):
                 if "a href" not in line and len(line.strip()) > 0:
                     tokens = tokenizer(line, lang=self.lang)
                     if len(tokens) < 4:
                         sections.append(line.strip())
                     continue
-                page_content += line
+                page_content.append(line)
+            if page_content:
+                self.process_wikicontent("".join(page_content), page_id, page_title, sections)
 
     def process_wikicontent(self, page_content, page_id, page_title, sections):
         self.section_cnt.update(sections)
@@ -0,0 +1,21 @@
+import os
+import shutil
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.fixture
+def trwiki(tmp_path):
+    """
+    Copy of the fixture corpus (wikiextractor output, id2t and r2t), the loaders cache pkls next to their inputs.
+    Returns (wikitext, id2t, redirects) paths.
+    """
+    for name in os.listdir(FIXTURES):
+        src = os.path.join(FIXTURES, name)
+        if os.path.isdir(src):
+            shutil.copytree(src, str(tmp_path / name))
+        else:
+            shutil.copy(src, str(tmp_path / name))
+    return str(tmp_path / "trwiki_with_links"), str(tmp_path / "trwiki.id2t"), str(tmp_path / "trwiki.r2t")
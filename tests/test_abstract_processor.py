@@ -0,0 +1,25 @@
+import pytest
+
+from processors.basic_page_processor import BasicPageProcessor
+
+
+class TitleCollector(BasicPageProcessor):
+    def __init__(self, wikipath):
+        super(TitleCollector, self).__init__(wikipath)
+        self.titles = []
+
+    def process_wikicontent(self, page_content, page_id, page_title):
+        self.titles.append(page_title)
+
+
+def test_run_without_shards(trwiki):
+    wikitext, _, _ = trwiki
+    processor = TitleCollector(wikitext)
+    processor.run()
+    assert processor.titles == ["Cengiz_Han", "Mustafa_Suphi", "Linux", "Milliyetçi_Hareket_Partisi", "O'Brien"]
+
+
+def test_workers_need_shard_support(trwiki):
+    wikitext, _, _ = trwiki
+    with pytest.raises(ValueError):
+        TitleCollector(wikitext).run(workers=2)
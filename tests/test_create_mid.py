@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from dp.create_mid import RegexTokenizer, align_link, check_if_tok_match_link, token_offsets
+
+_TEXT = "Cengiz Han (d. 1162, Moğolistan - ö. 1227), Moğol İmparatorluğu'nun kurucusudur."
+
+
+def scan_link(doc, link):
+    """
+    The tokens check_if_tok_match_link picks, by scanning all of them.
+    """
+    positions = [tok.i for tok in doc if check_if_tok_match_link(link, tok)]
+    return (positions[0], positions[-1]) if positions else None
+
+
+def link_to(text, surface):
+    start = text.index(surface)
+    return {"start": start, "end": start + len(surface)}
+
+
+def test_regex_tokenizer():
+    doc = RegexTokenizer()("Moğol İmparatorluğu'nun, 1227")
+    assert [(tok.idx, tok.i, tok.text) for tok in doc] == [
+        (0, 0, "Moğol"), (6, 1, "İmparatorluğu"), (19, 2, "'"), (20, 3, "nun"), (23, 4, ","), (25, 5, "1227")]
+
+
+@pytest.mark.parametrize("surface, expected", [("Cengiz Han", (0, 1)), ("Moğolistan", (7, 7)),
+                                               ("Moğol İmparatorluğu", (14, 15)), ("olist", (7, 7)),
+                                               ("kurucusudur.", (18, 19))])
+def test_align_link(surface, expected):
+    doc = RegexTokenizer()(_TEXT)
+    starts, ends = token_offsets(doc)
+    link = link_to(_TEXT, surface)
+    assert align_link(starts, ends, link) == expected == scan_link(doc, link)
+
+
+def test_align_link_without_tokens():
+    doc = RegexTokenizer()("a  b")
+    starts, ends = token_offsets(doc)
+    # a token ending right at the link start still matches, as in check_if_tok_match_link
+    assert align_link(starts, ends, {"start": 1, "end": 2}) == (0, 0) == scan_link(doc, {"start": 1, "end": 2})
+    assert align_link(starts, ends, {"start": 2, "end": 3}) is None
+    assert align_link(starts, ends, {"start": 5, "end": 6}) is None
+
+
+def test_align_link_matches_scanning_every_token():
+    rng = random.Random(0)
+    doc = RegexTokenizer()(_TEXT)
+    starts, ends = token_offsets(doc)
+    for _ in range(500):
+        start = rng.randrange(len(_TEXT))
+        link = {"start": start, "end": rng.randint(start + 1, len(_TEXT))}
+        assert align_link(starts, ends, link) == scan_link(doc, link), link
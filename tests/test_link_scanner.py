@@ -0,0 +1,79 @@
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from dp.count_popular_entities_v2 import EntityCounter
+from processors.page_iterator import iter_pages
+from utils.link_scanner import iter_links, parse_doc_header
+from utils.misc_utils import load_id2title, load_redirects
+
+
+def fixture_pages(wikitext):
+    for dirname in sorted(os.listdir(wikitext)):
+        for filename in sorted(os.listdir(os.path.join(wikitext, dirname))):
+            with open(os.path.join(wikitext, dirname, filename)) as f:
+                yield from iter_pages(f)
+
+
+def bs4_links(page_content):
+    return [(a.text, a.get("href")) for a in BeautifulSoup(page_content, "html.parser").find_all("a")]
+
+
+def count_links(wikitext, id2t, redirects, outdir, parser, workers=1):
+    linksout, contsout = os.path.join(outdir, "surface_links." + parser), os.path.join(outdir, "counts." + parser)
+    _, t2id, _ = load_id2title(id2t)
+    counter = EntityCounter(wikipath=wikitext, linksout=linksout, contsout=contsout,
+                            redirect_map=load_redirects(redirects), t2id=t2id, limit=0, parser=parser)
+    counter.run(workers=workers)
+    with open(linksout) as links, open(contsout) as counts:
+        return links.read(), counts.read()
+
+
+def test_links_match_bs4_on_every_page(trwiki):
+    wikitext, _, _ = trwiki
+    pages = list(fixture_pages(wikitext))
+    assert len(pages) == 5
+    for page_id, page_title, page_content in pages:
+        assert list(iter_links(page_content)) == bs4_links(page_content), page_title
+
+
+@pytest.mark.parametrize("case", [
+    '<a href="Linux">Linux</a> and <a href="Yok">never closed',
+    '<a href="Linux">never closed, <a href="MHP">MHP</a> is inside it',
+    '<a href="A">a <a href="B">b <a href="C">c</a> still b</a> still a',
+    '</a> stray close, <A HREF="Linux">Linux</A > upper case',
+    '<a\nhref="Cengiz%20Han">split header</a> <abbr>not a link</abbr>',
+    '<a href="O&#39;Brien">O&#39;<i>Brien</i> &amp; co',
+])
+def test_links_match_bs4_on_malformed_anchors(case):
+    assert list(iter_links(case)) == bs4_links(case)
+
+
+def test_nested_and_unclosed_anchors():
+    page = '<a href="A">a <a href="B">b</a> still a</a> <a href="C">c &amp; <b>d</b>'
+    assert list(iter_links(page)) == [("a b still a", "A"), ("b", "B"), ("c & d", "C")]
+
+
+def test_parse_doc_header():
+    line = '<doc id="27" url="https://tr.wikipedia.org/wiki?curid=27" title="O&#39;Brien &amp; co">'
+    assert parse_doc_header(line) == ("27", "O'Brien & co")
+    with pytest.raises(ValueError):
+        parse_doc_header("O'Brien")
+
+
+def test_scanner_and_bs4_write_the_same_outputs(trwiki, tmp_path):
+    scanner = count_links(*trwiki, str(tmp_path), "scanner")
+    assert scanner == count_links(*trwiki, str(tmp_path), "bs4")
+    links, counts = scanner
+    # the nested anchor's text includes the inner one, which is counted too
+    assert "Linus Torvalds tarafından Linux adıyla\tLinus_Torvalds\n" in links
+    # an unclosed anchor runs to the end of the page, over the newlines around </doc>
+    assert "CKMP\n\n\tCumhuriyetçi_Köylü_Millet_Partisi\n" in links
+    assert "Milliyetçi & Hareket\tMilliyetçi_Hareket_Partisi\n" in links
+    assert counts.splitlines()[0] == "26\tMilliyetçi_Hareket_Partisi\t3"
+
+
+def test_workers_write_the_same_outputs(trwiki, tmp_path):
+    assert count_links(*trwiki, str(tmp_path), "scanner", workers=2) == \
+        count_links(*trwiki, str(tmp_path), "scanner")
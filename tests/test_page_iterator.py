@@ -0,0 +1,40 @@
+import io
+import os
+
+from processors.page_iterator import iter_page_blocks, iter_pages
+
+_TEXT = ('<doc id="1" url="https://tr.wikipedia.org/wiki?curid=1" title="Cengiz Han">\n'
+         'Cengiz Han\n'
+         '\n'
+         'Metin içinde <doc id="9"> geçen bir başlık.\n'
+         '</doc>\n'
+         '<doc id="2" url="https://tr.wikipedia.org/wiki?curid=2" title="Boş">\n'
+         '<doc id="3" url="https://tr.wikipedia.org/wiki?curid=3" title="O&#39;Brien &amp; co">\n'
+         "O'Brien & co\n"
+         'Son satır')
+
+
+def test_pages_run_from_the_line_after_the_title_to_the_next_header():
+    assert list(iter_pages(io.StringIO(_TEXT))) == [
+        ("1", "Cengiz_Han", '\nMetin içinde <doc id="9"> geçen bir başlık.\n</doc>\n'),
+        ("3", "O'Brien_&_co", "Son satır")]
+
+
+def test_blocks_cover_the_pages_they_come_from():
+    blocks = [block for _, _, _, block in iter_page_blocks(io.StringIO(_TEXT))]
+    assert blocks[0] == _TEXT[:_TEXT.index('<doc id="2"')]
+    assert blocks[1] == _TEXT[_TEXT.index('<doc id="3"'):]
+
+
+def test_fixture_pages(trwiki):
+    wikitext, _, _ = trwiki
+    with open(os.path.join(wikitext, "AA", "wiki_00")) as f:
+        text = f.read()
+        f.seek(0)
+        pages = list(iter_page_blocks(f))
+    assert [(page_id, title) for page_id, title, _, _ in pages] == [
+        ("10", "Cengiz_Han"), ("22", "Mustafa_Suphi"), ("24", "Linux"), ("26", "Milliyetçi_Hareket_Partisi"),
+        ("27", "O'Brien")]
+    assert "".join(block for _, _, _, block in pages) == text
+    for _, _, content, block in pages:
+        assert block.endswith(content) and content.endswith("</doc>\n")
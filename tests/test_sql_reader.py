@@ -0,0 +1,65 @@
+import gzip
+
+import pytest
+
+from dp.dp_common import SqlInsertReader, parse_schema
+
+_DUMP = """-- MySQL dump 10.16
+CREATE TABLE `page` (
+  `page_id` int(8) unsigned NOT NULL AUTO_INCREMENT,
+  `page_namespace` int(11) NOT NULL DEFAULT '0',
+  `page_title` varbinary(255) NOT NULL DEFAULT '',
+  `page_is_redirect` tinyint(1) unsigned NOT NULL DEFAULT '0',
+  `page_random` double unsigned NOT NULL DEFAULT '0',
+  `page_lang` varbinary(35) DEFAULT NULL,
+  PRIMARY KEY (`page_id`),
+);
+/*!40000 ALTER TABLE `page` DISABLE KEYS */;
+INSERT INTO `page` VALUES (10,0,'Cengiz_Han',0,0.5,NULL),(16,0,'Film_(anlam_ayrımı)',0,0.25,NULL),\
+(27,0,'O\\'Brien',0,0.125,NULL),(28,0,'A),(B',1,0.75,'tr');
+INSERT INTO `page` VALUES (29,0,'Satır\\nsonu \\\\ ters',0,1e-3,NULL),(30,0,'kısa');
+/*!40000 ALTER TABLE `page` ENABLE KEYS */;
+"""
+
+_ROWS = [(10, 0, "Cengiz_Han", 0, 0.5, None), (16, 0, "Film_(anlam_ayrımı)", 0, 0.25, None),
+         (27, 0, "O'Brien", 0, 0.125, None), (28, 0, "A),(B", 1, 0.75, "tr"),
+         (29, 0, "Satır\nsonu \\ ters", 0, 1e-3, None)]
+
+
+@pytest.fixture(params=["page.sql", "page.sql.gz"])
+def dump(request, tmp_path):
+    path = str(tmp_path / request.param)
+    with (gzip.open if path.endswith(".gz") else open)(path, "wt", encoding="utf-8") as out:
+        out.write(_DUMP)
+    return path
+
+
+def test_parse_schema(dump):
+    assert parse_schema(dump, "utf-8") == {"page_id": 0, "page_namespace": 1, "page_title": 2, "page_is_redirect": 3,
+                                          "page_random": 4, "page_lang": 5}
+
+
+def test_any_width_yields_every_tuple(dump):
+    rows = list(SqlInsertReader(dump))
+    assert rows == _ROWS + [(30, 0, "kısa")]
+
+
+def test_width_skips_tuples_of_another_width(dump):
+    reader = SqlInsertReader(dump, width=6)
+    assert list(reader) == _ROWS
+    assert (reader.total, reader.bad) == (6, 1)
+
+
+@pytest.mark.parametrize("width", [None, 6])
+def test_columns_in_requested_order(dump, width):
+    reader = SqlInsertReader(dump, columns=[2, 0, 3], width=width)
+    rows = list(reader)
+    assert rows[:5] == [(title, page_id, redirect) for page_id, _, title, redirect, _, _ in _ROWS]
+    # the short tuple has no page_is_redirect
+    assert len(rows) == 5 and reader.bad == 1
+
+
+def test_parse_line_ignores_other_statements():
+    reader = SqlInsertReader("unused.sql")
+    assert reader.parse_line(b"CREATE TABLE `page` (\n") == []
+    assert reader.parse_line(b"INSERT INTO `page` VALUES (1,'a,b'),(2,'');\n") == [(1, "a,b"), (2, "")]
@@ -0,0 +1,26 @@
+import sys
+
+import pytest
+
+from utils.text_utils import _getLnrm, _getLnrm_nfd
+
+
+@pytest.mark.parametrize("word, expected", [("Suárez", "suarez"), ("Báñez", "banez"), ("Fátima", "fatima"),
+                                            ("İmparatorluğu'nun", "imparatorlugunun"), ("Ölçü 1227!", "olcu1227"),
+                                            ("ΣΟΦΟΣ", ""), ("北京", ""), ("", "")])
+def test_getLnrm(word, expected):
+    assert _getLnrm(word) == expected == _getLnrm_nfd(word)
+
+
+def test_getLnrm_matches_nfd_reference_per_codepoint():
+    # every codepoint of the Latin, Greek and Cyrillic blocks, and the full width forms
+    for codepoint in list(range(0x0250)) + list(range(0x0370, 0x0530)) + list(range(0xFF00, 0xFF60)):
+        c = chr(codepoint)
+        assert _getLnrm(c) == _getLnrm_nfd(c), hex(codepoint)
+
+
+def test_getLnrm_matches_nfd_reference_on_words():
+    words = ["Ḩaşim", "Ǆemal", "ﬁnal", "Straße", "Ångström", "été", "ΟΔΥΣΣΕΥΣ", "Québeç",
+             "x" + chr(sys.maxunicode)]
+    for word in words:
+        assert _getLnrm(word) == _getLnrm_nfd(word), word
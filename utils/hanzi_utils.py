@@ -0,0 +1,95 @@
+# coding=utf-8
+"""
+Traditional --> simplified Chinese conversion for the zh pipelines, same output as HanziConv.toSimplified.
+
+HanziConv converts one character at a time with a linear find() over its charmap. Here the charmap is compiled once
+into a str.translate table, distinct strings are memoized, and a whole token list is converted with one translate
+call. hanziconv is only imported when the first conversion is asked for, so non-zh runs never load it.
+"""
+import logging
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+__author__ = 'Shyam'
+
+# never in a title or a surface token, joins the tokens of a batch
+_SEP = "\n"
+
+
+def simplified_table():
+    """
+    codepoint --> simplified character. HanziConv takes the first position of a character in its traditional
+    charmap, so the first one wins here too.
+    """
+    from hanziconv.charmap import traditional_charmap, simplified_charmap
+    table = {}
+    for trad, simp in zip(traditional_charmap, simplified_charmap):
+        if ord(trad) not in table:
+            table[ord(trad)] = simp
+    return table
+
+
+class Simplifier:
+    """
+    Memoizes up to cache_size distinct strings, evicting the oldest first.
+    """
+
+    def __init__(self, cache_size=1 << 20):
+        self.table = simplified_table()
+        self.cache_size = cache_size
+        self.cache = {}
+        self.calls = 0
+        self.hits = 0
+
+    def _remember(self, text, simplified):
+        if len(self.cache) >= self.cache_size:
+            del self.cache[next(iter(self.cache))]
+        self.cache[text] = simplified
+
+    def to_simplified(self, text):
+        self.calls += 1
+        simplified = self.cache.get(text)
+        if simplified is None:
+            simplified = text.translate(self.table)
+            self._remember(text, simplified)
+        else:
+            self.hits += 1
+        return simplified
+
+    def to_simplified_batch(self, tokens):
+        """
+        Converts a list of tokens, the ones not in the cache with a single translate call.
+        """
+        self.calls += len(tokens)
+        misses = [token for token in tokens if token not in self.cache]
+        self.hits += len(tokens) - len(misses)
+        if misses:
+            for token, simplified in zip(misses, _SEP.join(misses).translate(self.table).split(_SEP)):
+                self._remember(token, simplified)
+        return [self.cache[token] if token in self.cache else token.translate(self.table) for token in tokens]
+
+    def log_stats(self):
+        logging.info("simplified %d strings, %d conversions saved by the cache (%d cached)", self.calls, self.hits,
+                     len(self.cache))
+
+
+_simplifier = None
+
+
+def get_simplifier():
+    global _simplifier
+    if _simplifier is None:
+        _simplifier = Simplifier()
+    return _simplifier
+
+
+def to_simplified(text):
+    return get_simplifier().to_simplified(text)
+
+
+def to_simplified_batch(tokens):
+    return get_simplifier().to_simplified_batch(tokens)
+
+
+def log_stats():
+    if _simplifier is not None:
+        _simplifier.log_stats()
@@ -0,0 +1,69 @@
+"""
+Lightweight scanner for WikiExtractor output (run with -l), used instead of building a BeautifulSoup tree when all
+we need are the <a href> links of a page or the id and title of a <doc> header.
+
+Matches what BeautifulSoup(..., "html.parser") returns for these inputs: attribute values and anchor text are
+html-unescaped, and tags nested inside an anchor are dropped from its text. As in bs4, </a> closes the innermost open
+anchor, so an anchor left open contains the ones after it and its text runs to the end of the page.
+"""
+import html
+import re
+
+__author__ = 'Shyam'
+
+_ANCHOR_TAG = re.compile(r"<(/)?a(\s[^>]*)?>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+_ATTR = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+_DOC_HEADER = re.compile(r"<doc(\s[^>]*)>", re.IGNORECASE)
+
+
+def parse_attrs(attrs):
+    """
+    Returns the attributes of a tag (the part after the tag name) as a dict, keys lowercased, values unescaped.
+    """
+    ans = {}
+    if not attrs:
+        return ans
+    for name, dq, sq, bare in _ATTR.findall(attrs):
+        ans[name.lower()] = html.unescape(dq or sq or bare)
+    return ans
+
+
+def _anchor_text(text):
+    if "<" in text:
+        text = _TAG.sub("", text)
+    if "&" in text:
+        text = html.unescape(text)
+    return text
+
+
+def iter_links(page_content):
+    """
+    Yields (anchor_text, href) for every <a> in the page, in the order they open, href is None when the anchor has no
+    href.
+    """
+    links = []
+    # (index in links, start of the text) of the anchors not closed yet, innermost last
+    opened = []
+    for m in _ANCHOR_TAG.finditer(page_content):
+        if m.group(1) is None:
+            opened.append((len(links), m.end()))
+            links.append([None, parse_attrs(m.group(2)).get("href")])
+        elif opened:
+            idx, start = opened.pop()
+            links[idx][0] = page_content[start:m.start()]
+    for idx, start in opened:
+        links[idx][0] = page_content[start:]
+    for text, href in links:
+        yield _anchor_text(text), href
+
+
+def parse_doc_header(line):
+    """
+    Returns (page_id, title) of a <doc id=... url=... title=...> line, title as in the header (with spaces).
+    """
+    m = _DOC_HEADER.search(line)
+    if m is None:
+        raise ValueError("not a doc header: %s" % line)
+    attrs = parse_attrs(m.group(1))
+    return attrs["id"], attrs["title"]
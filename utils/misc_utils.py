@@ -6,6 +6,8 @@ import os
 import utils.constants as K
 import json
 from utils.vocab_utils import get_idx
+from utils.title_store import store_path, TitleStore
+from utils.prob_map import prob_map_path, write_prob_map, ProbMap
 
 logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
 
@@ -15,14 +17,20 @@ import numpy as np
 __author__ = 'Shyam'
 
 
+def _dump(fname, obj, protocol):
+    # written aside and renamed, stages running at the same time may load or write the same pkl cache
+    tmp = "%s.tmp%d" % (fname, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(obj, f, protocol=protocol)
+    os.replace(tmp, fname)
+
+
 def save(fname, obj):
-    with open(fname, 'wb') as f:
-        pickle.dump(obj, f)
+    _dump(fname, obj, None)
 
 
 def save_fast(fname, obj):
-    with open(fname, 'wb') as f:
-        pickle.dump(obj, f, protocol=4)
+    _dump(fname, obj, 4)
 
 
 def load(fname):
@@ -261,8 +269,17 @@ def load_xiao_mid2name(path="data/xiao/mid2name.tsv"):
 
 
 def load_id2title(f):
+    """
+    Returns id2t, t2id, redirect_set. If the compiled store (utils.title_store) exists next to the tsv, these are
+    read-only mmap-backed views of it, otherwise dicts and a set (cached as a pkl).
+    """
+    bin_path = store_path(f)
     pkl_path = f + ".pkl"
-    if os.path.exists(pkl_path):
+    if os.path.exists(bin_path):
+        logging.info("found id2t store %s", bin_path)
+        store = TitleStore(bin_path)
+        id2t, t2id, redirect_set = store.id2t, store.t2id, store.redirect_set
+    elif os.path.exists(pkl_path):
         logging.info("found id2t pkl %s", pkl_path)
         id2t, t2id, redirect_set = load(pkl_path)
     else:
@@ -366,30 +383,22 @@ ConllToken = namedtuple("ConllToken",
 
 
 def load_prob_map(out_prefix, kind):
+    """
+    Returns the y --> x --> p(x|y) map of out_prefix.kind as a mmap-backed utils.prob_map.ProbMap, compiling it
+    from the tsv on first use. A pkl left by older runs is still loaded if there is no compiled map.
+    """
     path = out_prefix + "." + kind
+    bin_path = prob_map_path(path)
     pkl_path = path + ".pkl"
-    if os.path.exists(pkl_path):
+    if os.path.exists(bin_path):
+        logging.info("found prob map %s", bin_path)
+    elif os.path.exists(pkl_path):
         logging.info("pkl found! %s", pkl_path)
-        mmap = load(pkl_path)
+        return load(pkl_path)
     else:
-        mmap = defaultdict(lambda: defaultdict(float))
-        logging.info("loading from %s", path)
-        for idx, line in enumerate(open(path)):
-            parts = line.split("\t")
-            if len(parts) != 4:
-                logging.info("error on line %d: %s", idx, line)
-                continue
-            y, x, prob, _ = parts
-            mmap[y][x] = float(prob)
-        logging.info("pkling ... %s", pkl_path)
-
-        pkl_map = {}
-        for y in mmap:
-            if y not in pkl_map: pkl_map[y] = {}
-            for x in mmap[y]:
-                pkl_map[y][x] = mmap[y][x]
-        save(pkl_path, pkl_map)
-    return mmap
+        logging.info("compiling %s", path)
+        write_prob_map(path, bin_path)
+    return ProbMap(bin_path)
 
 
 def get_conll_sentences(filename):
@@ -0,0 +1,111 @@
+"""
+Layout helpers shared by the compiled, memory-mapped files (utils.title_store, utils.title_lookup, utils.prob_map).
+
+Each of them is a struct header followed by sections: arrays padded to 8 bytes, and blobs of concatenated utf-8 strings
+with a uint64[n + 1] array of their offsets. Sorted key blobs can come with a uint32[65537] bucket array giving the
+first key index for each leading two bytes, which narrows the binary search.
+"""
+import bisect
+import mmap
+from array import array
+
+__author__ = 'Shyam'
+
+NUM_BUCKETS = 1 << 16
+
+
+def pad(n):
+    return (8 - n % 8) % 8
+
+
+def bucket(key):
+    return (key[0] << 8 | key[1]) if len(key) > 1 else (key[0] << 8 if key else 0)
+
+
+def build_buckets(keys):
+    """
+    Bucket array of sorted byte strings.
+    """
+    buckets = array("I", [0] * (NUM_BUCKETS + 1))
+    for key in keys:
+        buckets[bucket(key) + 1] += 1
+    for i in range(NUM_BUCKETS):
+        buckets[i + 1] += buckets[i]
+    return buckets
+
+
+def blob_offsets(strings):
+    """
+    uint64[n + 1] offsets of the byte strings in their concatenation.
+    """
+    offsets = array("Q", [0])
+    pos = 0
+    for s in strings:
+        pos += len(s)
+        offsets.append(pos)
+    return offsets
+
+
+def write_sections(out, sections):
+    """
+    Writes each section (bytes) followed by its padding.
+    """
+    for section in sections:
+        out.write(section)
+        out.write(b"\0" * pad(len(section)))
+
+
+def map_file(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Blob:
+    """
+    Sequence view of the strings of a blob as bytes, so bisect can search it directly.
+    """
+
+    def __init__(self, mm, start, offsets):
+        self.mm, self.start, self.offsets = mm, start, offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.mm[self.start + self.offsets[i]:self.start + self.offsets[i + 1]]
+
+
+class SectionReader:
+    """
+    Reads the sections of a mapped file in order, starting after the header.
+    """
+
+    def __init__(self, mm, header_size):
+        self.mm = mm
+        self.view = memoryview(mm)
+        self.pos = header_size
+
+    def array(self, nbytes, fmt):
+        """
+        Next section as a memoryview cast to fmt (eg. "Q" for uint64).
+        """
+        sec = self.view[self.pos:self.pos + nbytes].cast(fmt)
+        self.pos += nbytes + pad(nbytes)
+        return sec
+
+    def blob(self, nbytes, offsets):
+        blob = Blob(self.mm, self.pos, offsets)
+        self.pos += nbytes + pad(nbytes)
+        return blob
+
+
+def find_key(keys, buckets, key):
+    """
+    Index of key in the sorted Blob keys with their bucket array, -1 if missing.
+    """
+    b = bucket(key)
+    lo, hi = buckets[b], buckets[b + 1]
+    i = bisect.bisect_left(keys, key, lo, hi)
+    if i < hi and keys[i] == key:
+        return i
+    return -1
@@ -0,0 +1,48 @@
+# coding=utf-8
+"""
+Index of the pages of a wikiextractor dump, written by dp.count_popular_entities_v2 --index next to its surface links
+file and read back by dp.delta_update to find the pages that changed since. One line per page, in the order of their
+lines in the surface links file:
+
+    page id <tab> fingerprint <tab> shard <tab> offset <tab> length
+
+fingerprint is a hash of the title and content of the page, shard the path of its wikiextractor file relative to the
+dump (eg. AA/wiki_00, also the name of its page file and of its MID file without their suffix), offset and length the
+bytes of its lines in the surface links file.
+"""
+import hashlib
+
+__author__ = 'Shyam'
+
+INDEX_SUFFIX = ".index"
+
+
+def index_path(links_path):
+    return links_path + INDEX_SUFFIX
+
+
+def page_fingerprint(page_title, page_content):
+    """
+    64-bit hash of a page as yielded by processors.page_iterator.iter_pages, to tell whether it changed between dumps.
+    """
+    return hashlib.blake2b((page_title + "\n" + page_content).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def write_index_entries(out, entries):
+    for entry in entries:
+        out.write("%s\t%s\t%s\t%d\t%d\n" % entry)
+
+
+def read_index(path):
+    """
+    Returns the (page id, fingerprint, shard, offset, length) entries of an index, in file order.
+    """
+    entries = []
+    shards = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            page_id, fingerprint, shard, offset, length = line.rstrip("\n").split("\t")
+            # a few thousand distinct shards for millions of pages
+            shard = shards.setdefault(shard, shard)
+            entries.append((page_id, fingerprint, shard, int(offset), int(length)))
+    return entries
@@ -0,0 +1,111 @@
+# coding=utf-8
+"""
+Reading and writing the per-shard page files of dp.extract_link_from_pages (read by dp.create_mid).
+
+    json        one json array of pages, indent=4 (the original format, read back in one go)
+    jsonl       one page per line, written and read a page at a time
+    jsonl.gz    gzipped jsonl
+    jsonl.zst   zstd compressed jsonl, needs the zstandard package
+
+A page file's name ends with "." + its format, and its .brief companion (pages without linked_spans) is the same
+name plus ".brief".
+"""
+import gzip
+import io
+import json
+
+__author__ = 'Shyam'
+
+PAGE_FORMATS = ["json", "jsonl", "jsonl.gz", "jsonl.zst"]
+BRIEF_SUFFIX = ".brief"
+
+
+def page_format(path):
+    """
+    Format of a page file from its name, None if it is not one.
+    """
+    if path.endswith(BRIEF_SUFFIX):
+        path = path[:-len(BRIEF_SUFFIX)]
+    for fmt in sorted(PAGE_FORMATS, key=len, reverse=True):
+        if path.endswith("." + fmt):
+            return fmt
+    return None
+
+
+def strip_page_suffix(name):
+    """
+    wiki_00.jsonl.gz --> wiki_00
+    """
+    fmt = page_format(name)
+    return name if fmt is None else name[:-len(fmt) - 1]
+
+
+def open_page_file(path, mode):
+    """
+    Opens a page file for reading ("r") or writing ("w") as utf-8 text, compressed according to its name.
+    """
+    fmt = page_format(path)
+    if fmt == "jsonl.gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if fmt == "jsonl.zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("jsonl.zst page files need the zstandard package (pip install zstandard)")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class PageWriter:
+    """
+    Writes pages one at a time. The json format streams the array too, with the same bytes json.dump(pages,
+    ensure_ascii=False, indent=4) would write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fmt = page_format(path)
+        if self.fmt is None:
+            raise ValueError("%s does not end with one of %s" % (path, PAGE_FORMATS))
+        self.out = open_page_file(path, "w")
+        self.count = 0
+
+    def write(self, page):
+        if self.fmt == "json":
+            # nested one level deeper inside the array, json strings never contain a raw newline
+            buf = json.dumps(page, ensure_ascii=False, indent=4).replace("\n", "\n    ")
+            self.out.write(("[\n    " if self.count == 0 else ",\n    ") + buf)
+        else:
+            self.out.write(json.dumps(page, ensure_ascii=False))
+            self.out.write("\n")
+        self.count += 1
+
+    def close(self):
+        if self.fmt == "json":
+            self.out.write("[]" if self.count == 0 else "\n]")
+        self.out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_page_file(path):
+    """
+    Yields the pages of a page file, jsonl formats one line at a time.
+    """
+    with open_page_file(path, "r") as f:
+        if page_format(path) == "json":
+            for page in json.load(f):
+                yield page
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
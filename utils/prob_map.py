@@ -0,0 +1,189 @@
+"""
+Compiled, memory-mapped replacement for the pickled maps of load_prob_map.
+
+A *.p2t2prob (or t2p2prob, w2t2prob, t2w2prob) tsv of compute_probs2 is compiled into one binary file next to it (see
+prob_map_path), laid out as (native byte order)
+
+    header      magic, version, n keys, m candidates, v distinct candidate strings, key blob length, value blob length
+    buckets     uint32[65537]  first key index for each leading two bytes, narrows the binary search
+    key_offsets uint64[n + 1]  sorted keys (the y of p(x|y))
+    runs        uint64[n + 1]  candidates of the i-th key are runs[i] .. runs[i + 1], by decreasing probability
+    totals      float32[n]     count(y)
+    cand_value  uint32[m]      index of the candidate string
+    probs       float32[m]     p(x|y)
+    counts      float32[m]     count(x, y)
+    val_offsets uint64[v + 1]  sorted candidate strings
+    key blob, value blob
+
+Looking up the top k candidates of a surface is a binary search and k reads from the mapped file.
+
+Usage:
+    python -m utils.prob_map probmap/trwiki-20190501.p2t2prob probmap/trwiki-20190501.t2p2prob
+"""
+import argparse
+import logging
+import os
+import struct
+import time
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+
+from utils.mmap_blob import NUM_BUCKETS, SectionReader, blob_offsets, build_buckets, find_key, map_file, \
+    write_sections
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+__author__ = 'Shyam'
+
+MAGIC = b"PMAP"
+VERSION = 1
+_HEADER = struct.Struct("=4sIQQQQQ")
+
+
+def prob_map_path(tsv_path):
+    return tsv_path + ".map"
+
+
+def write_prob_map(tsv_path, out_path=None):
+    """
+    Compiles a y <tab> x <tab> prob <tab> count/total tsv. Candidates of a key keep their file order among equal
+    probabilities.
+    """
+    out_path = out_path or prob_map_path(tsv_path)
+    start = time.time()
+    y2cands = {}
+    y2total = {}
+    bad = 0
+    with open(tsv_path, "rb") as f:
+        for idx, line in enumerate(f):
+            parts = line.rstrip(b"\n").split(b"\t")
+            if len(parts) != 4:
+                logging.info("error on line %d: %s", idx, line)
+                bad += 1
+                continue
+            y, x, prob, count = parts
+            count, total = count.split(b"/")
+            if y not in y2cands:
+                y2cands[y] = []
+            y2cands[y].append((x, float(prob), int(count)))
+            y2total[y] = int(total)
+    keys = sorted(y2cands)
+    values = sorted(set(x for y in keys for x, _, _ in y2cands[y]))
+    value_index = {v: i for i, v in enumerate(values)}
+
+    runs, totals = array("Q", [0]), array("f")
+    cand_value, probs, counts = array("I"), array("f"), array("f")
+    for key in keys:
+        cands = sorted(y2cands[key], key=lambda cand: -cand[1])
+        for x, prob, count in cands:
+            cand_value.append(value_index[x])
+            probs.append(prob)
+            counts.append(count)
+        runs.append(len(cand_value))
+        totals.append(y2total[key])
+    key_blob, val_blob = b"".join(keys), b"".join(values)
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, len(keys), len(cand_value), len(values), len(key_blob),
+                               len(val_blob)))
+        write_sections(out, [build_buckets(keys).tobytes(), blob_offsets(keys).tobytes(), runs.tobytes(),
+                             totals.tobytes(), cand_value.tobytes(), probs.tobytes(), counts.tobytes(),
+                             blob_offsets(values).tobytes(), key_blob])
+        out.write(val_blob)
+    os.replace(tmp_path, out_path)
+    logging.info("wrote prob map %s with %d keys %d candidates (%d bad lines) in %.1f secs", out_path, len(keys),
+                 len(cand_value), bad, time.time() - start)
+    return out_path
+
+
+class ProbMap(Mapping):
+    """
+    Read-only, mmap-backed probability map. candidates(y, k) gives the top k (x, p(x|y), count(x, y)) of a key.
+
+    It is also a Mapping like the dicts load_prob_map returned: prob_map[y] is a dict of x --> p(x|y), built on
+    access. Iteration is in sorted key order. Pickling only sends the path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        self._mm = map_file(self.path)
+        magic, version, n, m, v, key_len, val_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError("%s is not a version %d prob map" % (self.path, VERSION))
+        reader = SectionReader(self._mm, _HEADER.size)
+        self.buckets = reader.array(4 * (NUM_BUCKETS + 1), "I")
+        key_offsets = reader.array(8 * (n + 1), "Q")
+        self.runs = reader.array(8 * (n + 1), "Q")
+        self.totals = reader.array(4 * n, "f")
+        self.cand_value = reader.array(4 * m, "I")
+        self.probs = reader.array(4 * m, "f")
+        self.counts = reader.array(4 * m, "f")
+        val_offsets = reader.array(8 * (v + 1), "Q")
+        self._keys = reader.blob(key_len, key_offsets)
+        self._values = reader.blob(val_len, val_offsets)
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def key_index(self, y):
+        """
+        Index of the key in sorted order, -1 if missing.
+        """
+        return find_key(self._keys, self.buckets, y.encode("utf-8"))
+
+    def candidates(self, y, k=None):
+        """
+        Top k (x, p(x|y), count(x, y)) by decreasing probability, all of them if k is None, [] for a missing key.
+        """
+        i = self.key_index(y)
+        if i < 0:
+            return []
+        lo, hi = self.runs[i], self.runs[i + 1]
+        if k is not None:
+            hi = min(hi, lo + k)
+        return [(self._values[self.cand_value[j]].decode("utf-8"), self.probs[j], int(self.counts[j]))
+                for j in range(lo, hi)]
+
+    def total(self, y):
+        i = self.key_index(y)
+        return 0 if i < 0 else int(self.totals[i])
+
+    def __getitem__(self, y):
+        if self.key_index(y) < 0:
+            raise KeyError(y)
+        x2prob = defaultdict(float)
+        for x, prob, _ in self.candidates(y):
+            x2prob[x] = prob
+        return x2prob
+
+    def __contains__(self, y):
+        return self.key_index(y) >= 0
+
+    def __iter__(self):
+        for i in range(len(self._keys)):
+            yield self._keys[i].decode("utf-8")
+
+    def __len__(self):
+        return len(self._keys)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile prob tsv files of compute_probs2 into memory-mapped maps.')
+    parser.add_argument('tsv', nargs='+', help='eg. probmap/trwiki-20190501.p2t2prob')
+    parser.add_argument('--force', action="store_true", help='rebuild maps that already exist')
+    args = parser.parse_args()
+    args = vars(args)
+    for tsv in args["tsv"]:
+        if os.path.exists(prob_map_path(tsv)) and not args["force"]:
+            logging.info("%s already exists.", prob_map_path(tsv))
+            continue
+        write_prob_map(tsv)
@@ -9,6 +9,7 @@ import string
 import difflib
 # import Levenshtein
 import unicodedata
+from functools import lru_cache
 
 
 def edit_distance(title, surface):
@@ -27,9 +28,13 @@ def edit_distance(title, surface):
     return dist
 
 
-def _getLnrm(word):
+_ASCII_ALNUM = set('abcdefghijklmnopqrstuvwxyz0123456789')
+
+
+def _getLnrm_nfd(word):
     """Normalizes the given arg by stripping it of diacritics, lowercasing, and
     removing all non-alphanumeric characters.
+    Reference implementation of _getLnrm, which gives the same output from a per character table.
     """
 
     org_word, org_len = word, len(word)
@@ -37,13 +42,39 @@ def _getLnrm(word):
         [c for c in unicodedata.normalize('NFD', word) if unicodedata.category(c) != 'Mn'])
     word = word.lower()
     word = ''.join(
-        [c for c in word if c in set('abcdefghijklmnopqrstuvwxyz0123456789')])
+        [c for c in word if c in _ASCII_ALNUM])
     new_len = len(word)
     # if org_len != new_len:
     #     logging.info("something looks wrong org:%s new:%s",org_word, word)
     return word
 
 
+class _FoldTable(dict):
+    """
+    codepoint --> folded string for str.translate, filled in on first use of a codepoint.
+    Folding works per character: the NFD reordering only moves combining marks, which are dropped anyway, and lower()
+    is context free except for the Greek final sigma, which is dropped too.
+    """
+
+    def __missing__(self, codepoint):
+        folded = _getLnrm_nfd(chr(codepoint))
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+for _c in range(128):
+    _FOLD_TABLE[_c]
+
+
+@lru_cache(maxsize=1 << 20)
+def _getLnrm(word):
+    """Normalizes the given arg by stripping it of diacritics, lowercasing, and
+    removing all non-alphanumeric characters.
+    """
+    return word.translate(_FOLD_TABLE)
+
+
 def load_stopwords(f):
     words = [l.strip() for l in open(f)]
     return set(words)
@@ -0,0 +1,152 @@
+"""
+Lookup backends for TitleNormalizer. A backend answers one question: what is the canonical title for this string,
+following a redirect if there is one (None if it is neither a title nor a redirect).
+
+DictLookup probes the redirect and title dicts, as TitleNormalizer always did.
+SortedArrayLookup answers from a compiled, memory-mapped file (see lookup_path) laid out as (native byte order)
+
+    header      magic, version, n keys, m values, key blob length, value blob length
+    buckets     uint32[65537]  first key index for each leading two bytes, narrows the binary search
+    key_offsets uint64[n + 1]  sorted keys: every title and every redirect
+    value_idx   uint32[n]      index of the canonical title of each key
+    val_offsets uint64[m + 1]  sorted canonical titles
+    key blob, value blob
+
+so every process that opens the same file shares one copy of the tables.
+
+Usage:
+    python -m utils.title_lookup --id2t trwiki-20190501.id2t --redirects trwiki-20190501.r2t
+"""
+import argparse
+import logging
+import os
+import struct
+import time
+from array import array
+
+from utils.mmap_blob import NUM_BUCKETS, SectionReader, blob_offsets, build_buckets, find_key, map_file, \
+    write_sections
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+__author__ = 'Shyam'
+
+MAGIC = b"TLKP"
+VERSION = 1
+_HEADER = struct.Struct("=4sIQQQQ")
+
+
+def lookup_path(redirects_path):
+    return redirects_path + ".lookup"
+
+
+class DictLookup:
+    """
+    The original backend: a redirect dict probe, then a title dict probe.
+    """
+
+    def __init__(self, redirect_map, t2id):
+        self.redirect_map = redirect_map
+        self.title2id = t2id
+
+    def resolve(self, title):
+        if title in self.redirect_map:
+            return self.redirect_map[title]
+        if title in self.title2id:
+            return title
+        return None
+
+
+def write_sorted_lookup(path, redirect_map, titles):
+    """
+    Compiles the redirect map and titles into a SortedArrayLookup file. A redirect wins over a title of the same
+    name, like in DictLookup.
+    """
+    start = time.time()
+    key2value = {}
+    for title in titles:
+        key2value[title.encode("utf-8")] = title.encode("utf-8")
+    for redirect in redirect_map:
+        key2value[redirect.encode("utf-8")] = redirect_map[redirect].encode("utf-8")
+    keys = sorted(key2value)
+    values = sorted(set(key2value.values()))
+    value_index = {v: i for i, v in enumerate(values)}
+
+    value_idx = array("I", [value_index[key2value[key]] for key in keys])
+    key_blob = b"".join(keys)
+    val_blob = b"".join(values)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, len(keys), len(values), len(key_blob), len(val_blob)))
+        write_sections(out, [build_buckets(keys).tobytes(), blob_offsets(keys).tobytes(), value_idx.tobytes(),
+                             blob_offsets(values).tobytes(), key_blob])
+        out.write(val_blob)
+    os.replace(tmp_path, path)
+    logging.info("wrote lookup %s with %d keys %d titles in %.1f secs", path, len(keys), len(values),
+                 time.time() - start)
+    return path
+
+
+class SortedArrayLookup:
+    """
+    Read-only, mmap-backed backend: binary search over sorted utf-8 keys, within a two-byte prefix bucket.
+    Pickling only sends the path, so worker processes map the same file instead of copying dicts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    @classmethod
+    def for_paths(cls, id2t_path, redirects_path):
+        """
+        Opens the lookup compiled for these maps, building it first if needed.
+        """
+        path = lookup_path(redirects_path)
+        if not os.path.exists(path):
+            from utils.misc_utils import load_id2title, load_redirects
+            _, t2id, _ = load_id2title(id2t_path)
+            write_sorted_lookup(path, load_redirects(redirects_path), t2id)
+        return cls(path)
+
+    def _open(self):
+        self._mm = map_file(self.path)
+        magic, version, n, m, key_len, val_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError("%s is not a version %d title lookup" % (self.path, VERSION))
+        reader = SectionReader(self._mm, _HEADER.size)
+        self.buckets = reader.array(4 * (NUM_BUCKETS + 1), "I")
+        key_offsets = reader.array(8 * (n + 1), "Q")
+        self.value_idx = reader.array(4 * n, "I")
+        val_offsets = reader.array(8 * (m + 1), "Q")
+        self._keys = reader.blob(key_len, key_offsets)
+        self._values = reader.blob(val_len, val_offsets)
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def resolve(self, title):
+        i = find_key(self._keys, self.buckets, title.encode("utf-8"))
+        if i < 0:
+            return None
+        return self._values[self.value_idx[i]].decode("utf-8")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile the title and redirect maps into a sorted lookup.')
+    parser.add_argument('--id2t', type=str, required=True, help='id --> title')
+    parser.add_argument('--redirects', type=str, required=True, help='redirect --> title')
+    args = parser.parse_args()
+    args = vars(args)
+    path = lookup_path(args["redirects"])
+    if os.path.exists(path):
+        os.remove(path)
+    SortedArrayLookup.for_paths(args["id2t"], args["redirects"])
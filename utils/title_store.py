@@ -0,0 +1,235 @@
+"""
+Compact, memory-mapped replacement for the pickled (id2t, t2id, redirect_set) triple of load_id2title.
+
+The store is one binary file next to the *.id2t tsv (see store_path), laid out as (native byte order)
+
+    header      magic, version, n distinct titles, m distinct ids, blob length, number of redirects
+    offsets     uint64[n + 1]  start of each title in the blob, titles sorted by their utf-8 bytes
+    title_ids   uint64[n]      page id of the i-th sorted title
+    sorted_ids  uint64[m]      all page ids, sorted
+    id_perm     uint32[m]      index of the sorted title for the i-th sorted id
+    redirects   bitset[n]      bit i is set if the i-th sorted title is a redirect page
+    blob        the sorted titles, concatenated
+
+Opening it is a single mmap, lookups are binary searches over the arrays, and the pages are shared between all
+processes that open the same file.
+
+Usage:
+    python -m utils.title_store --id2t trwiki-20190501.id2t
+"""
+import argparse
+import bisect
+import logging
+import os
+import struct
+import time
+from array import array
+from collections.abc import Mapping, Set
+
+from utils.mmap_blob import SectionReader, blob_offsets, map_file, write_sections
+
+logging.basicConfig(format='%(asctime)s: %(filename)s:%(lineno)d: %(message)s', level=logging.INFO)
+
+__author__ = 'Shyam'
+
+MAGIC = b"ID2T"
+VERSION = 1
+_HEADER = struct.Struct("=4sIQQQQ")
+
+
+def store_path(id2t_path):
+    return id2t_path + ".store"
+
+
+def write_title_store(id2t_path, out_path=None):
+    """
+    Builds the binary store from a tsv written by dp.create_id2title (page_id, title, is_redirect).
+    Later lines win on duplicate ids or titles, same as the dicts built by load_id2title.
+    """
+    out_path = out_path or store_path(id2t_path)
+    start = time.time()
+    title2row, id2title = {}, {}
+    for line in open(id2t_path, encoding="utf-8"):
+        parts = line.strip().split("\t")
+        if len(parts) != 3:
+            logging.info("bad line %s", line)
+            continue
+        page_id, page_title, is_redirect = parts
+        page_title = page_title.encode("utf-8")
+        was_redirect = title2row.get(page_title, (None, False))[1]
+        title2row[page_title] = (int(page_id), was_redirect or is_redirect == "1")
+        id2title[int(page_id)] = page_title
+    titles = sorted(title2row)
+    n, n_ids = len(titles), len(id2title)
+    title_index = {}
+    title_ids = array("Q")
+    bitset = bytearray((n + 7) // 8)
+    for i, title in enumerate(titles):
+        title_index[title] = i
+        page_id, is_redirect = title2row[title]
+        title_ids.append(page_id)
+        if is_redirect:
+            bitset[i >> 3] |= 1 << (i & 7)
+    sorted_ids = array("Q", sorted(id2title))
+    id_perm = array("I", [title_index[id2title[page_id]] for page_id in sorted_ids])
+    n_redirects = sum(bin(b).count("1") for b in bitset)
+    blob = b"".join(titles)
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, n, n_ids, len(blob), n_redirects))
+        write_sections(out, [blob_offsets(titles).tobytes(), title_ids.tobytes(), sorted_ids.tobytes(),
+                             id_perm.tobytes(), bytes(bitset)])
+        out.write(blob)
+    os.replace(tmp_path, out_path)
+    logging.info("wrote title store %s with %d titles in %.1f secs", out_path, n, time.time() - start)
+    return out_path
+
+
+class TitleStore:
+    """
+    Read-only, mmap-backed id <-> title store.
+
+    Besides the lookup methods, the id2t, t2id and redirect_set attributes are dict / set like views with the same
+    keys and values (page ids as str) as the structures returned by load_id2title. Iteration is in sorted title
+    (or sorted id) order rather than file order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        self._mm = map_file(self.path)
+        magic, version, n, n_ids, blob_len, self.n_redirects = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError("%s is not a version %d title store" % (self.path, VERSION))
+        self.n, self.n_ids = n, n_ids
+        reader = SectionReader(self._mm, _HEADER.size)
+        offsets = reader.array(8 * (n + 1), "Q")
+        self.title_ids = reader.array(8 * n, "Q")
+        self.sorted_ids = reader.array(8 * n_ids, "Q")
+        self.id_perm = reader.array(4 * n_ids, "I")
+        self.bitset = reader.array((n + 7) // 8, "B")
+        # sorted titles as bytes, bisect searches the blob directly
+        self._titles = reader.blob(blob_len, offsets)
+        self.id2t = _Id2TitleView(self)
+        self.t2id = _Title2IdView(self)
+        self.redirect_set = _RedirectView(self)
+
+    def __getstate__(self):
+        # only the path travels to other processes, they map the same file
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+    def __len__(self):
+        return self.n
+
+    def title_at(self, i):
+        return self._titles[i].decode("utf-8")
+
+    def title_index(self, title):
+        """
+        Index of the title in sorted order, -1 if missing.
+        """
+        key = title.encode("utf-8")
+        i = bisect.bisect_left(self._titles, key)
+        if i < self.n and self._titles[i] == key:
+            return i
+        return -1
+
+    def id_index(self, page_id):
+        """
+        Index of the title with this page id in sorted title order, -1 if missing.
+        """
+        try:
+            page_id = int(page_id)
+        except (TypeError, ValueError):
+            return -1
+        i = bisect.bisect_left(self.sorted_ids, page_id)
+        if i < self.n_ids and self.sorted_ids[i] == page_id:
+            return self.id_perm[i]
+        return -1
+
+    def get_title(self, page_id, default=None):
+        i = self.id_index(page_id)
+        return default if i < 0 else self.title_at(i)
+
+    def get_id(self, title, default=None):
+        i = self.title_index(title)
+        return default if i < 0 else str(self.title_ids[i])
+
+    def is_redirect(self, title):
+        i = self.title_index(title)
+        return i >= 0 and bool(self.bitset[i >> 3] & (1 << (i & 7)))
+
+
+class _Id2TitleView(Mapping):
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, page_id):
+        i = self.store.id_index(page_id)
+        if i < 0:
+            raise KeyError(page_id)
+        return self.store.title_at(i)
+
+    def __contains__(self, page_id):
+        return self.store.id_index(page_id) >= 0
+
+    def __iter__(self):
+        for page_id in self.store.sorted_ids:
+            yield str(page_id)
+
+    def __len__(self):
+        return self.store.n_ids
+
+
+class _Title2IdView(Mapping):
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, title):
+        i = self.store.title_index(title)
+        if i < 0:
+            raise KeyError(title)
+        return str(self.store.title_ids[i])
+
+    def __contains__(self, title):
+        return self.store.title_index(title) >= 0
+
+    def __iter__(self):
+        for i in range(len(self.store)):
+            yield self.store.title_at(i)
+
+    def __len__(self):
+        return len(self.store)
+
+
+class _RedirectView(Set):
+    def __init__(self, store):
+        self.store = store
+
+    def __contains__(self, title):
+        return self.store.is_redirect(title)
+
+    def __iter__(self):
+        bitset = self.store.bitset
+        for i in range(len(self.store)):
+            if bitset[i >> 3] & (1 << (i & 7)):
+                yield self.store.title_at(i)
+
+    def __len__(self):
+        return self.store.n_redirects
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile an id2t tsv into a memory-mapped title store.')
+    parser.add_argument('--id2t', type=str, required=True, help='id --> title tsv, eg. trwiki-20190501.id2t')
+    parser.add_argument('--out', type=str, help='store path, defaults to <id2t>.store')
+    args = parser.parse_args()
+    args = vars(args)
+    write_title_store(args["id2t"], args["out"])